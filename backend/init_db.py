@@ -4,7 +4,8 @@ Run this script once to populate the database with initial data
 """
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
-from utils.auth import get_password_hash
+from utils.auth import get_password_hash_async
+from utils.indexes import ensure_indexes
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -26,7 +27,7 @@ async def init_database():
         admin_user = {
             "username": "admin",
             "email": "admin@gelbe-umzuege.ch",
-            "passwordHash": get_password_hash("admin123"),
+            "passwordHash": await get_password_hash_async("admin123"),
             "name": "Administrator",
             "role": "admin",
             "active": True
@@ -239,6 +240,14 @@ async def init_database():
         else:
             print(f"ℹ️  Additional service already exists: {service['name']['de']}")
     
+    # 5. Create indexes
+    report = await ensure_indexes(db)
+    for collection_name, entry in report.items():
+        if entry["created"] or entry["rebuilt"]:
+            print(f"✅ Indexes created on {collection_name}: {', '.join(entry['created'] + entry['rebuilt'])}")
+        for name in entry["failed"]:
+            print(f"❌ Index could not be created: {collection_name}.{name}")
+    
     print("\n✨ Database initialization completed!")
     print("\n📝 Login credentials:")
     print("   Username: admin")
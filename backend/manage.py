@@ -0,0 +1,414 @@
+"""
+Maintenance commands for the database
+
+Usage:
+    python manage.py indexes [--drop-unknown] [--check]
+    python manage.py rollups [--verify-only]
+    python manage.py capacity [--verify-only]
+    python manage.py import {customers,offers} FILE [--format ndjson|csv] [--created-by USERNAME]
+    python manage.py customer-emails
+    python manage.py invoice-offers [--resume BATCH_ID] [--created-by USERNAME]
+    python manage.py reprice [--resume JOB_ID] [--chunk-size N]
+    python manage.py postal-codes FILE [FILE ...] [--output PATH]
+    python manage.py search-index [customers|offers ...]
+    python manage.py search-bench [QUERY ...] [--runs N] [--budget-ms MS]
+    python manage.py login-bench [--url URL] [--logins N] [--concurrency N] [--budget-ms MS]
+    python manage.py page-bench [--offers N] [--page N] [--limit N] [--runs N] [--budget-ms MS]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bson import ObjectId
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from pathlib import Path
+import requests
+
+from utils.bulk_import import IMPORT_TARGETS, guess_format, import_file
+from utils.capacity import rebuild_capacity, verify_capacity
+from utils.geodata import POSTAL_CODES_PATH, build_postal_code_table
+from utils.indexes import ensure_indexes, find_collection_scans
+from models.offer import INDEXES as OFFER_INDEXES
+from utils.invoicing import claim_invoice_batch, create_invoice_batch, run_invoice_batch
+from utils.pricing import tax_of
+from utils.repricing import REPRICE_CHUNK_SIZE, create_reprice_job, run_reprice_job
+from utils.rollups import rebuild_rollups, verify_rollups
+from utils.pagination import LIST_SORT, encode_cursor, fetch_page
+from utils.search import SEARCH_TARGETS, reindex, search
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+async def cmd_indexes(db, args) -> int:
+    report = await ensure_indexes(db, drop_unknown=args.drop_unknown)
+    print(json.dumps(report, indent=2))
+    exit_code = 1 if any(entry["failed"] for entry in report.values()) else 0
+
+    if args.check:
+        offenders = await find_collection_scans(db)
+        for offender in offenders:
+            print(f"❌ COLLSCAN: {offender['collection']} filter={offender['filter']} sort={offender['sort']}")
+        if offenders:
+            exit_code = 1
+        else:
+            print("✅ All route queries are served by an index")
+    return exit_code
+
+async def cmd_rollups(db, args) -> int:
+    differences = await verify_rollups(db)
+    for difference in differences:
+        print(f"❌ {difference['key']}: expected {difference['expected']}, found {difference['actual']}")
+    print(f"ℹ️  {len(differences)} rollup rows differ from a full recomputation")
+
+    if args.verify_only:
+        return 1 if differences else 0
+
+    await rebuild_rollups(db)
+    remaining = await verify_rollups(db)
+    if remaining:
+        print(f"❌ {len(remaining)} rows still differ after the rebuild (concurrent writes?)")
+        return 1
+    print("✅ Rollups rebuilt and verified")
+    return 0
+
+async def cmd_capacity(db, args) -> int:
+    differences = await verify_capacity(db)
+    for difference in differences:
+        print(f"❌ {difference['day']} {difference['slot']}: expected {difference['expected']}, found {difference['actual']}")
+    print(f"ℹ️  {len(differences)} calendar slots differ from the accepted offers")
+
+    if args.verify_only:
+        return 1 if differences else 0
+
+    days = await rebuild_capacity(db)
+    remaining = await verify_capacity(db)
+    if remaining:
+        print(f"❌ {len(remaining)} slots still differ after the rebuild (concurrent writes?)")
+        return 1
+    print(f"✅ Capacity calendar rebuilt for {days} booked days and verified")
+    return 0
+
+async def _user_id(db, username: str):
+    user = await db.users.find_one({"username": username}, {"_id": 1})
+    return str(user["_id"]) if user else None
+
+async def cmd_import(db, args) -> int:
+    created_by = None
+    if args.created_by:
+        created_by = await _user_id(db, args.created_by)
+        if created_by is None:
+            print(f"❌ Unknown user: {args.created_by}")
+            return 1
+
+    with open(args.file, "rb") as binary_file:
+        report = await import_file(db, args.kind, binary_file, args.format or guess_format(args.file), created_by=created_by)
+
+    for error in report["errors"]:
+        print(f"❌ line {error['line']}: {'; '.join(error['errors'])}")
+    if report["errorsTruncated"]:
+        print(f"ℹ️  Only the first {len(report['errors'])} of {report['failed']} errors are listed")
+    print(f"✅ {report['inserted']} of {report['received']} rows imported in {report['seconds']}s ({report['rowsPerSecond']} rows/s)")
+    return 1 if report["failed"] else 0
+
+async def cmd_customer_emails(db, args) -> int:
+    # Server-side, so the whole collection is fixed in one round trip
+    result = await db.customers.update_many(
+        {"$expr": {"$ne": [{"$ifNull": ["$emailLower", None]}, {"$toLower": {"$ifNull": ["$email", ""]}}]}},
+        [{"$set": {"emailLower": {"$toLower": "$email"}}}]
+    )
+    print(f"✅ Lower-case email stored on {result.modified_count} customers")
+    return 0
+
+async def cmd_invoice_offers(db, args) -> int:
+    if args.resume:
+        batch = await db.invoice_batches.find_one({"_id": ObjectId(args.resume)}) if ObjectId.is_valid(args.resume) else None
+        if batch is None:
+            print(f"❌ Unknown batch: {args.resume}")
+            return 1
+        batch_id = batch["_id"]
+    else:
+        created_by = None
+        if args.created_by:
+            created_by = await _user_id(db, args.created_by)
+            if created_by is None:
+                print(f"❌ Unknown user: {args.created_by}")
+                return 1
+        batch_id = await create_invoice_batch(db, created_by=created_by)
+        print(f"ℹ️  Started batch {batch_id}; resume it with --resume {batch_id} if interrupted")
+
+    batch = await claim_invoice_batch(db, batch_id)
+    if batch is None:
+        status = (await db.invoice_batches.find_one({"_id": batch_id}, {"status": 1}))["status"]
+        print(f"❌ Batch {batch_id} is {'already finished' if status == 'done' else 'running in another process'}")
+        return 1
+    batch = await run_invoice_batch(db, batch)
+    for error in batch["errors"]:
+        print(f"❌ offer {error.get('offerNumber') or error['offerId']}: {error['error']}")
+    if batch["status"] != "done":
+        print(f"❌ Batch {batch_id} failed: {batch['error']}")
+        return 1
+    print(f"✅ {batch['created']} invoices created, {batch['alreadyInvoiced']} offers were already invoiced, {batch['failed']} failed")
+    return 1 if batch["failed"] else 0
+
+async def cmd_reprice(db, args) -> int:
+    if args.resume:
+        job = await db.reprice_jobs.find_one({"_id": ObjectId(args.resume)}) if ObjectId.is_valid(args.resume) else None
+        if job is None:
+            print(f"❌ Unknown reprice job: {args.resume}")
+            return 1
+        job_id = job["_id"]
+    else:
+        tax_rate, tax_enabled = tax_of(await db.company_settings.find_one({"_id": "company_settings"}, {"tax": 1}))
+        job_id = await create_reprice_job(db, {"rate": tax_rate, "enabled": tax_enabled})
+        print(f"ℹ️  Started job {job_id} for {tax_rate}% ({'enabled' if tax_enabled else 'disabled'}); resume it with --resume {job_id} if interrupted")
+
+    started = time.perf_counter()
+    job = await run_reprice_job(db, job_id, chunk_size=args.chunk_size)
+    if job["status"] != "done":
+        print(f"❌ Job {job_id} is {job['status']}: {job.get('error') or 'a newer tax change took over'}")
+        return 1
+    print(f"✅ {job['offers']} offers and {job['invoices']} invoices repriced in {time.perf_counter() - started:.1f}s")
+    return 0
+
+async def cmd_postal_codes(db, args) -> int:
+    sources = [open(path, encoding="utf-8") for path in args.files]
+    try:
+        count = build_postal_code_table(sources, args.output)
+    finally:
+        for source in sources:
+            source.close()
+    if not count:
+        print("❌ No postal codes with coordinates found (expected GeoNames CH.txt/LI.txt or swisstopo AMTOVZ_CSV_WGS84.csv)")
+        return 1
+    print(f"✅ {count} postal codes written to {args.output}")
+    return 0
+
+async def cmd_search_index(db, args) -> int:
+    unknown = set(args.collections) - set(SEARCH_TARGETS)
+    if unknown:
+        print(f"❌ Not searchable: {', '.join(sorted(unknown))} (choose from {', '.join(sorted(SEARCH_TARGETS))})")
+        return 1
+    for name in args.collections or sorted(SEARCH_TARGETS):
+        changed = await reindex(db, SEARCH_TARGETS[name])
+        print(f"✅ {name}: search keys of {changed} documents updated")
+    return 0
+
+async def cmd_search_bench(db, args) -> int:
+    over_budget = 0
+    for query in args.queries or ["mu", "müller", "Zürich", "genève", "079 12", "10001"]:
+        for name in sorted(SEARCH_TARGETS):
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                results = await search(db, SEARCH_TARGETS[name], query, args.limit)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+            ok = p95 <= args.budget_ms
+            over_budget += not ok
+            print(f"{'✅' if ok else '❌'} {name} {query!r}: {len(results)} hits, p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+    return 1 if over_budget else 0
+
+def _percentiles(timings: List[float]) -> str:
+    timings = sorted(timings)
+    p50, p99 = timings[len(timings) // 2], timings[min(int(len(timings) * 0.99), len(timings) - 1)]
+    return f"p50 {p50:.1f} ms, p99 {p99:.1f} ms over {len(timings)} requests"
+
+def _probe(url: str, done: Callable[[], bool]) -> List[float]:
+    """Latencies of GET `url`, one request after the other, until `done()`"""
+    session = requests.Session()
+    timings = []
+    while not done():
+        started = time.perf_counter()
+        session.get(url, timeout=30).raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def _login_storm(url: str, username: str, password: str, logins: int, concurrency: int) -> Counter:
+    def log_in(_):
+        return requests.post(url, data={"username": username, "password": password}, timeout=120).status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return Counter(pool.map(log_in, range(logins)))
+
+async def cmd_login_bench(db, args) -> int:
+    """Latency of a cheap endpoint before and during a burst of logins against a running server"""
+    base = args.url.rstrip("/")
+    probe_url = f"{base}{args.probe}"
+
+    deadline = time.monotonic() + args.baseline_seconds
+    baseline = await asyncio.to_thread(_probe, probe_url, lambda: time.monotonic() > deadline)
+    print(f"ℹ️  GET {args.probe} idle: {_percentiles(baseline)}")
+
+    storm_done = threading.Event()
+
+    def storm() -> Counter:
+        try:
+            return _login_storm(f"{base}/api/auth/login", args.username, args.password, args.logins, args.concurrency)
+        finally:
+            storm_done.set()
+
+    started = time.perf_counter()
+    statuses, during = await asyncio.gather(asyncio.to_thread(storm), asyncio.to_thread(_probe, probe_url, storm_done.is_set))
+    seconds = time.perf_counter() - started
+
+    print(f"ℹ️  {args.logins} logins ({args.concurrency} concurrent) in {seconds:.1f}s, {args.logins / seconds:.1f}/s, responses {dict(statuses)}")
+    p99 = sorted(during)[min(int(len(during) * 0.99), len(during) - 1)] if during else 0.0
+    ok = bool(during) and p99 <= args.budget_ms
+    print(f"{'✅' if ok else '❌'} GET {args.probe} during the logins: {_percentiles(during) if during else 'no requests finished'}")
+    return 0 if ok and statuses.get(200) else 1
+
+async def _seed_offers(collection, count: int, chunk_size: int = 10000):
+    """Synthetic offers with the fields lists show; one in ten shares its createdAt with the one before"""
+    start = datetime.utcnow() - timedelta(days=3 * 365)
+    existing = await collection.estimated_document_count()
+    for first in range(existing, existing + count, chunk_size):
+        docs = []
+        for index in range(first, min(first + chunk_size, existing + count)):
+            docs.append({
+                "offerNumber": f"B{index:07d}",
+                "status": random.choice(["draft", "sent", "accepted", "rejected"]),
+                "category": random.choice(["umzug", "reinigung", "entsorgung"]),
+                "customer": {"firstName": "Bench", "lastName": f"Kunde {index}", "email": f"bench{index}@example.com"},
+                "pricing": {"total": round(random.uniform(300, 9000), 2), "currency": "CHF"},
+                "createdAt": start + timedelta(seconds=index - index % 10 // 9),
+                "updatedAt": start,
+            })
+        await collection.insert_many(docs, ordered=False)
+        print(f"ℹ️  {first + len(docs) - existing} of {count} offers seeded", end="\r", flush=True)
+    print()
+
+async def cmd_page_bench(db, args) -> int:
+    """Time one deep list page in offset and in cursor mode on a (seeded) offers collection"""
+    collection = db[args.collection]
+    missing = args.offers - await collection.estimated_document_count()
+    if missing > 0:
+        if args.collection == "offers":
+            print("❌ Refusing to seed synthetic offers into the live offers collection; pass --collection")
+            return 1
+        await _seed_offers(collection, missing)
+    # The list sort index of the offers collection, so both modes get the index they get in production
+    await collection.create_indexes([index for index in OFFER_INDEXES["offers"] if index.document["name"] == "createdAt"])
+
+    skip = (args.page - 1) * args.limit
+    # What the previous page handed out as next_cursor
+    before = await collection.find({}, {"createdAt": 1}).sort(LIST_SORT).skip(skip - 1).limit(1).to_list(1)
+    if skip == 0 or not before:
+        print(f"❌ Page {args.page} needs more than {skip} offers")
+        return 1
+    modes = {"offset": {"skip": skip}, "cursor": {"cursor": encode_cursor(before[0])}}
+
+    pages = {}
+    p95s = {}
+    for mode, paging in modes.items():
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            docs, _, _ = await fetch_page(collection, {}, args.limit, **paging)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        pages[mode] = [doc["_id"] for doc in docs]
+        p50, p95s[mode] = timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+        print(f"ℹ️  {mode}: page {args.page} of {args.limit}, p50 {p50:.1f} ms, p95 {p95s[mode]:.1f} ms")
+
+    if pages["offset"] != pages["cursor"]:
+        print("❌ Offset and cursor mode returned different rows")
+        return 1
+    ok = p95s["cursor"] <= args.budget_ms
+    print(f"{'✅' if ok else '❌'} cursor mode is {p95s['offset'] / max(p95s['cursor'], 0.001):.0f}x faster than offset mode at page {args.page}")
+    return 0 if ok else 1
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Database maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    indexes = commands.add_parser("indexes", help="Create or migrate the declared indexes")
+    indexes.add_argument("--drop-unknown", action="store_true", help="Drop indexes that are no longer declared")
+    indexes.add_argument("--check", action="store_true", help="Fail if a route query would use a COLLSCAN")
+    indexes.set_defaults(handler=cmd_indexes)
+
+    rollups = commands.add_parser("rollups", help="Recompute revenue rollups and verify them")
+    rollups.add_argument("--verify-only", action="store_true", help="Only report differences, do not rebuild")
+    rollups.set_defaults(handler=cmd_rollups)
+
+    capacity = commands.add_parser("capacity", help="Recompute the crew and truck calendar from accepted offers")
+    capacity.add_argument("--verify-only", action="store_true", help="Only report differences, do not rebuild")
+    capacity.set_defaults(handler=cmd_capacity)
+
+    bulk_import = commands.add_parser("import", help="Bulk import customers or offers from NDJSON or CSV")
+    bulk_import.add_argument("kind", choices=sorted(IMPORT_TARGETS))
+    bulk_import.add_argument("file", help="Path to the .ndjson or .csv file")
+    bulk_import.add_argument("--format", choices=["ndjson", "csv"], help="Defaults to the file extension")
+    bulk_import.add_argument("--created-by", help="Username recorded as creator of the imported rows")
+    bulk_import.set_defaults(handler=cmd_import)
+
+    customer_emails = commands.add_parser("customer-emails", help="Store the lower-case email invoicing matches customers by")
+    customer_emails.set_defaults(handler=cmd_customer_emails)
+
+    invoice_offers = commands.add_parser("invoice-offers", help="Create invoices for all accepted offers without one")
+    invoice_offers.add_argument("--resume", metavar="BATCH_ID", help="Continue an interrupted batch")
+    invoice_offers.add_argument("--created-by", help="Username recorded as creator of the invoices")
+    invoice_offers.set_defaults(handler=cmd_invoice_offers)
+
+    reprice = commands.add_parser("reprice", help="Apply the current tax settings to open offers and draft invoices")
+    reprice.add_argument("--resume", metavar="JOB_ID", help="Continue an interrupted job")
+    reprice.add_argument("--chunk-size", type=int, default=REPRICE_CHUNK_SIZE, help="Documents per _id range")
+    reprice.set_defaults(handler=cmd_reprice)
+
+    postal_codes = commands.add_parser("postal-codes", help="Build the postal code table used to estimate distances")
+    postal_codes.add_argument("files", nargs="+", help="GeoNames CH.txt/LI.txt or swisstopo AMTOVZ_CSV_WGS84.csv")
+    postal_codes.add_argument("--output", default=POSTAL_CODES_PATH)
+    postal_codes.set_defaults(handler=cmd_postal_codes)
+
+    search_index = commands.add_parser("search-index", help="Recompute the normalized search keys")
+    search_index.add_argument("collections", nargs="*", help="customers and/or offers; defaults to both")
+    search_index.set_defaults(handler=cmd_search_index)
+
+    search_bench = commands.add_parser("search-bench", help="Time typical search queries against the database")
+    search_bench.add_argument("queries", nargs="*", help="Defaults to a set of name, place, phone and number queries")
+    search_bench.add_argument("--runs", type=int, default=50)
+    search_bench.add_argument("--limit", type=int, default=10)
+    search_bench.add_argument("--budget-ms", type=float, default=20.0, help="Fail if a p95 latency is above this")
+    search_bench.set_defaults(handler=cmd_search_bench)
+
+    login_bench = commands.add_parser("login-bench", help="Latency of other requests while a login storm runs against a server")
+    login_bench.add_argument("--url", default="http://localhost:8001", help="Base URL of the running backend")
+    login_bench.add_argument("--username", default=os.getenv("DEFAULT_ADMIN_USERNAME", "admin"))
+    login_bench.add_argument("--password", default=os.getenv("DEFAULT_ADMIN_PASSWORD", "admin123"))
+    login_bench.add_argument("--logins", type=int, default=200)
+    login_bench.add_argument("--concurrency", type=int, default=20)
+    login_bench.add_argument("--probe", default="/api/", help="Path timed before and during the logins")
+    login_bench.add_argument("--baseline-seconds", type=float, default=5.0)
+    login_bench.add_argument("--budget-ms", type=float, default=50.0, help="Fail if the p99 during the logins is above this")
+    login_bench.set_defaults(handler=cmd_login_bench)
+
+    page_bench = commands.add_parser("page-bench", help="Time a deep offers page in offset and cursor mode")
+    page_bench.add_argument("--collection", default="offers_bench", help="Seeded with synthetic offers up to --offers")
+    page_bench.add_argument("--offers", type=int, default=1_000_000)
+    page_bench.add_argument("--page", type=int, default=1000)
+    page_bench.add_argument("--limit", type=int, default=50)
+    page_bench.add_argument("--runs", type=int, default=20)
+    page_bench.add_argument("--budget-ms", type=float, default=20.0, help="Fail if the cursor mode p95 is above this")
+    page_bench.set_defaults(handler=cmd_page_bench)
+
+    return parser
+
+async def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        return await args.handler(client[os.environ['DB_NAME']], args)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,9 +1,12 @@
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from typing import Dict, Optional
 from datetime import datetime
 
+from models.common import ObjectIdStr
+
 class AdditionalService(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     serviceId: str
     categoryId: str
     name: Dict[str, str]
@@ -54,4 +57,13 @@ class AdditionalServiceUpdate(BaseModel):
     priceType: Optional[str] = None
     hourlyRate: Optional[float] = None
     active: Optional[bool] = None
-    order: Optional[int] = None
\ No newline at end of file
+    order: Optional[int] = None
+
+INDEXES = {
+    "additional_services": [
+        IndexModel([("serviceId", ASCENDING)], name="serviceId_unique", unique=True),
+        IndexModel([("order", ASCENDING)], name="order"),
+        IndexModel([("active", ASCENDING), ("order", ASCENDING)], name="active_order"),
+        IndexModel([("categoryId", ASCENDING), ("active", ASCENDING), ("order", ASCENDING)], name="categoryId_active_order"),
+    ],
+}
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class SlotCapacity(BaseModel):
+    workers: int = 0
+    trucks: int = 0
+
+class DayAvailability(BaseModel):
+    """Free crews and trucks of one day, per slot"""
+    date: str
+    free: Dict[str, SlotCapacity]
+
+class Availability(BaseModel):
+    workers: int
+    trucks: int
+    slot: Optional[str] = None
+    days: List[DayAvailability]
+    tookMs: float
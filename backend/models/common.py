@@ -0,0 +1,20 @@
+from bson import ObjectId
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+from typing import Any, Annotated
+
+def _validate_object_id(value: Any):
+    # ObjectIds are kept as-is and only turned into strings when serialized
+    if isinstance(value, (ObjectId, str)):
+        return value
+    raise ValueError("must be an ObjectId or string")
+
+def _serialize_object_id(value: Any) -> str:
+    return str(value)
+
+# `_id` field type: accepts raw ObjectIds from the driver, serializes as string
+ObjectIdStr = Annotated[
+    Any,
+    BeforeValidator(_validate_object_id),
+    PlainSerializer(_serialize_object_id, return_type=str),
+    WithJsonSchema({"type": "string"}),
+]
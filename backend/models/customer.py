@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field, EmailStr
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
 from typing import Optional
 from datetime import datetime
 
+from models.common import ObjectIdStr
+
 class CustomerAddress(BaseModel):
     street: str
     zipCode: str
@@ -9,7 +12,7 @@ class CustomerAddress(BaseModel):
     country: str = Field(default="CH")
 
 class Customer(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     customerNumber: str
     salutation: str  # Herr, Frau
     firstName: str
@@ -43,4 +46,23 @@ class CustomerUpdate(BaseModel):
     phone: Optional[str] = None
     address: Optional[CustomerAddress] = None
     notes: Optional[str] = None
-    active: Optional[bool] = None
\ No newline at end of file
+    active: Optional[bool] = None
+
+INDEXES = {
+    "customers": [
+        IndexModel([("customerNumber", ASCENDING)], name="customerNumber_unique", unique=True),
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt"),
+        IndexModel([("active", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="active_createdAt"),
+        # Batch invoicing finds the customer of an offer by email, ignoring case
+        IndexModel([("emailLower", ASCENDING)], name="emailLower"),
+        # Normalized words for prefix search (see utils/search.py)
+        IndexModel([("searchKeys", ASCENDING)], name="searchKeys"),
+        # Mixed DE/FR/IT data: no stemming, but diacritic-insensitive whole words
+        IndexModel(
+            [("firstName", TEXT), ("lastName", TEXT), ("email", TEXT), ("address.street", TEXT), ("address.city", TEXT), ("notes", TEXT)],
+            name="search_text",
+            weights={"firstName": 10, "lastName": 10, "email": 5, "address.street": 3, "address.city": 3, "notes": 1},
+            default_language="none"
+        ),
+    ],
+}
@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
+from typing import List, Optional
+from datetime import datetime
+
+from models.common import ObjectIdStr
+
+class EmailJob(BaseModel):
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    kind: str  # offer
+    documentId: str
+    to: List[str]
+    subject: str
+    body: str
+    attachments: List[str] = []  # file paths; relative ones are below backend/uploads
+    status: str = Field(default="queued")  # queued, sending, sent, failed
+    attempts: int = 0
+    # Next time the job may be picked up; while sending, the end of the worker's lease
+    nextAttemptAt: datetime = Field(default_factory=datetime.utcnow)
+    provider: Optional[str] = None
+    lastError: Optional[str] = None
+    createdBy: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    finishedAt: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
+
+# Sent and failed jobs are kept for support questions ("did the customer get it?")
+EMAIL_JOB_RETENTION_SECONDS = 30 * 24 * 3600
+
+INDEXES = {
+    "email_jobs": [
+        IndexModel([("status", ASCENDING), ("nextAttemptAt", ASCENDING)], name="status_nextAttemptAt"),
+        IndexModel([("finishedAt", ASCENDING)], name="finishedAt_ttl", expireAfterSeconds=EMAIL_JOB_RETENTION_SECONDS),
+    ],
+}
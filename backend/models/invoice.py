@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from typing import List, Optional
 from datetime import datetime, date
 
+from models.common import ObjectIdStr
+
 class InvoiceItem(BaseModel):
     description: str
     quantity: float = 1.0
@@ -24,7 +27,7 @@ class QRBillData(BaseModel):
     reference: Optional[str] = None
 
 class Invoice(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     invoiceNumber: str
     offerId: Optional[str] = None
     customerId: str
@@ -43,10 +46,39 @@ class Invoice(BaseModel):
     createdBy: Optional[str] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # bumped by every update, for optimistic concurrency
 
     class Config:
         populate_by_name = True
 
+class InvoiceSummary(BaseModel):
+    """Slim row for invoice tables (`view=summary`)"""
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    invoiceNumber: str
+    offerId: Optional[str] = None
+    customerId: str
+    invoiceDate: date
+    dueDate: date
+    status: str = "draft"
+    total: float
+    currency: str = "CHF"
+    createdAt: datetime
+
+    class Config:
+        populate_by_name = True
+
+INVOICE_SUMMARY_PROJECTION = {
+    "invoiceNumber": 1,
+    "offerId": 1,
+    "customerId": 1,
+    "invoiceDate": 1,
+    "dueDate": 1,
+    "status": 1,
+    "total": 1,
+    "currency": 1,
+    "createdAt": 1,
+}
+
 class InvoiceCreate(BaseModel):
     offerId: Optional[str] = None
     customerId: str
@@ -61,4 +93,22 @@ class InvoiceUpdate(BaseModel):
     status: Optional[str] = None
     dueDate: Optional[date] = None
     items: Optional[List[InvoiceItem]] = None
-    notes: Optional[str] = None
\ No newline at end of file
+    notes: Optional[str] = None
+    version: Optional[int] = None  # version the edit is based on; omit to overwrite unconditionally
+
+INDEXES = {
+    "invoices": [
+        IndexModel([("invoiceNumber", ASCENDING)], name="invoiceNumber_unique", unique=True),
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt"),
+        IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="status_createdAt"),
+        IndexModel([("customerId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="customerId_createdAt"),
+        IndexModel([("customerId", ASCENDING), ("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="customerId_status_createdAt"),
+        # At most one invoice per offer, so re-running the batch invoicing cannot bill twice
+        IndexModel(
+            [("offerId", ASCENDING)],
+            name="offerId_unique",
+            unique=True,
+            partialFilterExpression={"offerId": {"$type": "string"}}
+        ),
+    ],
+}
@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import List, Optional
+from datetime import datetime
+
+from models.common import ObjectIdStr
+
+class InvoiceBatchError(BaseModel):
+    offerId: str
+    offerNumber: Optional[str] = None
+    error: str
+
+class InvoiceBatch(BaseModel):
+    """Progress of one run that invoices accepted offers; resumed from `lastOfferId`"""
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    status: str = Field(default="queued")  # queued, running, done, failed
+    runId: Optional[str] = None  # runner holding the batch while it is running
+    lastOfferId: Optional[str] = None
+    processed: int = 0
+    created: int = 0
+    alreadyInvoiced: int = 0
+    failed: int = 0
+    errors: List[InvoiceBatchError] = []
+    error: Optional[str] = None
+    createdBy: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    finishedAt: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
+
+INDEXES = {
+    "invoice_batches": [
+        IndexModel([("createdAt", DESCENDING)], name="createdAt"),
+        IndexModel([("status", ASCENDING), ("createdAt", DESCENDING)], name="status_createdAt"),
+    ],
+}
@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field, EmailStr
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from models.common import ObjectIdStr
+
 class Customer(BaseModel):
     salutation: str
     firstName: str
@@ -44,9 +47,10 @@ class Pricing(BaseModel):
     total: float = 0.0
     currency: str = "CHF"
     includeTax: bool = False
+    hours: Optional[float] = None  # estimated hours, priced for `hourly` categories
 
 class Offer(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     offerNumber: str
     customerId: Optional[str] = None
     status: str = Field(default="draft")  # draft, sent, accepted, rejected
@@ -63,6 +67,8 @@ class Offer(BaseModel):
     emailSent: bool = False
     emailSentAt: Optional[datetime] = None
     contactPerson: Optional[str] = None
+    invoiceId: Optional[str] = None
+    invoicedAt: Optional[datetime] = None
     createdBy: Optional[str] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
@@ -71,7 +77,8 @@ class Offer(BaseModel):
         populate_by_name = True
 
 class OfferCreate(BaseModel):
-    offerNumber: str
+    offerNumber: Optional[str] = None  # assigned on create; only imports keep their own numbers
+    customerId: Optional[str] = None  # linked by email when the offer is invoiced, if not given
     category: str
     language: str = "de"
     customer: Customer
@@ -83,8 +90,56 @@ class OfferCreate(BaseModel):
     notes: Optional[str] = None
     contactPerson: Optional[str] = None
 
+class LocationSummary(BaseModel):
+    street: str
+    zipCode: Optional[str] = None
+    city: str
+
+class ServiceDetailsSummary(BaseModel):
+    movingDate: Optional[str] = None
+    startTime: Optional[str] = None
+
+class PricingSummary(BaseModel):
+    total: float = 0.0
+    currency: str = "CHF"
+
+class OfferSummary(BaseModel):
+    """Slim row for the admin offers table (`view=summary`)"""
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    offerNumber: str
+    status: str = "draft"
+    category: str
+    customer: Customer
+    currentLocation: LocationSummary
+    newLocation: LocationSummary
+    serviceDetails: Optional[ServiceDetailsSummary] = None
+    pricing: Optional[PricingSummary] = None
+    createdAt: datetime
+
+    class Config:
+        populate_by_name = True
+
+OFFER_SUMMARY_PROJECTION = {
+    "offerNumber": 1,
+    "status": 1,
+    "category": 1,
+    "customer": 1,
+    "currentLocation.street": 1,
+    "currentLocation.zipCode": 1,
+    "currentLocation.city": 1,
+    "newLocation.street": 1,
+    "newLocation.zipCode": 1,
+    "newLocation.city": 1,
+    "serviceDetails.movingDate": 1,
+    "serviceDetails.startTime": 1,
+    "pricing.total": 1,
+    "pricing.currency": 1,
+    "createdAt": 1,
+}
+
 class OfferUpdate(BaseModel):
     status: Optional[str] = None
+    customerId: Optional[str] = None
     customer: Optional[Customer] = None
     currentLocation: Optional[Location] = None
     newLocation: Optional[Location] = None
@@ -92,4 +147,46 @@ class OfferUpdate(BaseModel):
     additionalServices: Optional[List[SelectedService]] = None
     pricing: Optional[Pricing] = None
     notes: Optional[str] = None
-    contactPerson: Optional[str] = None
\ No newline at end of file
+    contactPerson: Optional[str] = None
+
+class PricingRequest(BaseModel):
+    """What-if inputs for one offer of a batch; unset fields keep the offer's values"""
+    offerId: str
+    hours: Optional[float] = Field(default=None, ge=0)
+    basePrice: Optional[float] = None
+    discount: Optional[float] = Field(default=None, ge=0)
+    discountType: Optional[str] = Field(default=None, pattern="^(percentage|fixed)$")
+
+class BatchPricingRequest(BaseModel):
+    items: List[PricingRequest] = Field(max_length=10000)
+    persist: bool = True
+
+INDEXES = {
+    "offers": [
+        IndexModel([("offerNumber", ASCENDING)], name="offerNumber_unique", unique=True),
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt"),
+        IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="status_createdAt"),
+        IndexModel([("category", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="category_createdAt"),
+        IndexModel([("status", ASCENDING), ("category", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="status_category_createdAt"),
+        IndexModel([("customerId", ASCENDING)], name="customerId"),
+        IndexModel([("status", ASCENDING), ("invoiceId", ASCENDING), ("_id", ASCENDING)], name="status_invoiceId"),
+        # Normalized words for prefix search (see utils/search.py)
+        IndexModel([("searchKeys", ASCENDING)], name="searchKeys"),
+        IndexModel(
+            [
+                ("customer.firstName", TEXT), ("customer.lastName", TEXT), ("customer.email", TEXT),
+                ("currentLocation.street", TEXT), ("currentLocation.city", TEXT),
+                ("newLocation.street", TEXT), ("newLocation.city", TEXT),
+                ("notes", TEXT),
+            ],
+            name="search_text",
+            weights={
+                "customer.firstName": 10, "customer.lastName": 10, "customer.email": 5,
+                "currentLocation.street": 3, "currentLocation.city": 3,
+                "newLocation.street": 3, "newLocation.city": 3,
+                "notes": 1,
+            },
+            default_language="none"
+        ),
+    ],
+}
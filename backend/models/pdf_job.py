@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
+from typing import Optional
+from datetime import datetime
+
+from models.common import ObjectIdStr
+
+class PdfJob(BaseModel):
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    kind: str  # offer, invoice
+    documentId: str
+    fingerprint: str
+    status: str = Field(default="queued")  # queued, running, done, failed
+    pdfUrl: Optional[str] = None
+    error: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    finishedAt: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
+
+# Finished jobs are only kept around long enough to be polled
+PDF_JOB_RETENTION_SECONDS = 24 * 3600
+
+INDEXES = {
+    "pdf_jobs": [
+        IndexModel([("fingerprint", ASCENDING), ("status", ASCENDING)], name="fingerprint_status"),
+        IndexModel([("finishedAt", ASCENDING)], name="finishedAt_ttl", expireAfterSeconds=PDF_JOB_RETENTION_SECONDS),
+    ],
+}
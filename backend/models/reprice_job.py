@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import Optional
+from datetime import datetime
+
+from models.common import ObjectIdStr
+
+class RepriceJob(BaseModel):
+    """Progress of one run applying a tax rate to open offers and draft invoices; resumed from `phase`/`lastId`"""
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
+    status: str = Field(default="queued")  # queued, running, done, failed, superseded
+    taxRate: float
+    taxEnabled: bool
+    phase: str = Field(default="offers")  # offers, invoices
+    lastId: Optional[str] = None
+    offers: int = 0
+    invoices: int = 0
+    error: Optional[str] = None
+    createdBy: Optional[str] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    finishedAt: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
+
+INDEXES = {
+    "reprice_jobs": [
+        IndexModel([("createdAt", DESCENDING)], name="createdAt"),
+        IndexModel([("status", ASCENDING), ("createdAt", DESCENDING)], name="status_createdAt"),
+    ],
+}
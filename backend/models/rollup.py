@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from pymongo import ASCENDING, IndexModel
+from typing import Optional
+
+class RollupRow(BaseModel):
+    period: Optional[str] = None
+    category: Optional[str] = None
+    status: Optional[str] = None
+    count: int = 0
+    amount: float = 0.0
+
+INDEXES = {
+    "revenue_rollups": [
+        IndexModel([("_id.kind", ASCENDING), ("_id.day", ASCENDING)], name="kind_day"),
+    ],
+}
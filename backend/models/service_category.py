@@ -1,9 +1,12 @@
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from models.common import ObjectIdStr
+
 class ServiceCategory(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     categoryId: str
     name: Dict[str, str]
     description: Dict[str, str]
@@ -57,4 +60,11 @@ class ServiceCategoryUpdate(BaseModel):
     pricingModel: Optional[str] = None
     basePrice: Optional[float] = None
     hourlyRate: Optional[float] = None
-    formFields: Optional[List[str]] = None
\ No newline at end of file
+    formFields: Optional[List[str]] = None
+
+INDEXES = {
+    "service_categories": [
+        IndexModel([("categoryId", ASCENDING)], name="categoryId_unique", unique=True),
+        IndexModel([("active", ASCENDING)], name="active"),
+    ],
+}
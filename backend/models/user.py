@@ -1,9 +1,12 @@
 from pydantic import BaseModel, Field, EmailStr
+from pymongo import ASCENDING, IndexModel
 from typing import Optional
 from datetime import datetime
 
+from models.common import ObjectIdStr
+
 class User(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")
     username: str
     email: EmailStr
     passwordHash: str
@@ -21,7 +24,14 @@ class UserCreate(BaseModel):
     email: EmailStr
     password: str
     name: str
-    role: str = "staff"
+    role: str = Field(default="staff", pattern="^(admin|staff)$")
+
+class UserUpdate(BaseModel):
+    email: Optional[EmailStr] = None
+    password: Optional[str] = None
+    name: Optional[str] = None
+    role: Optional[str] = Field(default=None, pattern="^(admin|staff)$")
+    active: Optional[bool] = None
 
 class UserLogin(BaseModel):
     username: str
@@ -33,4 +43,14 @@ class UserResponse(BaseModel):
     email: str
     name: str
     role: str
-    active: bool
\ No newline at end of file
+    active: bool
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "token_revocations": [
+        # Per-token revocations disappear once the token would have expired anyway
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+}
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
 from datetime import datetime
+from typing import Optional
 import os
+import time
 
 from models.user import User, UserLogin, UserResponse
-from utils.auth import verify_password, create_access_token, decode_access_token
+from utils.auth import verify_password_async, create_access_token, decode_access_token, PasswordHasherBusy
+from utils.cache import TTLCache
+from utils.revocation import RevocationList
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -13,12 +18,73 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 # Get database
 from ..server import db
 
+# Authenticated users are cached per worker so protected endpoints skip the users lookup
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+# Stateless mode trusts the signed role/uid/active claims and never reads the users collection
+STATELESS_AUTH = os.getenv("STATELESS_AUTH", "false").lower() in ("1", "true", "yes")
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "30"))
+revocations = RevocationList(db.token_revocations, refresh_interval=REVOCATION_REFRESH_SECONDS)
+
+def invalidate_cached_user(username: Optional[str] = None):
+    """Drop a user from the auth cache (all users if no username is given).
+
+    Call this whenever a user is disabled, deleted or their role changes.
+    """
+    if username is None:
+        user_cache.clear()
+    else:
+        user_cache.pop(username)
+
+async def revoke_user_tokens(username: str):
+    """Invalidate all outstanding tokens of a user (disable, role change, password reset)"""
+    invalidate_cached_user(username)
+    await revocations.revoke_user(username)
+
+def user_from_claims(payload: dict) -> dict:
+    """Build the current user from signed token claims, without any I/O"""
+    return {
+        "_id": ObjectId(payload["uid"]),
+        "username": payload["sub"],
+        "role": payload["role"],
+        "active": payload.get("active", True),
+    }
+
+async def load_user(username: str, issued_at: Optional[float] = None):
+    """Return the user document, served from the cache when possible.
+
+    A cached entry loaded before the token was issued is ignored, so a fresh
+    login always sees the current role and active flag.
+    """
+    cached = user_cache.get(username)
+    if cached is not None:
+        loaded_at, user = cached
+        if issued_at is None or loaded_at >= issued_at:
+            return user
+
+    loaded_at = time.time()
+    user = await db.users.find_one({"username": username})
+    if user is not None:
+        user_cache.set(username, (loaded_at, user))
+    return user
+
 @router.post("/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Login endpoint"""
     user = await db.users.find_one({"username": form_data.username})
     
-    if not user or not verify_password(form_data.password, user["passwordHash"]):
+    try:
+        password_ok = bool(user) and await verify_password_async(form_data.password, user["passwordHash"])
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+    
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -36,8 +102,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         {"_id": user["_id"]},
         {"$set": {"lastLogin": datetime.utcnow()}}
     )
+    invalidate_cached_user(user["username"])
     
-    access_token = create_access_token(data={"sub": user["username"], "role": user["role"]})
+    access_token = create_access_token(data={
+        "sub": user["username"],
+        "role": user["role"],
+        "uid": str(user["_id"]),
+        "active": user.get("active", True),
+    })
     
     return {
         "access_token": access_token,
@@ -67,15 +139,36 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if username is None:
         raise credentials_exception
     
-    user = await db.users.find_one({"username": username})
+    # Both modes: logouts and revocations of other workers (and before a restart) live only in Mongo
+    await revocations.refresh_if_stale()
+    if revocations.is_revoked(payload):
+        raise credentials_exception
+    
+    # Tokens issued before stateless mode was enabled carry no uid claim
+    if STATELESS_AUTH and "uid" in payload and "role" in payload:
+        user = user_from_claims(payload)
+    else:
+        user = await load_user(username, payload.get("iat"))
     if user is None:
         raise credentials_exception
     
+    if not user.get("active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is disabled"
+        )
+    
     return user
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
     """Get current user info"""
+    if "email" not in current_user:
+        # Stateless auth only knows the token claims
+        current_user = await load_user(current_user["username"])
+        if current_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+    
     return UserResponse(
         id=str(current_user["_id"]),
         username=current_user["username"],
@@ -86,6 +179,21 @@ async def get_me(current_user: dict = Depends(get_current_user)):
     )
 
 @router.post("/logout")
-async def logout(current_user: dict = Depends(get_current_user)):
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user)
+):
     """Logout endpoint"""
+    payload = decode_access_token(token)
+    if payload and payload.get("jti"):
+        await revocations.revoke_token(payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+    
     return {"message": "Successfully logged out"}
+
+@router.get("/cache-stats")
+async def get_user_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Get auth user cache hit/miss counters (admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return user_cache.stats()
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Query
+from datetime import date, datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+import time
+
+from models.capacity import Availability
+from utils.capacity import available_days
+from utils.rollups import ROLLUP_TIMEZONE
+from .auth import get_current_user
+
+router = APIRouter(prefix="/capacity", tags=["Capacity"])
+
+from ..server import db
+
+@router.get("/availability", response_model=Availability)
+async def get_availability(
+    workers: int = Query(default=2, ge=0),
+    trucks: int = Query(default=1, ge=0),
+    start: Optional[date] = None,
+    days: int = Query(default=90, ge=1, le=366),
+    slot: Optional[str] = Query(default=None, pattern="^(am|pm)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Days (from today unless `start` is given) that still have the crews and trucks for a job"""
+    started = time.perf_counter()
+    start = start or datetime.now(ZoneInfo(ROLLUP_TIMEZONE)).date()
+    open_days = await available_days(db, workers, trucks, start, days, slot)
+    
+    return {
+        "workers": workers,
+        "trucks": trucks,
+        "slot": slot,
+        "days": open_days,
+        "tookMs": round((time.perf_counter() - started) * 1000, 1),
+    }
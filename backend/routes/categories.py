@@ -1,25 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
+import os
 
 from models.service_category import ServiceCategory, ServiceCategoryCreate, ServiceCategoryUpdate
+from utils.catalog import CatalogSnapshot
+from utils.responses import trusted_response
+from utils.versioned_cache import etag_matches
 from .auth import get_current_user
 
 router = APIRouter(prefix="/categories", tags=["Service Categories"])
 
 from ..server import db
 
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "5"))
+catalog = CatalogSnapshot(db, poll_interval=CATALOG_POLL_SECONDS)
+
+def catalog_response(request: Request, etag: str, body: bytes) -> Response:
+    """Serve a pre-serialized catalog entry, honouring If-None-Match"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @router.get("", response_model=List[ServiceCategory])
-async def list_categories(active_only: bool = True):
+async def list_categories(
+    request: Request,
+    active_only: bool = True,
+    language: Optional[str] = Query(default=None, pattern="^[a-z]{2}$")
+):
     """List all service categories"""
-    query = {"active": True} if active_only else {}
-    categories = await db.service_categories.find(query).to_list(100)
-    
-    for cat in categories:
-        cat["_id"] = str(cat["_id"])
-    
-    return categories
+    etag, body = await catalog.categories(active_only=active_only, language=language)
+    return catalog_response(request, etag, body)
 
 @router.get("/{category_id}")
 async def get_category(category_id: str):
@@ -33,8 +45,7 @@ async def get_category(category_id: str):
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    category["_id"] = str(category["_id"])
-    return category
+    return trusted_response(category)
 
 @router.post("", response_model=ServiceCategory)
 async def create_category(
@@ -55,7 +66,8 @@ async def create_category(
     category_dict["updatedAt"] = datetime.utcnow()
     
     result = await db.service_categories.insert_one(category_dict)
-    category_dict["_id"] = str(result.inserted_id)
+    category_dict["_id"] = result.inserted_id
+    await catalog.bump()
     
     return ServiceCategory(**category_dict)
 
@@ -86,6 +98,7 @@ async def update_category(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await catalog.bump()
     return {"message": "Category updated successfully"}
 
 @router.delete("/{category_id}")
@@ -105,4 +118,5 @@ async def delete_category(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await catalog.bump()
     return {"message": "Category deleted successfully"}
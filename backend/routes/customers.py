@@ -1,53 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from typing import List, Optional, Union
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
 
 from models.customer import Customer, CustomerCreate, CustomerUpdate
+from models.pagination import CursorPage
+from utils.bulk_import import guess_format, import_file
+from utils.counters import number_allocator
+from utils.export import export_response
+from utils.pagination import fetch_page
+from utils.responses import trusted_response
+from utils.search import SEARCH_KEYS_EXCLUDED, SEARCH_TARGETS, refresh_search_keys
 from .auth import get_current_user
+from .stats import invalidate_stats
 
 router = APIRouter(prefix="/customers", tags=["Customers"])
 
 from ..server import db
 
+# Lookup keys are index structures, not part of the API documents
+CUSTOMER_INTERNAL_EXCLUDED = {**SEARCH_KEYS_EXCLUDED, "emailLower": 0}
+
+customer_numbers = number_allocator(db, "customerNumber")
+
 @router.get("/next-number")
 async def get_next_customer_number(current_user: dict = Depends(get_current_user)):
     """Get next available customer number"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Find the highest customer number
-    last_customer = await db.customers.find_one(sort=[("customerNumber", -1)])
-    
-    if last_customer:
-        try:
-            last_number = int(last_customer["customerNumber"])
-            next_number = str(last_number + 1).zfill(5)
-        except:
-            next_number = "10001"
-    else:
-        next_number = "10001"
+    next_number = await customer_numbers.peek()
     
     return {"nextCustomerNumber": next_number}
 
-@router.get("", response_model=List[Customer])
+@router.get("", response_model=Union[List[Customer], CursorPage[Customer]])
 async def list_customers(
     active_only: bool = True,
-    limit: int = Query(default=50, le=100),
+    limit: int = Query(default=50, ge=1, le=100),
     skip: int = 0,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """List customers (admin only)"""
+    """List customers (admin only, pass `cursor` for keyset pagination)"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     query = {"active": True} if active_only else {}
-    customers = await db.customers.find(query).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        customers, next_cursor, has_more = await fetch_page(db.customers, query, limit, skip=skip, cursor=cursor, projection=CUSTOMER_INTERNAL_EXCLUDED)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    for customer in customers:
-        customer["_id"] = str(customer["_id"])
+    payload = customers if cursor is None else {"items": customers, "next_cursor": next_cursor, "hasMore": has_more}
+    # Rows come straight from Mongo, so skip response_model re-validation
+    return trusted_response(payload)
+
+@router.get("/export")
+async def export_customers(
+    active_only: bool = True,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream all customers as NDJSON or CSV (admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    return customers
+    query = {"active": True} if active_only else {}
+    
+    return export_response(db.customers, query, format, Customer, "customers", projection=CUSTOMER_INTERNAL_EXCLUDED)
 
 @router.get("/{customer_id}")
 async def get_customer(customer_id: str, current_user: dict = Depends(get_current_user)):
@@ -56,15 +77,14 @@ async def get_customer(customer_id: str, current_user: dict = Depends(get_curren
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+        customer = await db.customers.find_one({"_id": ObjectId(customer_id)}, CUSTOMER_INTERNAL_EXCLUDED)
     except:
-        customer = await db.customers.find_one({"customerNumber": customer_id})
+        customer = await db.customers.find_one({"customerNumber": customer_id}, CUSTOMER_INTERNAL_EXCLUDED)
     
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    customer["_id"] = str(customer["_id"])
-    return customer
+    return trusted_response(customer)
 
 @router.post("", response_model=Customer)
 async def create_customer(
@@ -75,9 +95,8 @@ async def create_customer(
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Get next customer number
-    next_number_response = await get_next_customer_number(current_user)
-    customer_number = next_number_response["nextCustomerNumber"]
+    # Allocate customer number
+    customer_number = await customer_numbers.next()
     
     customer_dict = customer.dict()
     customer_dict["customerNumber"] = customer_number
@@ -85,12 +104,31 @@ async def create_customer(
     customer_dict["createdAt"] = datetime.utcnow()
     customer_dict["updatedAt"] = datetime.utcnow()
     customer_dict["active"] = True
+    customer_dict["emailLower"] = customer.email.lower()
+    customer_dict["searchKeys"] = SEARCH_TARGETS["customers"].keys(customer_dict)
     
     result = await db.customers.insert_one(customer_dict)
-    customer_dict["_id"] = str(result.inserted_id)
+    customer_dict["_id"] = result.inserted_id
+    invalidate_stats()
     
     return Customer(**customer_dict)
 
+@router.post("/import")
+async def import_customers(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Bulk import customers from NDJSON or CSV (admin only); returns per-row errors"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    report = await import_file(db, "customers", file.file, format or guess_format(file.filename), created_by=str(current_user["_id"]))
+    if report["inserted"]:
+        invalidate_stats()
+    
+    return report
+
 @router.put("/{customer_id}")
 async def update_customer(
     customer_id: str,
@@ -102,19 +140,27 @@ async def update_customer(
         raise HTTPException(status_code=403, detail="Admin access required")
     
     update_data = {k: v for k, v in customer.dict(exclude_unset=True).items()}
+    if "email" in update_data:
+        update_data["emailLower"] = update_data["email"].lower() if update_data["email"] else None
     update_data["updatedAt"] = datetime.utcnow()
     
+    search_target = SEARCH_TARGETS["customers"]
     try:
-        result = await db.customers.update_one(
+        updated = await db.customers.find_one_and_update(
             {"_id": ObjectId(customer_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection=search_target.projection,
+            return_document=ReturnDocument.AFTER
         )
     except:
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
-    if result.modified_count == 0:
+    if updated is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    if search_target.touches(update_data):
+        await refresh_search_keys(db, search_target, updated)
+    invalidate_stats()
     return {"message": "Customer updated successfully"}
 
 @router.delete("/{customer_id}")
@@ -134,4 +180,5 @@ async def delete_customer(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    invalidate_stats()
     return {"message": "Customer deleted successfully"}
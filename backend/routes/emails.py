@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+
+from models.email_job import EmailJob
+from utils.mailer import MailQueue
+from utils.responses import trusted_response
+from .auth import get_current_user
+from .settings import settings_cache
+
+router = APIRouter(prefix="/email-jobs", tags=["Email"])
+
+from ..server import db
+
+# Routers register what happens after a message of their kind was sent (see `on_sent`)
+mail_queue = MailQueue(db, settings_cache.get)
+
+@router.get("/{job_id}", response_model=EmailJob)
+async def get_email_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll the delivery status of a queued email"""
+    try:
+        job = await db.email_jobs.find_one({"_id": ObjectId(job_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return trusted_response(job)
@@ -1,53 +1,161 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional, Union
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
+import asyncio
 
-from models.invoice import Invoice, InvoiceCreate, InvoiceUpdate, InvoiceItem
+from models.invoice import Invoice, InvoiceCreate, InvoiceSummary, INVOICE_SUMMARY_PROJECTION, InvoiceUpdate, InvoiceItem
+from models.invoice_batch import InvoiceBatch
+from models.pagination import CursorPage
+from utils.counters import number_allocator
+from utils.export import export_response
+from utils.invoicing import as_midnight, claim_invoice_batch, create_invoice_batch, invoice_after_update, invoice_update_pipeline, run_invoice_batch
+from utils.pagination import fetch_page
+from utils.projection import parse_fields, summarize
+from utils.qrbill import QRBillError, build_payload, invoice_bill, payload_hash, render_png, render_svg
+from utils.responses import trusted_response
+from utils.rollups import INVOICE_ROLLUP_FIELDS, apply_rollup_change, invoice_contribution
+from utils.versioned_cache import etag_matches
 from .auth import get_current_user
+from .pdf import request_pdf
+from .settings import settings_cache
+from .stats import invalidate_stats
 
 router = APIRouter(prefix="/invoices", tags=["Invoices"])
 
 from ..server import db
 
+invoice_numbers = number_allocator(db, "invoiceNumber")
+
+_batch_tasks = set()
+
+async def record_invoice_change(before: Optional[dict], after: Optional[dict]):
+    """Keep revenue rollups and cached statistics in step with an invoice write"""
+    await apply_rollup_change(db, invoice_contribution, before, after)
+    invalidate_stats()
+
 @router.get("/next-number")
 async def get_next_invoice_number(current_user: dict = Depends(get_current_user)):
     """Get next available invoice number"""
-    # Find the highest invoice number
-    last_invoice = await db.invoices.find_one(sort=[("invoiceNumber", -1)])
-    
-    if last_invoice:
-        try:
-            last_number = int(last_invoice["invoiceNumber"])
-            next_number = str(last_number + 1).zfill(6)
-        except:
-            next_number = "100001"
-    else:
-        next_number = "100001"
+    next_number = await invoice_numbers.peek()
     
     return {"nextInvoiceNumber": next_number}
 
-@router.get("", response_model=List[Invoice])
+@router.get("", response_model=Union[List[Invoice], CursorPage[Invoice]])
 async def list_invoices(
     status: Optional[str] = None,
     customer_id: Optional[str] = None,
-    limit: int = Query(default=50, le=100),
+    limit: int = Query(default=50, ge=1, le=100),
     skip: int = 0,
+    cursor: Optional[str] = None,
+    view: str = Query(default="full", pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """List invoices (pass `cursor` for keyset pagination)"""
+    query = {}
+    if status:
+        query["status"] = status
+    if customer_id:
+        query["customerId"] = customer_id
+    
+    # Slim views push a projection down to Mongo instead of loading full documents
+    projection = None
+    if fields:
+        try:
+            projection = parse_fields(fields)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    elif view == "summary":
+        projection = INVOICE_SUMMARY_PROJECTION
+    
+    try:
+        invoices, next_cursor, has_more = await fetch_page(db.invoices, query, limit, skip=skip, cursor=cursor, projection=projection)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if projection is not None and not fields:
+        invoices = summarize(InvoiceSummary, invoices)
+    
+    payload = invoices if cursor is None else {"items": invoices, "next_cursor": next_cursor, "hasMore": has_more}
+    # Rows come straight from Mongo (or the summary model), so skip response_model re-validation
+    return trusted_response(payload)
+
+@router.get("/export")
+async def export_invoices(
+    status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
     current_user: dict = Depends(get_current_user)
 ):
-    """List invoices"""
+    """Stream all matching invoices as NDJSON or CSV"""
     query = {}
     if status:
         query["status"] = status
     if customer_id:
         query["customerId"] = customer_id
     
-    invoices = await db.invoices.find(query).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
+    return export_response(db.invoices, query, format, Invoice, "invoices")
+
+async def _run_batch(batch: dict):
+    try:
+        await run_invoice_batch(db, batch)
+    finally:
+        invalidate_stats()
+
+def _start_batch(batch: dict):
+    task = asyncio.create_task(_run_batch(batch))
+    # Keep a reference until the batch finishes so it is not garbage collected
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+@router.post("/batches", response_model=InvoiceBatch)
+async def start_invoice_batch(current_user: dict = Depends(get_current_user)):
+    """Invoice all accepted offers that have no invoice yet, in the background"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    batch = await claim_invoice_batch(db, await create_invoice_batch(db, created_by=str(current_user["_id"])))
+    _start_batch(batch)
+    
+    return trusted_response(batch)
+
+@router.get("/batches/{batch_id}", response_model=InvoiceBatch)
+async def get_invoice_batch(batch_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll the progress of an invoice batch"""
+    try:
+        batch = await db.invoice_batches.find_one({"_id": ObjectId(batch_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid batch ID")
     
-    for invoice in invoices:
-        invoice["_id"] = str(invoice["_id"])
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
     
-    return invoices
+    return trusted_response(batch)
+
+@router.post("/batches/{batch_id}/resume", response_model=InvoiceBatch)
+async def resume_invoice_batch(batch_id: str, current_user: dict = Depends(get_current_user)):
+    """Continue an interrupted invoice batch after its last processed offer"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        object_id = ObjectId(batch_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid batch ID")
+    
+    batch = await claim_invoice_batch(db, object_id)
+    if batch is None:
+        current = await db.invoice_batches.find_one({"_id": object_id}, {"status": 1})
+        if current is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if current["status"] == "done":
+            raise HTTPException(status_code=409, detail="Batch already finished")
+        raise HTTPException(status_code=409, detail="Batch is already running")
+    
+    _start_batch(batch)
+    return trusted_response(batch)
 
 @router.get("/{invoice_id}")
 async def get_invoice(invoice_id: str, current_user: dict = Depends(get_current_user)):
@@ -60,8 +168,7 @@ async def get_invoice(invoice_id: str, current_user: dict = Depends(get_current_
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    invoice["_id"] = str(invoice["_id"])
-    return invoice
+    return trusted_response(invoice)
 
 @router.post("", response_model=Invoice)
 async def create_invoice(
@@ -69,9 +176,8 @@ async def create_invoice(
     current_user: dict = Depends(get_current_user)
 ):
     """Create new invoice"""
-    # Get next invoice number
-    next_number_response = await get_next_invoice_number(current_user)
-    invoice_number = next_number_response["nextInvoiceNumber"]
+    # Allocate invoice number
+    invoice_number = await invoice_numbers.next()
     
     # Calculate totals
     subtotal = sum(item.total for item in invoice.items)
@@ -80,6 +186,8 @@ async def create_invoice(
     
     invoice_dict = invoice.dict()
     invoice_dict["invoiceNumber"] = invoice_number
+    invoice_dict["invoiceDate"] = as_midnight(invoice.invoiceDate)
+    invoice_dict["dueDate"] = as_midnight(invoice.dueDate)
     invoice_dict["subtotal"] = subtotal
     invoice_dict["taxAmount"] = tax_amount
     invoice_dict["total"] = total
@@ -88,9 +196,11 @@ async def create_invoice(
     invoice_dict["createdBy"] = str(current_user["_id"])
     invoice_dict["createdAt"] = datetime.utcnow()
     invoice_dict["updatedAt"] = datetime.utcnow()
+    invoice_dict["version"] = 0
     
     result = await db.invoices.insert_one(invoice_dict)
-    invoice_dict["_id"] = str(result.inserted_id)
+    await record_invoice_change(None, invoice_dict)
+    invoice_dict["_id"] = result.inserted_id
     
     return Invoice(**invoice_dict)
 
@@ -100,36 +210,36 @@ async def update_invoice(
     invoice: InvoiceUpdate,
     current_user: dict = Depends(get_current_user)
 ):
-    """Update invoice"""
-    update_data = {k: v for k, v in invoice.dict(exclude_unset=True).items()}
-    
-    # Recalculate if items changed
-    if "items" in update_data:
-        subtotal = sum(item["total"] for item in update_data["items"])
-        # Get tax rate from existing invoice
-        existing = await db.invoices.find_one({"_id": ObjectId(invoice_id)})
-        if existing:
-            tax_rate = existing.get("taxRate", 7.7)
-            tax_amount = subtotal * (tax_rate / 100)
-            total = subtotal + tax_amount
-            update_data["subtotal"] = subtotal
-            update_data["taxAmount"] = tax_amount
-            update_data["total"] = total
-    
-    update_data["updatedAt"] = datetime.utcnow()
-    
+    """Update invoice (pass the `version` you read to reject concurrent edits with 409)"""
     try:
-        result = await db.invoices.update_one(
-            {"_id": ObjectId(invoice_id)},
-            {"$set": update_data}
-        )
+        query = {"_id": ObjectId(invoice_id)}
     except:
         raise HTTPException(status_code=400, detail="Invalid invoice ID")
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+    update_data = invoice.dict(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
+    if update_data.get("dueDate") is not None:
+        update_data["dueDate"] = as_midnight(update_data["dueDate"])
+    if expected_version is not None:
+        # Invoices written before versioning count as version 0
+        query["version"] = {"$in": [expected_version, None]} if expected_version == 0 else expected_version
+    
+    before = await db.invoices.find_one_and_update(
+        query,
+        invoice_update_pipeline(update_data),
+        projection={**INVOICE_ROLLUP_FIELDS, "taxRate": 1, "version": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    if before is None:
+        current = await db.invoices.find_one({"_id": query["_id"]}, {"version": 1})
+        if current is None:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+        raise HTTPException(status_code=409, detail=f"Invoice was changed by someone else (now version {current.get('version', 0)})")
     
-    return {"message": "Invoice updated successfully"}
+    after = invoice_after_update(before, update_data)
+    await record_invoice_change(before, after)
+    return {"message": "Invoice updated successfully", "version": after["version"], "total": after["total"]}
 
 @router.delete("/{invoice_id}")
 async def delete_invoice(
@@ -141,13 +251,14 @@ async def delete_invoice(
         raise HTTPException(status_code=403, detail="Admin access required")
     
     try:
-        result = await db.invoices.delete_one({"_id": ObjectId(invoice_id)})
+        before = await db.invoices.find_one_and_delete({"_id": ObjectId(invoice_id)}, projection=INVOICE_ROLLUP_FIELDS)
     except:
         raise HTTPException(status_code=400, detail="Invalid invoice ID")
     
-    if result.deleted_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
+    await record_invoice_change(before, None)
     return {"message": "Invoice deleted successfully"}
 
 @router.post("/{invoice_id}/generate-pdf")
@@ -155,10 +266,45 @@ async def generate_invoice_pdf(
     invoice_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    """Generate PDF for invoice (placeholder)"""
-    invoice = await db.invoices.find_one({"_id": ObjectId(invoice_id)})
+    """Render the invoice PDF in the background (poll /pdf-jobs/{jobId} while queued)"""
+    try:
+        invoice = await db.invoices.find_one({"_id": ObjectId(invoice_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid invoice ID")
+    
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    # This will be implemented with WeasyPrint later
-    return {"message": "PDF generation coming soon", "invoiceId": invoice_id}
+    return await request_pdf("invoice", invoice)
+
+@router.get("/{invoice_id}/qr-code")
+async def get_invoice_qr_code(
+    request: Request,
+    invoice_id: str,
+    format: str = Query(default="svg", pattern="^(svg|png)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Swiss QR code of the invoice's payment part as SVG or PNG"""
+    try:
+        invoice = await db.invoices.find_one({"_id": ObjectId(invoice_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid invoice ID")
+    
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    
+    try:
+        bill = invoice_bill(invoice, await settings_cache.get() or {})
+        if bill is None:
+            raise HTTPException(status_code=404, detail="Invoice has no QR bill (IBAN missing)")
+        payload = build_payload(bill, f"Rechnung {invoice['invoiceNumber']}")
+    except QRBillError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    # Codes only change with their payload, so the hash is a stable ETag
+    etag = f'"{payload_hash(payload)}-{format}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if format == "png":
+        return Response(content=render_png(payload), media_type="image/png", headers={"ETag": etag})
+    return Response(content=render_svg(payload), media_type="image/svg+xml", headers={"ETag": etag})
@@ -1,67 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from typing import List, Optional, Union
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 from datetime import datetime
+import time
 
-from models.offer import Offer, OfferCreate, OfferUpdate, Pricing
+from models.email_job import EmailJob
+from models.offer import BatchPricingRequest, Offer, OfferCreate, OfferSummary, OFFER_SUMMARY_PROJECTION, OfferUpdate, Pricing
+from models.pagination import CursorPage
+from utils.bulk_import import guess_format, import_file
+from utils.capacity import OFFER_CAPACITY_FIELDS, apply_capacity_change, apply_capacity_changes
+from utils.counters import number_allocator
+from utils.export import export_response
+from utils.geodata import estimate_distance
+from utils.mailer import SMTPConfig
+from utils.pagination import fetch_page
+from utils.projection import parse_fields, summarize
+from utils.responses import trusted_response
+from utils.pricing import compute_pricing, price_offers, services_total, tax_of
+from utils.rollups import OFFER_ROLLUP_FIELDS, apply_rollup_change, apply_rollup_changes, merge_update, offer_contribution
+from utils.search import SEARCH_KEYS_EXCLUDED, SEARCH_TARGETS, refresh_search_keys
 from .auth import get_current_user
+from .emails import mail_queue
+from .pdf import PdfRenderError, pdf_file, render_pdf, request_pdf
+from .settings import settings_cache
+from .stats import invalidate_stats
 
 router = APIRouter(prefix="/offers", tags=["Offers"])
 
 from ..server import db
 
-@router.get("", response_model=List[Offer])
+offer_numbers = number_allocator(db, "offerNumber")
+
+# Before/after images of offer writes feed the rollups and the capacity calendar
+OFFER_CHANGE_FIELDS = {**OFFER_ROLLUP_FIELDS, **OFFER_CAPACITY_FIELDS}
+
+# Everything batch pricing reads, including the rollup fields of the old pricing
+OFFER_PRICING_FIELDS = {
+    "createdAt": 1,
+    "category": 1,
+    "status": 1,
+    "serviceDetails": 1,
+    "additionalServices": 1,
+    "pricing": 1,
+}
+
+async def record_offer_change(before: Optional[dict], after: Optional[dict]):
+    """Keep revenue rollups, the capacity calendar and cached statistics in step with an offer write"""
+    await apply_rollup_change(db, offer_contribution, before, after)
+    await apply_capacity_change(db, before, after)
+    invalidate_stats()
+
+async def _offer_email_sent(job: dict):
+    """Mark the offer as sent once the mail server accepted its email"""
+    update_data = {"emailSent": True, "emailSentAt": datetime.utcnow(), "status": "sent"}
+    before = await db.offers.find_one_and_update(
+        {"_id": ObjectId(job["documentId"])},
+        {"$set": update_data},
+        projection=OFFER_CHANGE_FIELDS,
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        await record_offer_change(before, merge_update(before, update_data, OFFER_CHANGE_FIELDS))
+
+mail_queue.on_sent["offer"] = _offer_email_sent
+
+@router.get("", response_model=Union[List[Offer], CursorPage[Offer]])
 async def list_offers(
     status: Optional[str] = None,
     category: Optional[str] = None,
-    limit: int = Query(default=50, le=100),
+    limit: int = Query(default=50, ge=1, le=100),
     skip: int = 0,
+    cursor: Optional[str] = None,
+    view: str = Query(default="full", pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """List offers with filters"""
+    """List offers with filters (pass `cursor` for keyset pagination)"""
     query = {}
     if status:
         query["status"] = status
     if category:
         query["category"] = category
     
-    offers = await db.offers.find(query).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
+    # Slim views push a projection down to Mongo instead of loading full documents
+    projection = SEARCH_KEYS_EXCLUDED
+    if fields:
+        try:
+            projection = parse_fields(fields)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    elif view == "summary":
+        projection = OFFER_SUMMARY_PROJECTION
+    
+    try:
+        offers, next_cursor, has_more = await fetch_page(db.offers, query, limit, skip=skip, cursor=cursor, projection=projection)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    for offer in offers:
-        offer["_id"] = str(offer["_id"])
+    if view == "summary" and not fields:
+        offers = summarize(OfferSummary, offers)
     
-    return offers
+    payload = offers if cursor is None else {"items": offers, "next_cursor": next_cursor, "hasMore": has_more}
+    # Rows come straight from Mongo (or the summary model), so skip response_model re-validation
+    return trusted_response(payload)
 
 @router.get("/next-number")
 async def get_next_offer_number(current_user: dict = Depends(get_current_user)):
     """Get next available offer number"""
-    # Find the highest offer number
-    last_offer = await db.offers.find_one(sort=[("offerNumber", -1)])
-    
-    if last_offer:
-        try:
-            last_number = int(last_offer["offerNumber"])
-            next_number = str(last_number + 1).zfill(5)
-        except:
-            next_number = "10001"
-    else:
-        next_number = "10001"
+    next_number = await offer_numbers.peek()
     
     return {"nextOfferNumber": next_number}
 
+@router.get("/export")
+async def export_offers(
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream all matching offers as NDJSON or CSV"""
+    query = {}
+    if status:
+        query["status"] = status
+    if category:
+        query["category"] = category
+    
+    return export_response(db.offers, query, format, Offer, "offers", projection=SEARCH_KEYS_EXCLUDED)
+
 @router.get("/{offer_id}")
 async def get_offer(offer_id: str, current_user: dict = Depends(get_current_user)):
     """Get offer by ID"""
     try:
-        offer = await db.offers.find_one({"_id": ObjectId(offer_id)})
+        offer = await db.offers.find_one({"_id": ObjectId(offer_id)}, SEARCH_KEYS_EXCLUDED)
     except:
-        offer = await db.offers.find_one({"offerNumber": offer_id})
+        offer = await db.offers.find_one({"offerNumber": offer_id}, SEARCH_KEYS_EXCLUDED)
     
     if not offer:
         raise HTTPException(status_code=404, detail="Offer not found")
     
-    offer["_id"] = str(offer["_id"])
-    return offer
+    return trusted_response(offer)
 
 @router.post("", response_model=Offer)
 async def create_offer(
@@ -69,17 +147,45 @@ async def create_offer(
     current_user: dict = Depends(get_current_user)
 ):
     """Create new offer"""
+    # Allocate offer number
+    offer_number = await offer_numbers.next()
+    
     offer_dict = offer.dict()
+    offer_dict["offerNumber"] = offer_number
     offer_dict["createdBy"] = str(current_user["_id"])
     offer_dict["createdAt"] = datetime.utcnow()
     offer_dict["updatedAt"] = datetime.utcnow()
     offer_dict["status"] = "draft"
+    offer_dict["searchKeys"] = SEARCH_TARGETS["offers"].keys(offer_dict)
+    
+    # The move's distance lives on the destination; keep what staff typed in
+    if not offer_dict["newLocation"].get("distance"):
+        distance = estimate_distance(offer_dict["currentLocation"]["zipCode"], offer_dict["newLocation"]["zipCode"])
+        if distance is not None:
+            offer_dict["newLocation"]["distance"] = distance
     
     result = await db.offers.insert_one(offer_dict)
-    offer_dict["_id"] = str(result.inserted_id)
+    await record_offer_change(None, offer_dict)
+    offer_dict["_id"] = result.inserted_id
     
     return Offer(**offer_dict)
 
+@router.post("/import")
+async def import_offers(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Bulk import offers from NDJSON or CSV (admin only); returns per-row errors"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    report = await import_file(db, "offers", file.file, format or guess_format(file.filename), created_by=str(current_user["_id"]))
+    if report["inserted"]:
+        invalidate_stats()
+    
+    return report
+
 @router.put("/{offer_id}")
 async def update_offer(
     offer_id: str,
@@ -91,16 +197,22 @@ async def update_offer(
     update_data["updatedAt"] = datetime.utcnow()
     
     try:
-        result = await db.offers.update_one(
+        before = await db.offers.find_one_and_update(
             {"_id": ObjectId(offer_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection=OFFER_CHANGE_FIELDS,
+            return_document=ReturnDocument.BEFORE
         )
     except:
         raise HTTPException(status_code=400, detail="Invalid offer ID")
     
-    if result.modified_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Offer not found")
     
+    await record_offer_change(before, merge_update(before, update_data, OFFER_CHANGE_FIELDS))
+    search_target = SEARCH_TARGETS["offers"]
+    if search_target.touches(update_data):
+        await refresh_search_keys(db, search_target, await db.offers.find_one({"_id": before["_id"]}, search_target.projection))
     return {"message": "Offer updated successfully"}
 
 @router.delete("/{offer_id}")
@@ -110,15 +222,59 @@ async def delete_offer(
 ):
     """Delete offer"""
     try:
-        result = await db.offers.delete_one({"_id": ObjectId(offer_id)})
+        before = await db.offers.find_one_and_delete({"_id": ObjectId(offer_id)}, projection=OFFER_CHANGE_FIELDS)
     except:
         raise HTTPException(status_code=400, detail="Invalid offer ID")
     
-    if result.deleted_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Offer not found")
     
+    await record_offer_change(before, None)
     return {"message": "Offer deleted successfully"}
 
+@router.post("/calculate-batch")
+async def calculate_pricing_batch(
+    request: BatchPricingRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Price many offers against one settings snapshot; `persist=false` only previews"""
+    started = time.perf_counter()
+    # One entry per offer; a repeated offer takes its last inputs
+    items = {}
+    for item in request.items:
+        try:
+            items[ObjectId(item.offerId)] = item.dict()
+        except:
+            raise HTTPException(status_code=400, detail=f"Invalid offer ID: {item.offerId}")
+    
+    settings = await settings_cache.get()
+    categories = {
+        category["categoryId"]: category
+        async for category in db.service_categories.find({}, {"categoryId": 1, "pricingModel": 1, "basePrice": 1, "hourlyRate": 1})
+    }
+    offers = await db.offers.find({"_id": {"$in": list(items)}}, OFFER_PRICING_FIELDS).to_list(None)
+    pricings = price_offers(offers, [items[offer["_id"]] for offer in offers], categories, settings)
+    
+    if request.persist and offers:
+        now = datetime.utcnow()
+        await db.offers.bulk_write([
+            UpdateOne({"_id": offer["_id"]}, {"$set": {"pricing": pricing, "updatedAt": now}})
+            for offer, pricing in zip(offers, pricings)
+        ], ordered=False)
+        changes = [(offer, {**offer, "pricing": pricing}) for offer, pricing in zip(offers, pricings)]
+        await apply_rollup_changes(db, offer_contribution, changes)
+        # Accepted offers hold their crews for the priced hours
+        await apply_capacity_changes(db, changes)
+        invalidate_stats()
+    
+    found = {offer["_id"] for offer in offers}
+    return trusted_response({
+        "results": [{"offerId": str(offer["_id"]), "pricing": pricing} for offer, pricing in zip(offers, pricings)],
+        "missing": [item["offerId"] for offer_id, item in items.items() if offer_id not in found],
+        "persisted": len(offers) if request.persist else 0,
+        "seconds": round(time.perf_counter() - started, 3),
+    })
+
 @router.post("/{offer_id}/calculate")
 async def calculate_pricing(
     offer_id: str,
@@ -129,70 +285,80 @@ async def calculate_pricing(
     current_user: dict = Depends(get_current_user)
 ):
     """Calculate offer pricing"""
-    # Get tax settings
-    settings = await db.company_settings.find_one({"_id": "company_settings"})
-    tax_rate = settings.get("tax", {}).get("rate", 7.7) if settings else 7.7
-    tax_enabled = settings.get("tax", {}).get("enabled", True) if settings else True
-    
-    # Calculate additional services total
-    additional_total = sum(service.get("price", 0) for service in additional_services if service.get("selected", False))
-    
-    # Calculate subtotal
-    subtotal = base_price + additional_total
-    
-    # Apply discount
-    discount_amount = 0
-    if discount > 0:
-        if discount_type == "percentage":
-            discount_amount = subtotal * (discount / 100)
-        else:
-            discount_amount = discount
-    
-    subtotal_after_discount = subtotal - discount_amount
-    
-    # Calculate tax
-    tax_amount = 0
-    if tax_enabled:
-        tax_amount = subtotal_after_discount * (tax_rate / 100)
-    
-    total = subtotal_after_discount + tax_amount
-    
-    pricing = Pricing(
-        basePrice=base_price,
-        additionalServicesTotal=additional_total,
-        subtotal=subtotal,
-        discount=discount,
-        discountType=discount_type,
-        taxRate=tax_rate,
-        taxAmount=tax_amount,
-        total=total,
-        currency="CHF",
-        includeTax=tax_enabled
-    )
+    settings = await settings_cache.get()
+    tax_rate, tax_enabled = tax_of(settings)
+    
+    pricing = Pricing(**compute_pricing(base_price, services_total(additional_services), discount, discount_type, tax_rate, tax_enabled))
     
     # Update offer with new pricing
-    await db.offers.update_one(
+    update_data = {"pricing": pricing.dict(), "updatedAt": datetime.utcnow()}
+    before = await db.offers.find_one_and_update(
         {"_id": ObjectId(offer_id)},
-        {"$set": {"pricing": pricing.dict(), "updatedAt": datetime.utcnow()}}
+        {"$set": update_data},
+        projection=OFFER_CHANGE_FIELDS,
+        return_document=ReturnDocument.BEFORE
     )
+    await record_offer_change(before, merge_update(before, update_data, OFFER_CHANGE_FIELDS))
     
     return pricing
 
+@router.post("/{offer_id}/generate-pdf")
+async def generate_offer_pdf(
+    offer_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Render the offer PDF in the background (poll /pdf-jobs/{jobId} while queued)"""
+    try:
+        offer = await db.offers.find_one({"_id": ObjectId(offer_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid offer ID")
+    
+    if not offer:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    
+    return await request_pdf("offer", offer)
+
 @router.post("/{offer_id}/send-email")
 async def send_offer_email(
     offer_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    """Send offer via email (placeholder)"""
-    # This will be implemented in Phase 4
-    offer = await db.offers.find_one({"_id": ObjectId(offer_id)})
+    """Render the offer PDF if needed and queue the email; poll /email-jobs/{jobId} for delivery"""
+    settings = await settings_cache.get() or {}
+    if not SMTPConfig(settings.get("email") or {}).complete:
+        raise HTTPException(status_code=400, detail="Email settings are incomplete")
+    
+    try:
+        offer = await db.offers.find_one({"_id": ObjectId(offer_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid offer ID")
+    
     if not offer:
         raise HTTPException(status_code=404, detail="Offer not found")
     
-    # Update email sent status
-    await db.offers.update_one(
-        {"_id": ObjectId(offer_id)},
-        {"$set": {"emailSent": True, "emailSentAt": datetime.utcnow(), "status": "sent"}}
+    # The offer goes out with the PDF of its current content, rendered first if need be
+    try:
+        attachments = [str(pdf_file(await render_pdf("offer", offer)))]
+    except PdfRenderError as exc:
+        raise HTTPException(status_code=503, detail=f"Offer PDF is not available: {exc}")
+    
+    customer = offer["customer"]
+    pricing = offer.get("pricing") or {}
+    body = (
+        f"Guten Tag {customer.get('salutation', '')} {customer.get('lastName', '')}\n\n"
+        f"Vielen Dank für Ihre Anfrage. Gerne unterbreiten wir Ihnen unsere Offerte {offer['offerNumber']} "
+        f"über {pricing.get('currency', 'CHF')} {pricing.get('total', 0):.2f}. Sie finden sie im Anhang."
+        f"\n\nFreundliche Grüsse\n{settings.get('companyName', '')}\n"
     )
+    job = EmailJob(
+        kind="offer",
+        documentId=str(offer["_id"]),
+        to=[customer["email"]],
+        subject=f"Ihre Offerte {offer['offerNumber']}",
+        body=body,
+        attachments=attachments,
+        createdBy=str(current_user["_id"])
+    ).dict(exclude={"id"})
+    job_id = await mail_queue.enqueue(job)
     
-    return {"message": "Email sent successfully (placeholder)"}
+    return {"message": "Email queued", "status": "queued", "jobId": job_id}
@@ -0,0 +1,185 @@
+from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from models.pdf_job import PdfJob
+from utils.pdf import pdf_fingerprint, render_to_file
+from utils.qrbill import QRBillError, build_payload, invoice_bill
+from utils.responses import trusted_response
+from .auth import get_current_user
+from .settings import settings_cache
+
+router = APIRouter(prefix="/pdf-jobs", tags=["PDF"])
+
+from ..server import db
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Rendered files are content-addressed, so their URL never needs to change.
+# They hold customer data and belong on a data volume, not in the source tree.
+PDF_DIR = Path(os.getenv("PDF_DIR", "/var/lib/offerte/pdfs"))
+PDF_DIR.mkdir(parents=True, exist_ok=True)
+PDF_URL_PREFIX = "/uploads/pdfs"
+
+PDF_JOB_TIMEOUT = timedelta(seconds=float(os.getenv("PDF_JOB_TIMEOUT_SECONDS", "300")))
+# How long a request that needs the file (an email attachment) waits for its rendering
+PDF_WAIT_SECONDS = float(os.getenv("PDF_WAIT_SECONDS", "60"))
+# Renders running in other processes are only visible through pdf_jobs
+PDF_WAIT_POLL_SECONDS = 0.2
+
+COLLECTIONS = {"offer": "offers", "invoice": "invoices"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Rendering tasks of this process by job ID
+_tasks: Dict[str, asyncio.Task] = {}
+
+class PdfRenderError(Exception):
+    """A PDF that is needed now failed to render or took too long"""
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking would copy the event loop and Mongo client threads into the workers
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def _render_payload(kind: str, doc: dict, settings: dict) -> dict:
+    """Everything the renderer needs, so worker processes never touch the database"""
+    payload = {"doc": doc, "settings": settings}
+    if kind == "invoice":
+        customer = None
+        if ObjectId.is_valid(doc.get("customerId") or ""):
+            customer = await db.customers.find_one({"_id": ObjectId(doc["customerId"])}, {"_id": 0, "createdAt": 0, "updatedAt": 0, "searchKeys": 0, "emailLower": 0})
+        payload["customer"] = customer
+        payload["qrBill"] = invoice_qr_bill(doc, settings)
+    else:
+        service_ids = [service.get("serviceId") for service in doc.get("additionalServices") or [] if service.get("selected")]
+        language = doc.get("language") or "de"
+        names = {}
+        async for service in db.additional_services.find({"serviceId": {"$in": service_ids}}, {"serviceId": 1, "name": 1}):
+            texts = service.get("name") or {}
+            names[service["serviceId"]] = texts.get(language) or texts.get("de") or service["serviceId"]
+        payload["serviceNames"] = names
+    return payload
+
+def invoice_qr_bill(invoice: dict, settings: dict) -> Optional[dict]:
+    """QR bill data and SPC payload of an invoice; None without IBAN or with invalid bill data"""
+    try:
+        bill = invoice_bill(invoice, settings)
+        if bill is None:
+            return None
+        return {"bill": bill, "payload": build_payload(bill, f"Rechnung {invoice.get('invoiceNumber', '')}")}
+    except QRBillError as exc:
+        logger.warning("Invoice %s has no valid QR bill: %s", invoice.get("invoiceNumber"), exc)
+        return None
+
+def pdf_file(pdf_url: str) -> Path:
+    """Local file behind a `pdfUrl`"""
+    return PDF_DIR / pdf_url.rpartition("/")[2]
+
+async def _run_job(job_id: ObjectId, kind: str, doc_id: ObjectId, payload: dict, fingerprint: str):
+    pdf_url = f"{PDF_URL_PREFIX}/{fingerprint}.pdf"
+    try:
+        await db.pdf_jobs.update_one({"_id": job_id}, {"$set": {"status": "running"}})
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_get_pool(), render_to_file, kind, payload, str(PDF_DIR / f"{fingerprint}.pdf"))
+        await db[COLLECTIONS[kind]].update_one({"_id": doc_id}, {"$set": {"pdfUrl": pdf_url}})
+        await db.pdf_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "done", "pdfUrl": pdf_url, "finishedAt": datetime.utcnow()}}
+        )
+    except Exception as exc:
+        logger.exception("Rendering %s %s failed", kind, doc_id)
+        if isinstance(exc, BrokenProcessPool):
+            # A crashed worker poisons the whole pool; start a fresh one for the next job
+            shutdown_pool()
+        await db.pdf_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "failed", "error": str(exc), "finishedAt": datetime.utcnow()}}
+        )
+
+async def request_pdf(kind: str, doc: dict) -> dict:
+    """Return the cached PDF of a document, or queue its rendering.
+
+    The cache key is a hash of the document content and the company settings
+    version, so unchanged documents are never rendered twice.
+    """
+    settings = await settings_cache.get() or {}
+    payload = await _render_payload(kind, doc, settings)
+    fingerprint = pdf_fingerprint(kind, payload, settings_cache.version)
+    pdf_url = f"{PDF_URL_PREFIX}/{fingerprint}.pdf"
+    
+    if (PDF_DIR / f"{fingerprint}.pdf").exists():
+        if doc.get("pdfUrl") != pdf_url:
+            await db[COLLECTIONS[kind]].update_one({"_id": doc["_id"]}, {"$set": {"pdfUrl": pdf_url}})
+        return {"status": "done", "pdfUrl": pdf_url}
+    
+    # A render of the same content is already on its way (unless its worker died)
+    pending = await db.pdf_jobs.find_one({
+        "fingerprint": fingerprint,
+        "status": {"$in": ["queued", "running"]},
+        "createdAt": {"$gte": datetime.utcnow() - PDF_JOB_TIMEOUT},
+    })
+    if pending:
+        return {"status": pending["status"], "jobId": str(pending["_id"])}
+    
+    job = PdfJob(kind=kind, documentId=str(doc["_id"]), fingerprint=fingerprint).dict(exclude={"id"})
+    result = await db.pdf_jobs.insert_one(job)
+    job_id = str(result.inserted_id)
+    task = asyncio.create_task(_run_job(result.inserted_id, kind, doc["_id"], payload, fingerprint))
+    # Keep a reference until the job finishes so it is not garbage collected
+    _tasks[job_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(job_id, None))
+    
+    return {"status": "queued", "jobId": job_id}
+
+async def render_pdf(kind: str, doc: dict) -> str:
+    """`pdfUrl` of a document's PDF, waiting for the rendering if it is not cached yet"""
+    pdf = await request_pdf(kind, doc)
+    deadline = time.monotonic() + PDF_WAIT_SECONDS
+    while pdf["status"] != "done":
+        if pdf["status"] == "failed":
+            raise PdfRenderError(pdf.get("error") or "rendering failed")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PdfRenderError(f"not rendered within {PDF_WAIT_SECONDS:g}s")
+        task = _tasks.get(pdf["jobId"])
+        try:
+            # shield: giving up on the wait must not cancel the rendering
+            await asyncio.wait_for(asyncio.shield(task) if task else asyncio.sleep(PDF_WAIT_POLL_SECONDS), remaining)
+        except asyncio.TimeoutError:
+            pass
+        job = await db.pdf_jobs.find_one({"_id": ObjectId(pdf["jobId"])}, {"status": 1, "pdfUrl": 1, "error": 1})
+        if job is None:
+            raise PdfRenderError("rendering job disappeared")
+        pdf = {"jobId": pdf["jobId"], **job}
+    return pdf["pdfUrl"]
+
+@router.get("/{job_id}", response_model=PdfJob)
+async def get_pdf_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll the status of a PDF rendering job"""
+    try:
+        job = await db.pdf_jobs.find_one({"_id": ObjectId(job_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return trusted_response(job)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from itertools import chain
+import asyncio
+import time
+
+from utils.search import SEARCH_MIN_LENGTH, SEARCH_TARGETS, search
+from .auth import get_current_user
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+from ..server import db
+
+@router.get("")
+async def search_records(
+    q: str = Query(..., min_length=SEARCH_MIN_LENGTH, max_length=100),
+    kind: str = Query(default="all", pattern="^(all|customers|offers)$"),
+    limit: int = Query(default=10, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Ranked typeahead search over customers (admin only) and offers"""
+    kinds = list(SEARCH_TARGETS) if kind == "all" else [kind]
+    if current_user["role"] != "admin":
+        if kind == "customers":
+            raise HTTPException(status_code=403, detail="Admin access required")
+        kinds = [name for name in kinds if name != "customers"]
+    
+    started = time.perf_counter()
+    groups = await asyncio.gather(*(search(db, SEARCH_TARGETS[name], q, limit) for name in kinds))
+    results = sorted(chain.from_iterable(groups), key=lambda hit: hit["score"], reverse=True)[:limit]
+    
+    return {"query": q, "results": results, "tookMs": round((time.perf_counter() - started) * 1000, 1)}
@@ -1,30 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
 
 from models.additional_service import AdditionalService, AdditionalServiceCreate, AdditionalServiceUpdate
+from utils.responses import trusted_response
 from .auth import get_current_user
+from .categories import catalog, catalog_response
 
 router = APIRouter(prefix="/services", tags=["Additional Services"])
 
 from ..server import db
 
 @router.get("", response_model=List[AdditionalService])
-async def list_services(category_id: str = None, active_only: bool = True):
+async def list_services(
+    request: Request,
+    category_id: str = None,
+    active_only: bool = True,
+    language: Optional[str] = Query(default=None, pattern="^[a-z]{2}$")
+):
     """List all additional services"""
-    query = {}
-    if category_id:
-        query["categoryId"] = category_id
-    if active_only:
-        query["active"] = True
-    
-    services = await db.additional_services.find(query).sort("order", 1).to_list(100)
-    
-    for service in services:
-        service["_id"] = str(service["_id"])
-    
-    return services
+    etag, body = await catalog.services(category_id=category_id, active_only=active_only, language=language)
+    return catalog_response(request, etag, body)
 
 @router.get("/{service_id}")
 async def get_service(service_id: str):
@@ -37,8 +34,7 @@ async def get_service(service_id: str):
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
-    service["_id"] = str(service["_id"])
-    return service
+    return trusted_response(service)
 
 @router.post("", response_model=AdditionalService)
 async def create_service(
@@ -59,7 +55,8 @@ async def create_service(
     service_dict["updatedAt"] = datetime.utcnow()
     
     result = await db.additional_services.insert_one(service_dict)
-    service_dict["_id"] = str(result.inserted_id)
+    service_dict["_id"] = result.inserted_id
+    await catalog.bump()
     
     return AdditionalService(**service_dict)
 
@@ -90,6 +87,7 @@ async def update_service(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    await catalog.bump()
     return {"message": "Service updated successfully"}
 
 @router.delete("/{service_id}")
@@ -109,4 +107,5 @@ async def delete_service(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    await catalog.bump()
     return {"message": "Service deleted successfully"}
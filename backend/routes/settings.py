@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response
 from typing import Optional
+from bson import ObjectId
+import asyncio
+import copy
 import os
 import shutil
 from datetime import datetime
 
 from models.company_settings import CompanySettings, Theme, TaxSettings, EmailSettings, Address
+from models.reprice_job import RepriceJob
+from utils.pricing import tax_of
+from utils.repricing import create_reprice_job, run_reprice_job
+from utils.responses import trusted_response
+from utils.versioned_cache import BUMP_VERSION, VersionedDocumentCache, etag_matches
 from .auth import get_current_user
+from .stats import invalidate_stats
 
 router = APIRouter(prefix="/settings", tags=["Settings"])
 
@@ -14,10 +23,35 @@ from ..server import db
 UPLOAD_DIR = "/app/backend/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+SETTINGS_POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", "5"))
+settings_cache = VersionedDocumentCache(db.company_settings, "company_settings", poll_interval=SETTINGS_POLL_SECONDS)
+
+_reprice_tasks = set()
+
+def public_settings(settings: dict) -> dict:
+    """Settings as exposed to anonymous visitors"""
+    settings = copy.deepcopy(settings)
+    # Remove sensitive email data for public access
+    if "email" in settings:
+        settings["email"] = {
+            "fromEmail": settings["email"].get("fromEmail", ""),
+            "fromName": settings["email"].get("fromName", "")
+        }
+    return settings
+
+async def save_settings(update: dict):
+    """Apply an update to the settings document and invalidate every worker's cache"""
+    result = await db.company_settings.update_one(
+        {"_id": "company_settings"},
+        {**update, **BUMP_VERSION}
+    )
+    settings_cache.invalidate()
+    return result
+
 @router.get("/company")
-async def get_company_settings():
+async def get_company_settings(request: Request, response: Response):
     """Get company settings (public)"""
-    settings = await db.company_settings.find_one({"_id": "company_settings"})
+    settings = await settings_cache.get()
     
     if not settings:
         # Create default settings
@@ -36,16 +70,15 @@ async def get_company_settings():
             )]
         )
         await db.company_settings.insert_one(default_settings.dict(by_alias=True))
-        settings = default_settings.dict(by_alias=True)
+        settings_cache.invalidate()
+        settings = await settings_cache.get()
     
-    # Remove sensitive email data for public access
-    if "email" in settings:
-        settings["email"] = {
-            "fromEmail": settings["email"].get("fromEmail", ""),
-            "fromName": settings["email"].get("fromName", "")
-        }
+    etag = settings_cache.etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return settings
+    response.headers["ETag"] = etag
+    return settings_cache.memo("public", public_settings)
 
 @router.put("/company")
 async def update_company_settings(
@@ -67,10 +100,7 @@ async def update_company_settings(
     if defaultLanguage:
         update_data["defaultLanguage"] = defaultLanguage
     
-    result = await db.company_settings.update_one(
-        {"_id": "company_settings"},
-        {"$set": update_data}
-    )
+    result = await save_settings({"$set": update_data})
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Settings not found")
@@ -98,10 +128,7 @@ async def upload_logo(
     
     # Update database
     logo_url = f"/uploads/{os.path.basename(file_path)}"
-    await db.company_settings.update_one(
-        {"_id": "company_settings"},
-        {"$set": {"logo": logo_url, "updatedAt": datetime.utcnow()}}
-    )
+    await save_settings({"$set": {"logo": logo_url, "updatedAt": datetime.utcnow()}})
     
     return {"message": "Logo uploaded successfully", "logoUrl": logo_url}
 
@@ -114,10 +141,7 @@ async def update_theme(
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    await db.company_settings.update_one(
-        {"_id": "company_settings"},
-        {"$set": {"theme": theme.dict(), "updatedAt": datetime.utcnow()}}
-    )
+    await save_settings({"$set": {"theme": theme.dict(), "updatedAt": datetime.utcnow()}})
     
     return {"message": "Theme updated successfully"}
 
@@ -130,12 +154,73 @@ async def update_tax_settings(
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    await db.company_settings.update_one(
-        {"_id": "company_settings"},
-        {"$set": {"tax": tax.dict(), "updatedAt": datetime.utcnow()}}
-    )
+    settings = await settings_cache.get()
+    await save_settings({"$set": {"tax": tax.dict(), "updatedAt": datetime.utcnow()}})
+    
+    # Open offers and draft invoices follow a changed rate
+    if tax_of(settings) == (tax.rate, tax.enabled):
+        return {"message": "Tax settings updated successfully"}
+    
+    job_id = await create_reprice_job(db, tax.dict(), created_by=str(current_user["_id"]))
+    _start_reprice(job_id)
+    
+    return {"message": "Tax settings updated successfully", "repriceJobId": str(job_id)}
+
+async def _run_reprice(job_id: ObjectId):
+    try:
+        await run_reprice_job(db, job_id)
+    finally:
+        invalidate_stats()
+
+def _start_reprice(job_id: ObjectId):
+    task = asyncio.create_task(_run_reprice(job_id))
+    # Keep a reference until the job finishes so it is not garbage collected
+    _reprice_tasks.add(task)
+    task.add_done_callback(_reprice_tasks.discard)
+
+@router.post("/tax/reprice", response_model=RepriceJob)
+async def start_reprice_job(current_user: dict = Depends(get_current_user)):
+    """Apply the current tax settings to open offers and draft invoices, in the background"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    tax_rate, tax_enabled = tax_of(await settings_cache.get())
+    job_id = await create_reprice_job(db, {"rate": tax_rate, "enabled": tax_enabled}, created_by=str(current_user["_id"]))
+    _start_reprice(job_id)
+    
+    return trusted_response(await db.reprice_jobs.find_one({"_id": job_id}))
+
+@router.get("/tax/reprice/{job_id}", response_model=RepriceJob)
+async def get_reprice_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll the progress of a reprice job"""
+    try:
+        job = await db.reprice_jobs.find_one({"_id": ObjectId(job_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Reprice job not found")
+    
+    return trusted_response(job)
+
+@router.post("/tax/reprice/{job_id}/resume", response_model=RepriceJob)
+async def resume_reprice_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Continue an interrupted reprice job after its last range"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        job = await db.reprice_jobs.find_one({"_id": ObjectId(job_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
     
-    return {"message": "Tax settings updated successfully"}
+    if not job:
+        raise HTTPException(status_code=404, detail="Reprice job not found")
+    if job["status"] in ("done", "superseded"):
+        raise HTTPException(status_code=409, detail=f"Reprice job is {job['status']}")
+    
+    _start_reprice(job["_id"])
+    return trusted_response(job)
 
 @router.put("/email")
 async def update_email_settings(
@@ -146,9 +231,6 @@ async def update_email_settings(
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    await db.company_settings.update_one(
-        {"_id": "company_settings"},
-        {"$set": {"email": email.dict(), "updatedAt": datetime.utcnow()}}
-    )
+    await save_settings({"$set": {"email": email.dict(), "updatedAt": datetime.utcnow()}})
     
     return {"message": "Email settings updated successfully"}
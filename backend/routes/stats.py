@@ -0,0 +1,178 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+import asyncio
+import os
+
+from models.rollup import RollupRow
+from utils.cache import TTLCache
+from utils.rollups import ROLLUP_COLLECTION
+from .auth import get_current_user
+
+router = APIRouter(prefix="/stats", tags=["Statistics"])
+
+from ..server import db
+
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "30"))
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "Europe/Zurich")
+
+# Open receivables are invoices that were sent but not paid yet
+OPEN_INVOICE_STATUSES = ["sent", "overdue"]
+PENDING_OFFER_STATUSES = ["draft", "sent"]
+
+# How far back each revenue series reaches
+PERIODS = {
+    "daily": ("%Y-%m-%d", timedelta(days=30)),
+    "weekly": ("%G-W%V", timedelta(weeks=12)),
+    "monthly": ("%Y-%m", timedelta(days=366)),
+}
+
+overview_cache = TTLCache(maxsize=1, ttl=STATS_CACHE_TTL_SECONDS)
+
+def invalidate_stats():
+    """Drop cached statistics; called by every write to offers, invoices or customers"""
+    overview_cache.clear()
+
+def _revenue_facets(amount_field: str, now: datetime) -> dict:
+    facets = {}
+    for name, (date_format, window) in PERIODS.items():
+        facets[name] = [
+            {"$match": {"createdAt": {"$gte": now - window}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": date_format, "date": "$createdAt", "timezone": STATS_TIMEZONE}},
+                "count": {"$sum": 1},
+                "total": {"$sum": {"$ifNull": [amount_field, 0]}},
+            }},
+            {"$sort": {"_id": 1}},
+        ]
+    return facets
+
+def _grouped(rows: list) -> dict:
+    return {(row["_id"] if row["_id"] is not None else "unknown"): {"count": row["count"], "total": round(row["total"], 2)} for row in rows}
+
+def _series(rows: list) -> list:
+    return [{"period": row["_id"], "count": row["count"], "total": round(row["total"], 2)} for row in rows]
+
+async def _offer_stats(now: datetime) -> dict:
+    amount = "$pricing.total"
+    pipeline = [{"$facet": {
+        "byStatus": [{"$group": {"_id": "$status", "count": {"$sum": 1}, "total": {"$sum": {"$ifNull": [amount, 0]}}}}],
+        "byCategory": [{"$group": {"_id": "$category", "count": {"$sum": 1}, "total": {"$sum": {"$ifNull": [amount, 0]}}}}],
+        **_revenue_facets(amount, now),
+    }}]
+    result = (await db.offers.aggregate(pipeline).to_list(1))[0]
+    by_status = _grouped(result["byStatus"])
+    current_month = datetime.now(ZoneInfo(STATS_TIMEZONE)).strftime("%Y-%m")
+    return {
+        "total": sum(group["count"] for group in by_status.values()),
+        "thisMonth": next((row["count"] for row in result["monthly"] if row["_id"] == current_month), 0),
+        "pending": sum(by_status.get(s, {}).get("count", 0) for s in PENDING_OFFER_STATUSES),
+        "byStatus": by_status,
+        "byCategory": _grouped(result["byCategory"]),
+        "revenue": {
+            "total": round(sum(group["total"] for group in by_status.values()), 2),
+            **{name: _series(result[name]) for name in PERIODS},
+        },
+    }
+
+async def _invoice_stats(now: datetime) -> dict:
+    amount = "$total"
+    pipeline = [{"$facet": {
+        "byStatus": [{"$group": {"_id": "$status", "count": {"$sum": 1}, "total": {"$sum": {"$ifNull": [amount, 0]}}}}],
+        **_revenue_facets(amount, now),
+    }}]
+    result = (await db.invoices.aggregate(pipeline).to_list(1))[0]
+    by_status = _grouped(result["byStatus"])
+    open_groups = [by_status.get(s, {"count": 0, "total": 0}) for s in OPEN_INVOICE_STATUSES]
+    return {
+        "total": sum(group["count"] for group in by_status.values()),
+        "byStatus": by_status,
+        "revenue": {
+            "total": round(sum(group["total"] for group in by_status.values()), 2),
+            **{name: _series(result[name]) for name in PERIODS},
+        },
+        "openReceivables": {
+            "count": sum(group["count"] for group in open_groups),
+            "total": round(sum(group["total"] for group in open_groups), 2),
+        },
+    }
+
+async def _customer_stats() -> dict:
+    total, active = await asyncio.gather(
+        db.customers.estimated_document_count(),
+        db.customers.count_documents({"active": True}),
+    )
+    return {"total": total, "active": active}
+
+@router.get("/overview")
+async def get_overview(current_user: dict = Depends(get_current_user)):
+    """Dashboard statistics computed server-side"""
+    overview = overview_cache.get("overview")
+    if overview is not None:
+        return overview
+
+    now = datetime.utcnow()
+    offers, invoices, customers = await asyncio.gather(
+        _offer_stats(now),
+        _invoice_stats(now),
+        _customer_stats(),
+    )
+    overview = {
+        "offers": offers,
+        "invoices": invoices,
+        "customers": customers,
+        "generatedAt": now,
+    }
+    overview_cache.set("overview", overview)
+
+    return overview
+
+# Rollup group keys: calendar periods are prefixes of the stored YYYY-MM-DD day
+ROLLUP_GROUPS = {
+    "day": {"period": "$_id.day"},
+    "month": {"period": {"$substrCP": ["$_id.day", 0, 7]}},
+    "year": {"period": {"$substrCP": ["$_id.day", 0, 4]}},
+    "category": {"category": "$_id.category"},
+    "status": {"status": "$_id.status"},
+}
+
+@router.get("/rollups", response_model=List[RollupRow])
+async def get_rollups(
+    kind: str = Query(default="offer", pattern="^(offer|invoice)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: List[str] = Query(default=["month"]),
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Revenue and pipeline report read from the incremental rollups"""
+    unknown = [group for group in group_by if group not in ROLLUP_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(unknown)}")
+    
+    match = {"_id.kind": kind}
+    if start or end:
+        match["_id.day"] = {}
+        if start:
+            match["_id.day"]["$gte"] = start.isoformat()
+        if end:
+            match["_id.day"]["$lte"] = end.isoformat()
+    if category:
+        match["_id.category"] = category
+    if status:
+        match["_id.status"] = status
+    
+    group_id = {}
+    for group in group_by:
+        group_id.update(ROLLUP_GROUPS[group])
+    
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": group_id, "count": {"$sum": "$count"}, "amount": {"$sum": "$amount"}}},
+        {"$sort": {"_id": 1}},
+    ]
+    rows = await db[ROLLUP_COLLECTION].aggregate(pipeline).to_list(None)
+    
+    return [RollupRow(**row["_id"], count=row["count"], amount=round(row["amount"], 2)) for row in rows]
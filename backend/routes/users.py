@@ -0,0 +1,122 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.user import User, UserCreate, UserResponse, UserUpdate
+from utils.auth import get_password_hash_async
+from .auth import get_current_user, invalidate_cached_user, revoke_user_tokens
+
+router = APIRouter(prefix="/users", tags=["Users"])
+
+from ..server import db
+
+# Changing any of these makes the user's outstanding tokens lie about them
+TOKEN_FIELDS = {"passwordHash", "role", "active"}
+
+async def _ensure_admin_remains(user_id: ObjectId, current_user: dict):
+    """Refuse edits that would leave nobody able to administrate users"""
+    others = await db.users.count_documents({"_id": {"$ne": user_id}, "role": "admin", "active": {"$ne": False}})
+    if others == 0:
+        raise HTTPException(status_code=409, detail="At least one active admin must remain")
+    if user_id == current_user["_id"]:
+        raise HTTPException(status_code=400, detail="You cannot disable, demote or delete your own account")
+
+def _user_response(user: dict) -> UserResponse:
+    return UserResponse(
+        id=str(user["_id"]),
+        username=user["username"],
+        email=user["email"],
+        name=user["name"],
+        role=user["role"],
+        active=user.get("active", True)
+    )
+
+@router.get("", response_model=List[UserResponse])
+async def list_users(current_user: dict = Depends(get_current_user)):
+    """List users (admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    users = await db.users.find({}, {"passwordHash": 0}).sort("username", 1).to_list(1000)
+    return [_user_response(user) for user in users]
+
+@router.post("", response_model=UserResponse)
+async def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)):
+    """Create user (admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    user_dict = User(
+        username=user.username,
+        email=user.email,
+        passwordHash=await get_password_hash_async(user.password),
+        name=user.name,
+        role=user.role
+    ).dict(exclude={"id"})
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Username already exists")
+    
+    user_dict["_id"] = result.inserted_id
+    return _user_response(user_dict)
+
+@router.put("/{user_id}", response_model=UserResponse)
+async def update_user(user_id: str, user: UserUpdate, current_user: dict = Depends(get_current_user)):
+    """Update user (admin only); disabling, demoting or a new password logs the user out everywhere.
+
+    Admins cannot disable or demote themselves, nor the last active admin.
+    """
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        object_id = ObjectId(user_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    
+    update_data = user.dict(exclude_unset=True, exclude_none=True)
+    if update_data.get("role", "admin") != "admin" or update_data.get("active") is False:
+        await _ensure_admin_remains(object_id, current_user)
+    password = update_data.pop("password", None)
+    if password is not None:
+        update_data["passwordHash"] = await get_password_hash_async(password)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    
+    before = await db.users.find_one_and_update(
+        {"_id": object_id},
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
+    )
+    
+    if before is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if any(field in TOKEN_FIELDS and before.get(field) != value for field, value in update_data.items()):
+        await revoke_user_tokens(before["username"])
+    else:
+        invalidate_cached_user(before["username"])
+    return _user_response({**before, **update_data})
+
+@router.delete("/{user_id}")
+async def delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete user (admin only); not your own account nor the last active admin"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        object_id = ObjectId(user_id)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    
+    await _ensure_admin_remains(object_id, current_user)
+    user = await db.users.find_one_and_delete({"_id": object_id})
+    
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await revoke_user_tokens(user["username"])
+    return {"message": "User deleted successfully"}
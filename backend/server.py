@@ -6,7 +6,9 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from utils.auth import get_password_hash
+from utils.auth import get_password_hash_async
+from utils.indexes import ensure_indexes
+from utils.responses import FastJSONResponse
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -30,22 +32,28 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[db_name]
 
 # Create the main app without a prefix
-app = FastAPI(title="Multi-Service Offerte System", version="2.0.0")
+app = FastAPI(title="Multi-Service Offerte System", version="2.0.0", default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Import routes after db is created
-from .routes import auth, settings, categories, services, offers, customers, invoices
+from .routes import auth, settings, categories, services, offers, customers, invoices, stats, pdf, emails, search, capacity, users
 
 # Include all route modules
 api_router.include_router(auth.router)
+api_router.include_router(users.router)
 api_router.include_router(settings.router)
 api_router.include_router(categories.router)
 api_router.include_router(services.router)
 api_router.include_router(offers.router)
 api_router.include_router(customers.router)
 api_router.include_router(invoices.router)
+api_router.include_router(stats.router)
+api_router.include_router(pdf.router)
+api_router.include_router(emails.router)
+api_router.include_router(search.router)
+api_router.include_router(capacity.router)
 
 # Health check endpoint
 @api_router.get("/")
@@ -58,6 +66,8 @@ app.include_router(api_router)
 # Serve uploaded files
 UPLOAD_DIR = ROOT_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Mounted first: the more specific prefix has to win over /uploads
+app.mount(pdf.PDF_URL_PREFIX, StaticFiles(directory=str(pdf.PDF_DIR)), name="pdfs")
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
 app.add_middleware(
@@ -88,7 +98,7 @@ async def ensure_default_admin_user():
     admin_user = {
         "username": DEFAULT_ADMIN_USERNAME,
         "email": DEFAULT_ADMIN_EMAIL,
-        "passwordHash": get_password_hash(DEFAULT_ADMIN_PASSWORD),
+        "passwordHash": await get_password_hash_async(DEFAULT_ADMIN_PASSWORD),
         "name": "Administrator",
         "role": "admin",
         "active": True
@@ -98,8 +108,16 @@ async def ensure_default_admin_user():
 
 @app.on_event("startup")
 async def startup_event():
+    await ensure_indexes(db)
     await ensure_default_admin_user()
+    settings.settings_cache.start_watching()
+    categories.catalog.version_cache.start_watching()
+    emails.mail_queue.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await settings.settings_cache.stop_watching()
+    await categories.catalog.version_cache.stop_watching()
+    await emails.mail_queue.stop()
+    pdf.shutdown_pool()
     client.close()
@@ -0,0 +1,208 @@
+from datetime import datetime
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Type
+import csv
+import io
+import os
+import time
+
+import orjson
+
+from models.customer import CustomerCreate
+from models.offer import OfferCreate
+from utils.counters import number_allocator
+from utils.rollups import apply_rollup_inserts, offer_contribution
+from utils.search import SEARCH_TARGETS
+
+# Rows validated and written per insert_many round trip
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Only the first errors are listed in the report; the rest are counted
+MAX_REPORTED_ERRORS = 1000
+
+class ImportTarget:
+    """How rows of one kind are validated, numbered and stored"""
+
+    def __init__(
+        self,
+        collection: str,
+        model: Type[BaseModel],
+        number_field: str,
+        defaults: Dict[str, Any],
+        after_insert: Optional[Callable] = None
+    ):
+        self.collection = collection
+        self.model = model
+        self.number_field = number_field
+        self.defaults = defaults
+        self.after_insert = after_insert
+
+async def _offers_inserted(db, docs: List[dict]):
+    await apply_rollup_inserts(db, offer_contribution, docs)
+
+IMPORT_TARGETS = {
+    "customers": ImportTarget("customers", CustomerCreate, "customerNumber", {"active": True}),
+    "offers": ImportTarget("offers", OfferCreate, "offerNumber", {"status": "draft"}, after_insert=_offers_inserted),
+}
+
+def _unflatten(row: Dict[str, str]) -> dict:
+    """CSV row with dotted headers (as written by the export) to a nested document"""
+    doc: dict = {}
+    for column, value in row.items():
+        if column is None or value is None or value == "":
+            continue
+        if value[0] in "[{":
+            try:
+                value = orjson.loads(value)
+            except orjson.JSONDecodeError:
+                pass
+        parent = doc
+        *path, leaf = column.split(".")
+        for part in path:
+            parent = parent.setdefault(part, {})
+        parent[leaf] = value
+    return doc
+
+def read_rows(stream: TextIO, file_format: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, row) pairs; rows that cannot be parsed are yielded as exceptions"""
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, _unflatten(row)
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield line_number, ValueError(f"Invalid JSON: {exc}")
+            continue
+        if not isinstance(row, dict):
+            row = ValueError("Expected a JSON object")
+        yield line_number, row
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _validation_messages(exc: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()]
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self._started = time.perf_counter()
+
+    def error(self, line: int, messages: List[str]):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": messages})
+
+    def as_dict(self) -> dict:
+        seconds = time.perf_counter() - self._started
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+            "seconds": round(seconds, 3),
+            "rowsPerSecond": round(self.received / seconds) if seconds > 0 else None,
+        }
+
+async def import_rows(
+    db,
+    kind: str,
+    rows: Iterable[Tuple[int, Any]],
+    created_by: Optional[str] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE
+) -> dict:
+    """Validate and insert rows in chunks; bad rows are reported, never abort the import.
+
+    Each chunk is validated as a whole, takes the business numbers it needs
+    in one counter round trip and is written with one unordered
+    `insert_many`, so a duplicate or invalid row only loses itself.
+    """
+    target = IMPORT_TARGETS[kind]
+    collection = db[target.collection]
+    numbers = number_allocator(db, target.number_field)
+    report = ImportReport()
+
+    for chunk in _chunks(rows, chunk_size):
+        report.received += len(chunk)
+        docs: List[dict] = []
+        lines: List[int] = []
+        now = datetime.utcnow()
+
+        for line, row in chunk:
+            if isinstance(row, Exception):
+                report.error(line, [str(row)])
+                continue
+            # Numbers from the old system are kept; rows without one get a fresh number below
+            number = row.get(target.number_field)
+            number = str(number) if number not in (None, "") else None
+            try:
+                doc = target.model(**{**row, target.number_field: number or ""}).dict()
+            except ValidationError as exc:
+                report.error(line, _validation_messages(exc))
+                continue
+            doc[target.number_field] = number
+            doc.update(target.defaults)
+            doc["createdBy"] = created_by
+            doc["createdAt"] = now
+            doc["updatedAt"] = now
+            docs.append(doc)
+            lines.append(line)
+
+        if not docs:
+            continue
+
+        await numbers.advance_past(doc[target.number_field] for doc in docs if doc[target.number_field])
+        missing = [doc for doc in docs if not doc[target.number_field]]
+        for doc, number in zip(missing, await numbers.reserve(len(missing))):
+            doc[target.number_field] = number
+        search_target = SEARCH_TARGETS.get(target.collection)
+        if search_target is not None:
+            for doc in docs:
+                doc["searchKeys"] = search_target.keys(doc)
+        if target.collection == "customers":
+            for doc in docs:
+                doc["emailLower"] = doc["email"].lower()
+
+        failed_indexes = set()
+        try:
+            result = await collection.insert_many(docs, ordered=False)
+            report.inserted += len(result.inserted_ids)
+        except BulkWriteError as exc:
+            report.inserted += exc.details.get("nInserted", 0)
+            for write_error in exc.details.get("writeErrors", []):
+                failed_indexes.add(write_error["index"])
+                report.error(lines[write_error["index"]], [write_error.get("errmsg", "Write failed")])
+
+        if target.after_insert is not None:
+            await target.after_insert(db, [doc for index, doc in enumerate(docs) if index not in failed_indexes])
+
+    return report.as_dict()
+
+async def import_file(db, kind: str, binary_file: BinaryIO, file_format: str, created_by: Optional[str] = None) -> dict:
+    """Import an uploaded or local NDJSON/CSV file (UTF-8, with or without BOM)"""
+    stream = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        return await import_rows(db, kind, read_rows(stream, file_format), created_by=created_by)
+    finally:
+        # Leave closing the underlying file to its owner
+        stream.detach()
+
+def guess_format(filename: Optional[str]) -> str:
+    return "csv" if (filename or "").lower().endswith(".csv") else "ndjson"
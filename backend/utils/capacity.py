@@ -0,0 +1,170 @@
+from datetime import date, datetime, timedelta
+from pymongo import UpdateOne
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+
+CAPACITY_COLLECTION = "capacity_days"
+
+# What the company can put on the road per slot; override per deployment
+CAPACITY_WORKERS = int(os.getenv("CAPACITY_WORKERS", "10"))
+CAPACITY_TRUCKS = int(os.getenv("CAPACITY_TRUCKS", "4"))
+# Days no job is taken on (Monday = 0); Sundays by default
+CLOSED_WEEKDAYS = {int(day) for day in os.getenv("CAPACITY_CLOSED_WEEKDAYS", "6").split(",") if day.strip()}
+
+DAY_MINUTES = 24 * 60
+_midday_hours, _midday_minutes = os.getenv("CAPACITY_MIDDAY", "12:00").split(":")
+MIDDAY = int(_midday_hours) * 60 + int(_midday_minutes)
+# (name, first minute, end minute) of every slot of a day
+SLOTS = (("am", 0, MIDDAY), ("pm", MIDDAY, DAY_MINUTES))
+SLOT_NAMES = [name for name, _, _ in SLOTS]
+
+# Only accepted offers hold crews and trucks
+BOOKED_STATUSES = ["accepted"]
+
+# Fields a write must return so its capacity delta can be computed
+OFFER_CAPACITY_FIELDS = {"status": 1, "serviceDetails": 1, "pricing.hours": 1}
+
+def _day(value: Optional[str]) -> Optional[str]:
+    """ISO day of "2025-01-25" or "25.01.2025"; None for anything else"""
+    value = (value or "").strip()
+    for pattern in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, pattern).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def _minutes(value: Optional[str]) -> Optional[int]:
+    try:
+        hours, minutes = (value or "").split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+def _slots(start: Optional[int], hours: Optional[float]) -> List[str]:
+    """Slots a job touches; an unknown start blocks the whole day, an unknown length the rest of it"""
+    if start is None:
+        return list(SLOT_NAMES)
+    end = start + hours * 60 if hours else DAY_MINUTES
+    return [name for name, slot_start, slot_end in SLOTS if start < slot_end and end > slot_start]
+
+def offer_bookings(offer: Optional[dict]) -> List[Tuple[str, str, int, int]]:
+    """(day, slot, workers, trucks) an offer holds in the capacity calendar"""
+    if not offer or offer.get("status") not in BOOKED_STATUSES:
+        return []
+    details = offer.get("serviceDetails") or {}
+    workers = int(details.get("workers") or 0)
+    trucks = int(details.get("trucks") or 0)
+
+    bookings = []
+    moving_day = _day(details.get("movingDate"))
+    if moving_day:
+        hours = (offer.get("pricing") or {}).get("hours")
+        for slot in _slots(_minutes(details.get("startTime")), hours):
+            bookings.append((moving_day, slot, workers, trucks))
+    cleaning_day = _day(details.get("cleaningDate"))
+    if cleaning_day:
+        # Cleaning takes the crew but no truck, for the rest of its day
+        for slot in _slots(_minutes(details.get("cleaningStartTime")), None):
+            bookings.append((cleaning_day, slot, workers, 0))
+    return bookings
+
+def _add_usage(usage: Dict[str, Dict[str, list]], bookings: Iterable[Tuple[str, str, int, int]], sign: int):
+    for day, slot, workers, trucks in bookings:
+        used = usage.setdefault(day, {}).setdefault(slot, [0, 0])
+        used[0] += sign * workers
+        used[1] += sign * trucks
+
+async def apply_capacity_changes(db, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]):
+    """Move the bookings of offers from their (before, after) states with one write per affected day"""
+    usage: Dict[str, Dict[str, list]] = {}
+    for before, after in changes:
+        _add_usage(usage, offer_bookings(before), -1)
+        _add_usage(usage, offer_bookings(after), 1)
+
+    now = datetime.utcnow()
+    operations = []
+    for day, slots in usage.items():
+        increments = {}
+        for slot, (workers, trucks) in slots.items():
+            if workers:
+                increments[f"{slot}.workers"] = workers
+            if trucks:
+                increments[f"{slot}.trucks"] = trucks
+        if increments:
+            operations.append(UpdateOne({"_id": day}, {"$inc": increments, "$set": {"updatedAt": now}}, upsert=True))
+    if operations:
+        await db[CAPACITY_COLLECTION].bulk_write(operations, ordered=False)
+
+async def apply_capacity_change(db, before: Optional[dict], after: Optional[dict]):
+    await apply_capacity_changes(db, [(before, after)])
+
+async def available_days(db, workers: int, trucks: int, start: date, days: int, slot: Optional[str] = None) -> List[dict]:
+    """Open days from `start` on with enough free crews and trucks in `slot` (every slot if None).
+
+    One range read over at most `days` small documents; the rest is
+    arithmetic.
+    """
+    end = start + timedelta(days=days - 1)
+    query = {"_id": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+    usage = {doc["_id"]: doc async for doc in db[CAPACITY_COLLECTION].find(query)}
+    needed = [slot] if slot else SLOT_NAMES
+
+    result = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if day.weekday() in CLOSED_WEEKDAYS:
+            continue
+        used = usage.get(day.isoformat(), {})
+        free = {
+            name: {
+                "workers": CAPACITY_WORKERS - (used.get(name) or {}).get("workers", 0),
+                "trucks": CAPACITY_TRUCKS - (used.get(name) or {}).get("trucks", 0),
+            }
+            for name in SLOT_NAMES
+        }
+        if all(free[name]["workers"] >= workers and free[name]["trucks"] >= trucks for name in needed):
+            result.append({"date": day.isoformat(), "free": free})
+    return result
+
+async def _recompute(db) -> Dict[str, Dict[str, list]]:
+    usage: Dict[str, Dict[str, list]] = {}
+    async for offer in db.offers.find({"status": {"$in": BOOKED_STATUSES}}, OFFER_CAPACITY_FIELDS):
+        _add_usage(usage, offer_bookings(offer), 1)
+    return usage
+
+async def verify_capacity(db) -> list:
+    """Compare the incremental calendar with a recomputation from offers; returns the differences"""
+    expected = await _recompute(db)
+    actual = {doc.pop("_id"): doc async for doc in db[CAPACITY_COLLECTION].find({}, {"updatedAt": 0})}
+
+    differences = []
+    for day in sorted(expected.keys() | actual.keys()):
+        for slot in SLOT_NAMES:
+            want = (expected.get(day) or {}).get(slot, [0, 0])
+            have = (actual.get(day) or {}).get(slot) or {}
+            if want != [have.get("workers", 0), have.get("trucks", 0)]:
+                differences.append({
+                    "day": day,
+                    "slot": slot,
+                    "expected": {"workers": want[0], "trucks": want[1]},
+                    "actual": {"workers": have.get("workers", 0), "trucks": have.get("trucks", 0)},
+                })
+    return differences
+
+async def rebuild_capacity(db) -> int:
+    """Recompute the calendar from accepted offers, atomically replacing it; returns the number of days booked"""
+    usage = await _recompute(db)
+    now = datetime.utcnow()
+    docs = [
+        {"_id": day, **{slot: {"workers": workers, "trucks": trucks} for slot, (workers, trucks) in slots.items()}, "updatedAt": now}
+        for day, slots in usage.items()
+    ]
+    if not docs:
+        await db[CAPACITY_COLLECTION].delete_many({})
+        return 0
+    staging = db[f"{CAPACITY_COLLECTION}_rebuild"]
+    await staging.drop()
+    await staging.insert_many(docs)
+    await staging.rename(CAPACITY_COLLECTION, dropTarget=True)
+    return len(docs)
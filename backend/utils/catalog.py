@@ -0,0 +1,114 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+
+from models.additional_service import AdditionalService
+from models.service_category import ServiceCategory
+from utils.responses import dumps
+from utils.versioned_cache import BUMP_VERSION, VersionedDocumentCache
+
+CATALOG_VERSION_ID = "catalog"
+
+def _localize(doc: dict, language: Optional[str]) -> dict:
+    """Reduce the translated fields of a catalog entry to one language"""
+    if not language:
+        return doc
+    doc = dict(doc)
+    for field in ("name", "description"):
+        texts = doc.get(field) or {}
+        text = texts.get(language) or texts.get("de") or next(iter(texts.values()), "")
+        doc[field] = {language: text}
+    return doc
+
+def _serialize(rows: List[dict]) -> Tuple[str, bytes]:
+    body = dumps(rows)
+    return f'"{hashlib.sha1(body).hexdigest()}"', body
+
+class CatalogSnapshot:
+    """Versioned, pre-serialized view of service categories and additional services.
+
+    The catalog is loaded and validated once per version. Each distinct
+    (kind, category, language, active_only) response is serialized to JSON
+    bytes on first use, so repeated requests are a dict lookup. Any write
+    calls `bump()`, which moves the shared version forward for all workers.
+    """
+
+    def __init__(self, db, poll_interval: float = 5.0):
+        self.db = db
+        self.version_cache = VersionedDocumentCache(db.cache_versions, CATALOG_VERSION_ID, poll_interval=poll_interval)
+        self._version: Optional[int] = None
+        self._categories: List[dict] = []
+        self._services: List[dict] = []
+        self._entries: Dict[tuple, Tuple[str, bytes]] = {}
+        self._lock = asyncio.Lock()
+
+    async def _ensure_fresh(self):
+        if await self.version_cache.get() is None:
+            await self.db.cache_versions.update_one(
+                {"_id": CATALOG_VERSION_ID},
+                {"$setOnInsert": {"version": 0}},
+                upsert=True
+            )
+            self.version_cache.invalidate()
+            await self.version_cache.get()
+
+        version = self.version_cache.version
+        if version == self._version:
+            return
+        async with self._lock:
+            if version == self._version:
+                return
+            categories, services = await asyncio.gather(
+                self.db.service_categories.find().to_list(None),
+                self.db.additional_services.find().sort("order", 1).to_list(None),
+            )
+            self._categories = [
+                ServiceCategory(**doc).model_dump(by_alias=True, mode="json")
+                for doc in categories
+            ]
+            self._services = [
+                AdditionalService(**doc).model_dump(by_alias=True, mode="json")
+                for doc in services
+            ]
+            self._entries = {}
+            self._version = version
+
+    def _entry(self, key: tuple, rows: Callable[[], List[dict]], language: Optional[str]) -> Tuple[str, bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _serialize([_localize(row, language) for row in rows()])
+        return entry
+
+    async def categories(self, active_only: bool = True, language: Optional[str] = None) -> Tuple[str, bytes]:
+        """(etag, JSON body) of the category list"""
+        await self._ensure_fresh()
+        return self._entry(
+            ("categories", None, language, active_only),
+            lambda: [row for row in self._categories if row["active"] or not active_only],
+            language
+        )
+
+    async def services(
+        self,
+        category_id: Optional[str] = None,
+        active_only: bool = True,
+        language: Optional[str] = None
+    ) -> Tuple[str, bytes]:
+        """(etag, JSON body) of the additional service list, ordered by `order`"""
+        await self._ensure_fresh()
+        if category_id and not any(row["categoryId"] == category_id for row in self._services):
+            # Unknown ids are not cached so arbitrary input cannot grow the snapshot
+            return _serialize([])
+        return self._entry(
+            ("services", category_id, language, active_only),
+            lambda: [
+                row for row in self._services
+                if (row["active"] or not active_only) and (not category_id or row["categoryId"] == category_id)
+            ],
+            language
+        )
+
+    async def bump(self):
+        """Publish a catalog change to every worker"""
+        await self.db.cache_versions.update_one({"_id": CATALOG_VERSION_ID}, BUMP_VERSION, upsert=True)
+        self.version_cache.invalidate()
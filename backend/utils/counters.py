@@ -0,0 +1,131 @@
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Iterable, List, Optional, Tuple
+import asyncio
+import os
+
+# Numbers reserved per worker round-trip; 1 keeps numbering strictly sequential
+NUMBER_BLOCK_SIZE = int(os.getenv("NUMBER_BLOCK_SIZE", "1"))
+
+class NumberAllocator:
+    """Hands out sequential business numbers from the `counters` collection.
+
+    Every allocation is a single atomic `find_one_and_update($inc)`, so
+    concurrent creates can never receive the same number. With
+    `block_size > 1` each worker process reserves a whole block at once and
+    serves it from memory (numbers then stay unique but are no longer
+    strictly increasing across workers).
+    """
+
+    def __init__(
+        self,
+        counters,
+        name: str,
+        start: int,
+        width: int,
+        block_size: int = NUMBER_BLOCK_SIZE,
+        seed_collection=None,
+        seed_field: Optional[str] = None
+    ):
+        self.counters = counters
+        self.name = name
+        self.start = start
+        self.width = width
+        self.block_size = max(1, block_size)
+        self.seed_collection = seed_collection
+        self.seed_field = seed_field
+        self._next = 0
+        self._last = -1
+        self._seeded = False
+        self._lock = asyncio.Lock()
+
+    def format(self, number: int) -> str:
+        return str(number).zfill(self.width)
+
+    async def _highest_existing(self) -> int:
+        """Highest numeric value already stored in the seed collection"""
+        if self.seed_collection is None:
+            return 0
+        pipeline = [
+            {"$project": {"n": {"$convert": {
+                "input": f"${self.seed_field}", "to": "long", "onError": None, "onNull": None
+            }}}},
+            {"$group": {"_id": None, "max": {"$max": "$n"}}},
+        ]
+        result = await self.seed_collection.aggregate(pipeline).to_list(1)
+        return int(result[0]["max"] or 0) if result else 0
+
+    async def _ensure_seeded(self):
+        """Create the counter on first use, continuing after existing numbers"""
+        if self._seeded:
+            return
+        if await self.counters.find_one({"_id": self.name}, {"_id": 1}) is None:
+            seq = max(self.start - 1, await self._highest_existing())
+            try:
+                await self.counters.update_one(
+                    {"_id": self.name},
+                    {"$max": {"seq": seq}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Another worker created the counter at the same time
+                pass
+        self._seeded = True
+
+    async def _reserve_range(self, count: int) -> Tuple[int, int]:
+        await self._ensure_seeded()
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        last = counter["seq"]
+        return last - count + 1, last
+
+    async def next(self) -> str:
+        """Allocate one number"""
+        async with self._lock:
+            if self._next > self._last:
+                self._next, self._last = await self._reserve_range(self.block_size)
+            number = self._next
+            self._next += 1
+        return self.format(number)
+
+    async def reserve(self, count: int) -> List[str]:
+        """Allocate `count` consecutive numbers with a single round-trip"""
+        if count <= 0:
+            return []
+        first, last = await self._reserve_range(count)
+        return [self.format(number) for number in range(first, last + 1)]
+
+    async def advance_past(self, numbers: Iterable[str]):
+        """Make sure later allocations come after numbers that were assigned elsewhere (e.g. imported)"""
+        highest = max((int(number) for number in numbers if number.isdigit()), default=None)
+        if highest is None:
+            return
+        await self._ensure_seeded()
+        await self.counters.update_one({"_id": self.name}, {"$max": {"seq": highest}}, upsert=True)
+
+    async def peek(self) -> str:
+        """Number the next call to `next()` will most likely return (nothing is reserved)"""
+        if self._next <= self._last:
+            return self.format(self._next)
+        await self._ensure_seeded()
+        counter = await self.counters.find_one({"_id": self.name})
+        return self.format((counter or {}).get("seq", self.start - 1) + 1)
+
+# Business number sequences: counter name -> (collection holding the numbers, first number, width)
+NUMBER_SEQUENCES = {
+    "offerNumber": ("offers", 10001, 5),
+    "invoiceNumber": ("invoices", 100001, 6),
+    "customerNumber": ("customers", 10001, 5),
+}
+
+def number_allocator(db, name: str) -> NumberAllocator:
+    """Allocator for one of the NUMBER_SEQUENCES, shared by the routes and maintenance commands"""
+    collection, start, width = NUMBER_SEQUENCES[name]
+    return NumberAllocator(
+        db.counters, name, start=start, width=width,
+        seed_collection=db[collection], seed_field=name
+    )
@@ -0,0 +1,112 @@
+from datetime import date, datetime
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Any, AsyncIterator, List, Optional, Tuple, Type
+import csv
+import io
+import os
+import typing
+
+from utils.pagination import LIST_SORT
+from utils.responses import dumps
+
+# Documents fetched per round trip; also the number of rows per streamed chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """The model behind `Model` or `Optional[Model]`, if any"""
+    for candidate in (annotation, *typing.get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+def model_columns(model: Type[BaseModel], prefix: str = "") -> List[str]:
+    """CSV header for a model: nested models become dotted columns, lists stay one JSON cell"""
+    columns = []
+    for name, field in model.model_fields.items():
+        column = prefix + (field.alias or name)
+        nested = _nested_model(field.annotation)
+        if nested is not None:
+            columns.extend(model_columns(nested, column + "."))
+        else:
+            columns.append(column)
+    return columns
+
+def _cell(doc: dict, path: Tuple[str, ...]) -> Any:
+    value: Any = doc
+    for part in path:
+        if not isinstance(value, dict):
+            return ""
+        value = value.get(part)
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode()
+    return value
+
+async def _ndjson_chunks(cursor) -> AsyncIterator[bytes]:
+    rows = []
+    async for doc in cursor:
+        rows.append(dumps(doc))
+        if len(rows) >= EXPORT_BATCH_SIZE:
+            yield b"\n".join(rows) + b"\n"
+            rows = []
+    if rows:
+        yield b"\n".join(rows) + b"\n"
+
+async def _csv_chunks(cursor, columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM makes Excel read the file as UTF-8 (umlauts in names and addresses)
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    paths = [tuple(column.split(".")) for column in columns]
+    rows = 0
+    async for doc in cursor:
+        writer.writerow([_cell(doc, path) for path in paths])
+        rows += 1
+        if rows >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue().encode()
+
+def export_response(
+    collection,
+    query: dict,
+    export_format: str,
+    model: Type[BaseModel],
+    name: str,
+    projection: Optional[dict] = None
+) -> StreamingResponse:
+    """Stream every document matching `query` as NDJSON or CSV.
+
+    Documents are pulled from a single server-side cursor in batches of
+    EXPORT_BATCH_SIZE and written out as they arrive, so memory use does not
+    depend on the size of the collection.
+    """
+    cursor = collection.find(query, projection).sort(LIST_SORT).batch_size(EXPORT_BATCH_SIZE)
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            chunks = _csv_chunks(cursor, model_columns(model)) if export_format == "csv" else _ndjson_chunks(cursor)
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Also runs when the client disconnects mid-download
+            await cursor.close()
+
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{export_format}"
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,163 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Optional, TextIO, Tuple
+import csv
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Built from the official postal code lists by `manage.py postal-codes`; not shipped with the code
+POSTAL_CODES_PATH = os.getenv("POSTAL_CODES_PATH", str(Path(__file__).parent.parent / "data" / "postal_codes.bin"))
+
+# Road distance ~ straight line * factor + access stretch at both ends
+ROAD_FACTOR = float(os.getenv("ROAD_FACTOR", "1.3"))
+ROAD_ACCESS_KM = float(os.getenv("ROAD_ACCESS_KM", "1.0"))
+DISTANCE_CACHE_SIZE = int(os.getenv("DISTANCE_CACHE_SIZE", "65536"))
+
+EARTH_RADIUS_KM = 6371.0088
+
+# File layout: magic, record count, then records sorted by postal code
+_MAGIC = b"PLZ1"
+_HEADER = struct.Struct("<4sI")
+# Postal code, latitude and longitude in microdegrees: 10 bytes per code
+_RECORD = struct.Struct("<Hii")
+
+_POSTAL_CODE = re.compile(r"^(?:(?:CH|FL|LI)\s*-?\s*)?(\d{4})$", re.IGNORECASE)
+
+def normalize_postal_code(zip_code: Optional[str]) -> Optional[int]:
+    """4132 for "4132", "CH-4132" or "FL-9490"; None for anything else"""
+    match = _POSTAL_CODE.match((zip_code or "").strip())
+    return int(match.group(1)) if match else None
+
+class PostalCodeTable:
+    """Centroids of Swiss and Liechtenstein postal codes, read from a memory-mapped file.
+
+    The file is opened on the first lookup; a missing file makes every
+    lookup return None, so callers fall back to manual input.
+    """
+
+    def __init__(self, path: str = POSTAL_CODES_PATH):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "rb") as data_file:
+                    data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                logger.warning("Postal code table %s not found; distances are not estimated", self.path)
+                return
+            magic, count = _HEADER.unpack_from(data, 0) if len(data) >= _HEADER.size else (None, 0)
+            if magic != _MAGIC or len(data) != _HEADER.size + count * _RECORD.size:
+                logger.error("Postal code table %s is not a valid table; distances are not estimated", self.path)
+                data.close()
+                return
+            self._map = data
+            self._count = count
+
+    @property
+    def available(self) -> bool:
+        if not self._loaded:
+            self._load()
+        return self._map is not None
+
+    def __len__(self) -> int:
+        return self._count if self.available else 0
+
+    def centroid(self, zip_code: Optional[str]) -> Optional[Tuple[float, float]]:
+        """(latitude, longitude) of a postal code, or None if it is unknown"""
+        code = normalize_postal_code(zip_code)
+        if code is None or not self.available:
+            return None
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            found, latitude, longitude = _RECORD.unpack_from(self._map, _HEADER.size + middle * _RECORD.size)
+            if found == code:
+                return latitude / 1e6, longitude / 1e6
+            if found < code:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+postal_codes = PostalCodeTable()
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    latitude_a, longitude_a = map(math.radians, a)
+    latitude_b, longitude_b = map(math.radians, b)
+    h = (
+        math.sin((latitude_b - latitude_a) / 2) ** 2
+        + math.cos(latitude_a) * math.cos(latitude_b) * math.sin((longitude_b - longitude_a) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+# Offers repeat the same few hundred postal code pairs
+@lru_cache(maxsize=DISTANCE_CACHE_SIZE)
+def estimate_distance(from_zip: Optional[str], to_zip: Optional[str]) -> Optional[float]:
+    """Estimated road distance in km between two postal codes; None if either is unknown"""
+    origin = postal_codes.centroid(from_zip)
+    destination = postal_codes.centroid(to_zip)
+    if origin is None or destination is None:
+        return None
+    return round(haversine_km(origin, destination) * ROAD_FACTOR + ROAD_ACCESS_KM, 1)
+
+def _geonames_rows(source: TextIO) -> Iterable[Tuple[str, float, float]]:
+    """GeoNames postal code dump (CH.txt, LI.txt): tab separated, latitude/longitude in columns 10/11"""
+    for line in source:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) >= 11 and fields[9] and fields[10]:
+            yield fields[1], float(fields[9]), float(fields[10])
+
+def _swisstopo_rows(source: TextIO) -> Iterable[Tuple[str, float, float]]:
+    """swisstopo locality directory (AMTOVZ_CSV_WGS84): `;` separated with PLZ, E (longitude) and N (latitude)"""
+    for row in csv.DictReader(source, delimiter=";"):
+        if row.get("PLZ") and row.get("E") and row.get("N"):
+            yield row["PLZ"], float(row["N"]), float(row["E"])
+
+def build_postal_code_table(sources: Iterable[TextIO], path: str = POSTAL_CODES_PATH) -> int:
+    """Write the binary table from GeoNames or swisstopo files; returns the number of postal codes.
+
+    A postal code shared by several localities gets the mean of their
+    coordinates.
+    """
+    sums: Dict[int, list] = {}
+    for source in sources:
+        first_line = source.readline()
+        source.seek(0)
+        rows = _swisstopo_rows(source) if ";" in first_line and "PLZ" in first_line else _geonames_rows(source)
+        for zip_code, latitude, longitude in rows:
+            code = normalize_postal_code(zip_code)
+            if code is None:
+                continue
+            entry = sums.setdefault(code, [0.0, 0.0, 0])
+            entry[0] += latitude
+            entry[1] += longitude
+            entry[2] += 1
+    if not sums:
+        # Keep the current table rather than replacing it with an empty one
+        return 0
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as table:
+        table.write(_HEADER.pack(_MAGIC, len(sums)))
+        for code in sorted(sums):
+            latitude, longitude, count = sums[code]
+            table.write(_RECORD.pack(code, round(latitude / count * 1e6), round(longitude / count * 1e6)))
+    # Running workers keep their mapping of the old file
+    os.replace(temporary_path, path)
+    return len(sums)
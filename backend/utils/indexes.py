@@ -0,0 +1,127 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from typing import Dict, List
+import logging
+
+from utils.pagination import LIST_SORT
+from models import additional_service, customer, email_job, invoice, invoice_batch, offer, pdf_job, reprice_job, rollup, service_category, user
+
+logger = logging.getLogger(__name__)
+
+# Every model module declares the indexes of the collections it owns
+INDEX_MODULES = [additional_service, customer, email_job, invoice, invoice_batch, offer, pdf_job, reprice_job, rollup, service_category, user]
+
+# Filter + sort shapes issued by the routers; each must be answered by an index
+QUERY_SHAPES = [
+    ("offers", {}, LIST_SORT),
+    ("offers", {"status": "draft"}, LIST_SORT),
+    ("offers", {"category": "umzug"}, LIST_SORT),
+    ("offers", {"status": "draft", "category": "umzug"}, LIST_SORT),
+    ("offers", {"offerNumber": "10001"}, None),
+    ("offers", {"status": "accepted", "invoiceId": None}, [("_id", ASCENDING)]),
+    ("invoices", {}, LIST_SORT),
+    ("invoices", {"status": "draft"}, LIST_SORT),
+    ("invoices", {"customerId": "x"}, LIST_SORT),
+    ("invoices", {"status": "draft", "customerId": "x"}, LIST_SORT),
+    ("invoices", {"invoiceNumber": "100001"}, None),
+    ("invoices", {"offerId": {"$in": ["x"], "$type": "string"}}, None),
+    ("customers", {}, LIST_SORT),
+    ("customers", {"active": True}, LIST_SORT),
+    ("customers", {"customerNumber": "10001"}, None),
+    ("customers", {"emailLower": {"$in": ["anna@example.com"]}}, [("_id", 1)]),
+    ("service_categories", {"active": True}, None),
+    ("service_categories", {"categoryId": "umzug"}, None),
+    ("additional_services", {"active": True}, [("order", ASCENDING)]),
+    ("additional_services", {"categoryId": "umzug", "active": True}, [("order", ASCENDING)]),
+    ("additional_services", {"serviceId": "cleaning"}, None),
+    ("customers", {"searchKeys": {"$regex": "^mu"}}, None),
+    ("offers", {"searchKeys": {"$regex": "^mu"}}, None),
+    ("users", {"username": "admin"}, None),
+    ("offers", {"status": {"$in": ["accepted"]}}, None),
+    ("capacity_days", {"_id": {"$gte": "2026-01-01", "$lte": "2026-03-31"}}, None),
+    ("reprice_jobs", {"status": {"$in": ["queued", "running", "failed"]}}, None),
+    ("email_jobs", {"status": {"$in": ["queued", "sending"]}, "nextAttemptAt": {"$lte": 0}}, [("nextAttemptAt", ASCENDING)]),
+]
+
+def index_registry() -> Dict[str, List[IndexModel]]:
+    """Collect the declared indexes of all model modules, keyed by collection"""
+    registry: Dict[str, List[IndexModel]] = {}
+    for module in INDEX_MODULES:
+        for collection, indexes in module.INDEXES.items():
+            registry.setdefault(collection, []).extend(indexes)
+    return registry
+
+def _same_index(existing: dict, declared: dict) -> bool:
+    if "text" in declared["key"].values():
+        # Mongo reports text indexes as _fts/_ftsx keys; their fields live in `weights`
+        weights = declared.get("weights") or {field: 1 for field, kind in declared["key"].items() if kind == "text"}
+        return (
+            existing.get("weights") == weights
+            and existing.get("default_language", "english") == declared.get("default_language", "english")
+        )
+    options = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+    if [tuple(k) for k in existing["key"]] != list(declared["key"].items()):
+        return False
+    return all(existing.get(option) == declared.get(option) for option in options)
+
+async def ensure_indexes(db, drop_unknown: bool = False) -> dict:
+    """Create missing indexes and migrate changed ones; safe to run repeatedly.
+
+    Returns a report of created, rebuilt, dropped and failed index names per
+    collection. A failing index (e.g. a unique index over duplicate data) is
+    logged and reported without aborting the remaining collections.
+    """
+    report = {}
+    for collection_name, indexes in index_registry().items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        entry = {"created": [], "rebuilt": [], "dropped": [], "failed": []}
+
+        declared_names = set()
+        for index in indexes:
+            spec = index.document
+            name = spec["name"]
+            declared_names.add(name)
+            if name in existing:
+                if _same_index(existing[name], spec):
+                    continue
+                await collection.drop_index(name)
+                target = entry["rebuilt"]
+            else:
+                target = entry["created"]
+            try:
+                await collection.create_indexes([index])
+                target.append(name)
+            except OperationFailure as exc:
+                logger.error("Could not create index %s.%s: %s", collection_name, name, exc)
+                entry["failed"].append(name)
+
+        if drop_unknown:
+            for name in existing:
+                if name != "_id_" and name not in declared_names:
+                    await collection.drop_index(name)
+                    entry["dropped"].append(name)
+
+        report[collection_name] = entry
+    return report
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def find_collection_scans(db, shapes=QUERY_SHAPES) -> list:
+    """Explain every query shape and return the ones planned as a COLLSCAN"""
+    offenders = []
+    for collection_name, query, sort in shapes:
+        command = {"find": collection_name, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explain = await db.command("explain", command, verbosity="queryPlanner")
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            offenders.append({"collection": collection_name, "filter": query, "sort": sort})
+    return offenders
@@ -0,0 +1,368 @@
+from bson import ObjectId
+from datetime import date, datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+
+from models.customer import CustomerCreate
+from models.invoice import InvoiceItem
+from models.invoice_batch import InvoiceBatch
+from utils.counters import number_allocator
+from utils.rollups import apply_rollup_inserts, invoice_contribution
+from utils.search import SEARCH_TARGETS
+
+logger = logging.getLogger(__name__)
+
+# Offers invoiced per round trip (one find, one insert_many, one bulk_write)
+INVOICE_BATCH_CHUNK_SIZE = int(os.getenv("INVOICE_BATCH_CHUNK_SIZE", "500"))
+INVOICE_PAYMENT_DAYS = int(os.getenv("INVOICE_PAYMENT_DAYS", "30"))
+# Only the first errors are kept on the batch document; the rest are counted
+MAX_BATCH_ERRORS = 1000
+# A running batch whose progress is older than this lost its runner and may be resumed
+INVOICE_BATCH_LEASE_SECONDS = float(os.getenv("INVOICE_BATCH_LEASE_SECONDS", "300"))
+RESUMABLE_STATUSES = ["queued", "failed"]
+
+DUPLICATE_KEY = 11000
+
+OFFER_INVOICE_FIELDS = {
+    "offerNumber": 1,
+    "customerId": 1,
+    "customer": 1,
+    "currentLocation": 1,
+    "category": 1,
+    "language": 1,
+    "additionalServices": 1,
+    "pricing": 1,
+}
+
+def as_midnight(day: date) -> datetime:
+    """Store a calendar day as BSON can: the datetime at its midnight"""
+    return datetime.combine(day, datetime.min.time())
+
+def _text(texts: Optional[dict], language: str, fallback: str) -> str:
+    texts = texts or {}
+    return texts.get(language) or texts.get("de") or fallback
+
+def offer_invoice_items(offer: dict, category_names: Dict[str, dict], service_names: Dict[str, dict]) -> Tuple[List[dict], float]:
+    """Invoice items and tax rate for an offer, priced exactly as the customer accepted it.
+
+    The base price and every selected additional service become one item
+    each; a discount becomes a negative item, so the items add up to the
+    discounted subtotal the offer's tax was computed on.
+    """
+    pricing = offer.get("pricing") or {}
+    language = offer.get("language") or "de"
+    category = offer.get("category") or ""
+
+    items = []
+    base_price = float(pricing.get("basePrice") or 0)
+    items.append(InvoiceItem(
+        description=f"{_text(category_names.get(category), language, category)} (Offerte {offer.get('offerNumber', '')})",
+        unitPrice=base_price,
+        total=base_price
+    ))
+    for service in offer.get("additionalServices") or []:
+        if not service.get("selected"):
+            continue
+        price = float(service.get("price") or 0)
+        name = _text(service_names.get(service.get("serviceId")), language, service.get("serviceId") or "")
+        items.append(InvoiceItem(description=name, unitPrice=price, total=price))
+
+    subtotal = sum(item.total for item in items)
+    discount = float(pricing.get("discount") or 0)
+    if discount > 0:
+        if pricing.get("discountType", "percentage") == "percentage":
+            amount = subtotal * (discount / 100)
+            description = f"Rabatt {discount:g}%"
+        else:
+            amount = discount
+            description = "Rabatt"
+        items.append(InvoiceItem(description=description, unitPrice=-amount, total=-amount))
+
+    tax_rate = float(pricing.get("taxRate") or 0) if pricing.get("includeTax") else 0.0
+    return [item.dict() for item in items], tax_rate
+
+def invoice_from_offer(
+    offer: dict,
+    category_names: Dict[str, dict],
+    service_names: Dict[str, dict],
+    invoice_date: datetime,
+    created_by: Optional[str] = None
+) -> dict:
+    """Invoice document (without number) for an accepted offer"""
+    items, tax_rate = offer_invoice_items(offer, category_names, service_names)
+    subtotal = sum(item["total"] for item in items)
+    tax_amount = subtotal * (tax_rate / 100)
+    now = datetime.utcnow()
+    return {
+        "offerId": str(offer["_id"]),
+        "customerId": offer["customerId"],
+        # BSON has no date type; midnight datetimes still validate as `date`
+        "invoiceDate": invoice_date,
+        "dueDate": invoice_date + timedelta(days=INVOICE_PAYMENT_DAYS),
+        "status": "draft",
+        "items": items,
+        "subtotal": subtotal,
+        "taxRate": tax_rate,
+        "taxAmount": tax_amount,
+        "total": subtotal + tax_amount,
+        "currency": (offer.get("pricing") or {}).get("currency") or "CHF",
+        "qrBill": None,
+        "notes": None,
+        "createdBy": created_by,
+        "createdAt": now,
+        "updatedAt": now,
+        "version": 0,
+    }
+
+def invoice_update_pipeline(update_data: dict) -> list:
+    """Update pipeline applying an InvoiceUpdate in one round trip.
+
+    New items are summed here; their tax is computed by the server from
+    the stored `taxRate`, and every write bumps `version`.
+    """
+    fields = {key: {"$literal": value} for key, value in update_data.items()}
+    pipeline = [{"$set": {**fields, "updatedAt": "$$NOW", "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}}]
+    if "items" in update_data:
+        subtotal = sum(item["total"] for item in update_data["items"])
+        pipeline.append({"$set": {
+            "subtotal": {"$literal": subtotal},
+            "taxAmount": {"$multiply": [subtotal, {"$divide": [{"$ifNull": ["$taxRate", 7.7]}, 100]}]},
+        }})
+        pipeline.append({"$set": {"total": {"$add": [subtotal, "$taxAmount"]}}})
+    return pipeline
+
+def invoice_after_update(before: dict, update_data: dict) -> dict:
+    """Fields of `before` as `invoice_update_pipeline(update_data)` leaves them"""
+    after = {**before, **update_data, "version": before.get("version", 0) + 1}
+    if "items" in update_data:
+        subtotal = sum(item["total"] for item in update_data["items"])
+        after["subtotal"] = subtotal
+        after["taxAmount"] = subtotal * (before.get("taxRate", 7.7) / 100)
+        after["total"] = subtotal + after["taxAmount"]
+    return after
+
+async def _catalog_names(db) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    categories = {doc["categoryId"]: doc.get("name") async for doc in db.service_categories.find({}, {"categoryId": 1, "name": 1})}
+    services = {doc["serviceId"]: doc.get("name") async for doc in db.additional_services.find({}, {"serviceId": 1, "name": 1})}
+    return categories, services
+
+async def _existing_invoices(db, offer_ids: List[str]) -> Dict[str, ObjectId]:
+    invoices = db.invoices.find({"offerId": {"$in": offer_ids, "$type": "string"}}, {"offerId": 1})
+    return {invoice["offerId"]: invoice["_id"] async for invoice in invoices}
+
+def _customer_from_offer(offer: dict) -> Optional[dict]:
+    """Customer document (without number) for the person an offer embeds; None if it is incomplete"""
+    customer = offer.get("customer") or {}
+    location = offer.get("currentLocation") or {}
+    try:
+        doc = CustomerCreate(
+            salutation=customer.get("salutation"),
+            firstName=customer.get("firstName"),
+            lastName=customer.get("lastName"),
+            email=customer.get("email"),
+            phone=customer.get("phone"),
+            address={"street": location.get("street"), "zipCode": location.get("zipCode"), "city": location.get("city")},
+        ).dict()
+    except ValidationError:
+        return None
+    return doc
+
+async def _link_customers(db, offers: List[dict], created_by: Optional[str]) -> Dict[str, str]:
+    """Set `customerId` on offers that only embed their customer; returns offer id -> customer id.
+
+    Customers are matched by `emailLower`, so case is ignored. Those not
+    found are created from the offer (moving-from address) with one number
+    block and one insert_many, so a chunk costs at most two extra round trips.
+    """
+    unlinked = {}
+    for offer in offers:
+        email = ((offer.get("customer") or {}).get("email") or "").strip()
+        if not offer.get("customerId") and email:
+            unlinked[str(offer["_id"])] = (offer, email.lower())
+    if not unlinked:
+        return {}
+
+    emails = list({email for _, email in unlinked.values()})
+    known = {}
+    async for customer in db.customers.find({"emailLower": {"$in": emails}}, {"emailLower": 1}).sort("_id", 1):
+        known.setdefault(customer["emailLower"], str(customer["_id"]))
+
+    new_customers = {}
+    for offer, email in unlinked.values():
+        if email not in known and email not in new_customers:
+            customer = _customer_from_offer(offer)
+            if customer is not None:
+                new_customers[email] = customer
+    if new_customers:
+        now = datetime.utcnow()
+        numbers = await number_allocator(db, "customerNumber").reserve(len(new_customers))
+        for customer, number in zip(new_customers.values(), numbers):
+            customer.update({"customerNumber": number, "active": True, "createdBy": created_by, "createdAt": now, "updatedAt": now})
+            customer["emailLower"] = customer["email"].lower()
+            customer["searchKeys"] = SEARCH_TARGETS["customers"].keys(customer)
+        await db.customers.insert_many(list(new_customers.values()))
+        known.update((email, str(customer["_id"])) for email, customer in new_customers.items())
+
+    linked = {}
+    for offer_id, (offer, email) in unlinked.items():
+        if email in known:
+            offer["customerId"] = linked[offer_id] = known[email]
+    return linked
+
+class _ChunkResult:
+    def __init__(self):
+        self.created = 0
+        self.already_invoiced = 0
+        self.errors: List[dict] = []
+
+async def _invoice_chunk(
+    db,
+    offers: List[dict],
+    names: Tuple[Dict[str, dict], Dict[str, dict]],
+    invoice_date: datetime,
+    created_by: Optional[str]
+) -> _ChunkResult:
+    """Invoice one chunk of offers: one number block, one insert_many, one bulk_write.
+
+    Offers that already have an invoice (left behind by an interrupted run)
+    are only linked, never billed again; the unique `offerId` index catches
+    a concurrent run that got there first. Offers without a `customerId`
+    are billed to the customer with their email, created if need be.
+    """
+    result = _ChunkResult()
+    offer_ids = [str(offer["_id"]) for offer in offers]
+    invoice_ids = await _existing_invoices(db, offer_ids)
+    result.already_invoiced = len(invoice_ids)
+    linked = await _link_customers(db, [offer for offer in offers if str(offer["_id"]) not in invoice_ids], created_by)
+
+    docs = []
+    for offer in offers:
+        if str(offer["_id"]) in invoice_ids:
+            continue
+        if not offer.get("customerId"):
+            result.errors.append({"offerId": str(offer["_id"]), "offerNumber": offer.get("offerNumber"), "error": "Offer has no customer"})
+            continue
+        docs.append(invoice_from_offer(offer, *names, invoice_date, created_by))
+
+    if docs:
+        numbers = await number_allocator(db, "invoiceNumber").reserve(len(docs))
+        for doc, number in zip(docs, numbers):
+            doc["invoiceNumber"] = number
+
+        failed_indexes = set()
+        raced = []
+        try:
+            await db.invoices.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            for write_error in exc.details.get("writeErrors", []):
+                doc = docs[write_error["index"]]
+                failed_indexes.add(write_error["index"])
+                if write_error.get("code") == DUPLICATE_KEY and "offerId" in (write_error.get("keyPattern") or {}):
+                    raced.append(doc["offerId"])
+                else:
+                    result.errors.append({"offerId": doc["offerId"], "error": write_error.get("errmsg", "Write failed")})
+
+        inserted = [doc for index, doc in enumerate(docs) if index not in failed_indexes]
+        result.created = len(inserted)
+        invoice_ids.update((doc["offerId"], doc["_id"]) for doc in inserted)
+        if raced:
+            raced_ids = await _existing_invoices(db, raced)
+            result.already_invoiced += len(raced_ids)
+            invoice_ids.update(raced_ids)
+        await apply_rollup_inserts(db, invoice_contribution, inserted)
+
+    if invoice_ids:
+        now = datetime.utcnow()
+        await db.offers.bulk_write([
+            UpdateOne(
+                {"_id": ObjectId(offer_id), "invoiceId": None},
+                {"$set": {
+                    "invoiceId": str(invoice_id),
+                    "invoicedAt": now,
+                    "updatedAt": now,
+                    **({"customerId": linked[offer_id]} if offer_id in linked else {}),
+                }}
+            )
+            for offer_id, invoice_id in invoice_ids.items()
+        ], ordered=False)
+    return result
+
+async def create_invoice_batch(db, created_by: Optional[str] = None) -> ObjectId:
+    batch = InvoiceBatch(createdBy=created_by).dict(exclude={"id"})
+    result = await db.invoice_batches.insert_one(batch)
+    return result.inserted_id
+
+async def claim_invoice_batch(db, batch_id: ObjectId) -> Optional[dict]:
+    """Mark a batch as running for one runner; None if it is done or another runner holds it.
+
+    Two runners of one batch would both `$inc` its counters and push the
+    same errors, so the claim is atomic and carries a `runId` that every
+    progress write must match.
+    """
+    now = datetime.utcnow()
+    return await db.invoice_batches.find_one_and_update(
+        {"_id": batch_id, "$or": [
+            {"status": {"$in": RESUMABLE_STATUSES}},
+            {"status": "running", "updatedAt": {"$lt": now - timedelta(seconds=INVOICE_BATCH_LEASE_SECONDS)}},
+        ]},
+        {"$set": {"status": "running", "runId": str(ObjectId()), "error": None, "updatedAt": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_invoice_batch(db, batch: dict, chunk_size: int = INVOICE_BATCH_CHUNK_SIZE) -> dict:
+    """Invoice every accepted offer that has none yet, chunk by chunk in `_id` order.
+
+    `batch` is the document returned by `claim_invoice_batch`. Progress is
+    saved on it after every chunk, so a run that died is resumed from its
+    last offer by claiming it again. Re-running a finished batch finds
+    nothing left to do.
+    """
+    batch_id = batch["_id"]
+    owned = {"_id": batch_id, "runId": batch["runId"]}
+    try:
+        names = await _catalog_names(db)
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        errors_kept = len(batch.get("errors") or [])
+        last_offer_id = batch.get("lastOfferId")
+
+        while True:
+            query = {"status": "accepted", "invoiceId": None}
+            if last_offer_id:
+                query["_id"] = {"$gt": ObjectId(last_offer_id)}
+            offers = await db.offers.find(query, OFFER_INVOICE_FIELDS).sort("_id", 1).limit(chunk_size).to_list(chunk_size)
+            if not offers:
+                break
+
+            result = await _invoice_chunk(db, offers, names, today, batch.get("createdBy"))
+            last_offer_id = str(offers[-1]["_id"])
+            update = {
+                "$set": {"lastOfferId": last_offer_id, "updatedAt": datetime.utcnow()},
+                "$inc": {
+                    "processed": len(offers),
+                    "created": result.created,
+                    "alreadyInvoiced": result.already_invoiced,
+                    "failed": len(result.errors),
+                },
+            }
+            kept = result.errors[:max(MAX_BATCH_ERRORS - errors_kept, 0)]
+            if kept:
+                update["$push"] = {"errors": {"$each": kept}}
+                errors_kept += len(kept)
+            progress = await db.invoice_batches.update_one(owned, update)
+            if progress.matched_count == 0:
+                # Our lease expired and another runner took over
+                return await db.invoice_batches.find_one({"_id": batch_id})
+    except Exception as exc:
+        logger.exception("Invoice batch %s failed", batch_id)
+        await db.invoice_batches.update_one(
+            owned,
+            {"$set": {"status": "failed", "error": str(exc), "updatedAt": datetime.utcnow()}}
+        )
+    else:
+        now = datetime.utcnow()
+        await db.invoice_batches.update_one(owned, {"$set": {"status": "done", "updatedAt": now, "finishedAt": now}})
+    return await db.invoice_batches.find_one({"_id": batch_id})
@@ -0,0 +1,339 @@
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from pathlib import Path
+from pymongo import ReturnDocument
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import mimetypes
+import os
+import random
+import time
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# Concurrent senders per process; each holds at most one pooled connection
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "4"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+# Retries wait base * 2^(attempt - 1) seconds (with jitter), capped at the maximum
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+# A job whose worker died is picked up again once its lease has expired
+EMAIL_SEND_TIMEOUT = float(os.getenv("EMAIL_SEND_TIMEOUT_SECONDS", "120"))
+# Other processes' jobs are noticed by polling; our own wake the workers at once
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+# Servers drop idle sessions; older connections are checked with NOOP before reuse
+EMAIL_IDLE_CHECK_SECONDS = float(os.getenv("EMAIL_IDLE_CHECK_SECONDS", "30"))
+# Messages per second and process, per SMTP host: "smtp.gmail.com=1,mail.example.ch=20"
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", "10"))
+EMAIL_RATE_LIMITS = os.getenv("EMAIL_RATE_LIMITS", "")
+
+UPLOAD_DIR = Path(__file__).resolve().parent.parent / "uploads"
+
+def _parse_rate_limits(spec: str) -> Dict[str, float]:
+    limits = {}
+    for entry in spec.split(","):
+        host, _, rate = entry.partition("=")
+        if host.strip() and rate.strip():
+            limits[host.strip().lower()] = float(rate)
+    return limits
+
+RATE_LIMITS = _parse_rate_limits(EMAIL_RATE_LIMITS)
+
+class SMTPConfig:
+    """Connection parameters of one provider, taken from the company `EmailSettings`"""
+
+    def __init__(self, email_settings: dict):
+        self.host = (email_settings.get("smtpHost") or "").strip()
+        self.port = int(email_settings.get("smtpPort") or 587)
+        self.user = email_settings.get("smtpUser") or ""
+        self.password = email_settings.get("smtpPassword") or ""
+        self.from_email = email_settings.get("fromEmail") or self.user
+        self.from_name = email_settings.get("fromName") or ""
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.host and self.from_email)
+
+    @property
+    def key(self) -> Tuple[str, int, str, str]:
+        return self.host.lower(), self.port, self.user, self.password
+
+    @property
+    def provider(self) -> str:
+        return f"{self.host}:{self.port}"
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `rate`"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class SMTPPool:
+    """Authenticated SMTP sessions to one provider, reused across messages.
+
+    Logging in costs several round trips (and a TLS handshake); a pooled
+    session sends each further message with one MAIL/RCPT/DATA exchange.
+    """
+
+    def __init__(self, config: SMTPConfig, size: int):
+        self.config = config
+        self.size = size
+        self._idle: List[Tuple[aiosmtplib.SMTP, float]] = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        config = self.config
+        smtp = aiosmtplib.SMTP(
+            hostname=config.host,
+            port=config.port,
+            username=config.user or None,
+            password=config.password or None,
+            # 465 is implicit TLS; otherwise STARTTLS is used whenever the server offers it
+            use_tls=config.port == 465,
+            timeout=EMAIL_SEND_TIMEOUT
+        )
+        await smtp.connect()
+        return smtp
+
+    async def _checkout(self) -> Tuple[aiosmtplib.SMTP, bool]:
+        while self._idle:
+            smtp, released_at = self._idle.pop()
+            if not smtp.is_connected:
+                continue
+            if time.monotonic() - released_at < EMAIL_IDLE_CHECK_SECONDS:
+                return smtp, True
+            try:
+                await smtp.noop()
+                return smtp, True
+            except aiosmtplib.SMTPException:
+                smtp.close()
+        return await self._connect(), False
+
+    def _release(self, smtp: aiosmtplib.SMTP):
+        self._idle.append((smtp, time.monotonic()))
+
+    async def send(self, message: EmailMessage):
+        async with self._slots:
+            smtp, reused = await self._checkout()
+            try:
+                await smtp.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                smtp.close()
+                if not reused:
+                    raise
+                # The server dropped the idle session under us; one fresh session decides
+                smtp = await self._connect()
+                try:
+                    await smtp.send_message(message)
+                except BaseException:
+                    smtp.close()
+                    raise
+            except aiosmtplib.SMTPResponseException:
+                # The session stays usable after a refused message
+                try:
+                    await smtp.rset()
+                    self._release(smtp)
+                except aiosmtplib.SMTPException:
+                    smtp.close()
+                raise
+            except BaseException:
+                smtp.close()
+                raise
+            if self._closed:
+                await _quit(smtp)
+            else:
+                self._release(smtp)
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(_quit(smtp) for smtp, _ in idle))
+
+async def _quit(smtp: aiosmtplib.SMTP):
+    try:
+        await smtp.quit()
+    except aiosmtplib.SMTPException:
+        smtp.close()
+
+def build_message(job: dict, config: SMTPConfig) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((config.from_name, config.from_email))
+    message["To"] = ", ".join(job["to"])
+    message["Subject"] = job["subject"]
+    # Stable across retries, so a resend after a lost server reply is recognisable as duplicate
+    message["Message-ID"] = f"<{job['_id']}@{config.from_email.rpartition('@')[2] or config.host}>"
+    message.set_content(job["body"])
+    for attachment in job.get("attachments") or []:
+        # An absolute attachment path replaces UPLOAD_DIR
+        path = UPLOAD_DIR / attachment
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        maintype, _, subtype = content_type.partition("/")
+        message.add_attachment(path.read_bytes(), maintype=maintype, subtype=subtype, filename=path.name)
+    return message
+
+def is_permanent(exc: Exception) -> bool:
+    """5xx replies (unknown recipient, rejected content) will not succeed on retry.
+
+    Authentication failures are retried: they are usually fixed in the
+    settings by an admin while the job waits.
+    """
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        return all(500 <= error.code < 600 for error in exc.recipients)
+    if isinstance(exc, aiosmtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return 500 <= exc.code < 600
+    return isinstance(exc, FileNotFoundError)
+
+def retry_delay(attempts: int) -> float:
+    delay = min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+    # Jitter keeps jobs that failed together from retrying in lockstep
+    return delay * random.uniform(0.8, 1.2)
+
+class MailQueue:
+    """Outbound email queue persisted in `email_jobs` and drained by background workers.
+
+    Jobs are claimed atomically with a lease (`nextAttemptAt`), so any
+    number of processes can run workers on the same queue and a job whose
+    worker died is sent again after EMAIL_SEND_TIMEOUT. SMTP connections are
+    pooled and rate limited per provider.
+    """
+
+    def __init__(
+        self,
+        db,
+        get_settings: Callable[[], Awaitable[Optional[dict]]],
+        on_sent: Optional[Dict[str, Callable[[dict], Awaitable[None]]]] = None,
+        workers: int = EMAIL_WORKERS
+    ):
+        self.db = db
+        self.get_settings = get_settings
+        self.on_sent = on_sent or {}
+        self.workers = workers
+        self._pools: Dict[tuple, SMTPPool] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def enqueue(self, job: dict) -> str:
+        result = await self.db.email_jobs.insert_one(job)
+        self._wakeup.set()
+        return str(result.inserted_id)
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db.email_jobs.find_one_and_update(
+            {"status": {"$in": ["queued", "sending"]}, "nextAttemptAt": {"$lte": now}},
+            {
+                "$set": {"status": "sending", "nextAttemptAt": now + timedelta(seconds=EMAIL_SEND_TIMEOUT)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _pool(self, config: SMTPConfig) -> SMTPPool:
+        pool = self._pools.get(config.key)
+        if pool is None:
+            # Settings changed: sessions of the old account are no longer needed
+            stale, self._pools = list(self._pools.values()), {}
+            await asyncio.gather(*(old.close() for old in stale))
+            pool = self._pools[config.key] = SMTPPool(config, self.workers)
+        return pool
+
+    def _bucket(self, host: str) -> TokenBucket:
+        host = host.lower()
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(RATE_LIMITS.get(host, EMAIL_RATE_LIMIT))
+        return self._buckets[host]
+
+    async def _deliver(self, job: dict):
+        settings = await self.get_settings() or {}
+        config = SMTPConfig(settings.get("email") or {})
+        if not config.complete:
+            raise aiosmtplib.SMTPException("SMTP host and sender address are not configured")
+        message = build_message(job, config)
+        await self._bucket(config.host).acquire()
+        await (await self._pool(config)).send(message)
+        return config.provider
+
+    async def _finish(self, job: dict, update: dict):
+        # Only the worker holding the current lease may record the outcome
+        await self.db.email_jobs.update_one(
+            {"_id": job["_id"], "status": "sending", "attempts": job["attempts"]},
+            {"$set": update}
+        )
+
+    async def process(self, job: dict):
+        try:
+            provider = await self._deliver(job)
+        except Exception as exc:
+            permanent = is_permanent(exc) or job["attempts"] >= EMAIL_MAX_ATTEMPTS
+            logger.warning("Email job %s attempt %s failed: %s", job["_id"], job["attempts"], exc)
+            now = datetime.utcnow()
+            if permanent:
+                await self._finish(job, {"status": "failed", "lastError": str(exc), "finishedAt": now})
+            else:
+                await self._finish(job, {
+                    "status": "queued",
+                    "lastError": str(exc),
+                    "nextAttemptAt": now + timedelta(seconds=retry_delay(job["attempts"])),
+                })
+            return
+
+        await self._finish(job, {"status": "sent", "provider": provider, "lastError": None, "finishedAt": datetime.utcnow()})
+        handler = self.on_sent.get(job["kind"])
+        if handler is not None:
+            try:
+                await handler(job)
+            except Exception:
+                logger.exception("Post-send hook of email job %s failed", job["_id"])
+
+    async def _work(self):
+        while True:
+            # Cleared before looking, so a job queued meanwhile still wakes us
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming an email job failed")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), EMAIL_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.process(job)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pools, self._pools = list(self._pools.values()), {}
+        await asyncio.gather(*(pool.close() for pool in pools))
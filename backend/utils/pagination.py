@@ -0,0 +1,67 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import struct
+
+# List endpoints order by newest first; _id breaks ties between equal timestamps
+LIST_SORT = [("createdAt", -1), ("_id", -1)]
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque token for the position right after `doc` in LIST_SORT order"""
+    created_at: datetime = doc["createdAt"]
+    millis = int((created_at - datetime(1970, 1, 1)).total_seconds() * 1000)
+    raw = struct.pack(">q", millis) + ObjectId(doc["_id"]).binary
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        (millis,) = struct.unpack(">q", raw[:8])
+        return datetime.utcfromtimestamp(millis / 1000), ObjectId(raw[8:])
+    except (ValueError, TypeError, struct.error, InvalidId) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def keyset_query(query: dict, cursor: str) -> dict:
+    """Restrict `query` to the documents after `cursor`"""
+    created_at, last_id = decode_cursor(cursor)
+    after = {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, "_id": {"$lt": last_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+async def fetch_page(
+    collection,
+    query: dict,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str], bool]:
+    """Return (docs, next_cursor, has_more) for one page of a list endpoint.
+
+    Without a cursor this is classic offset paging. With a cursor (an empty
+    string means the first page) `skip` is ignored and the page starts right
+    after the cursor position, so deep pages cost the same as the first one.
+    """
+    if cursor is not None:
+        if cursor:
+            query = keyset_query(query, cursor)
+        skip = 0
+
+    cursor_only = projection is not None and any(projection.values()) and not projection.get("createdAt")
+    if cursor_only:
+        # The cursor of the last row needs both sort keys
+        projection = {**projection, "createdAt": 1}
+
+    docs = await collection.find(query, projection).sort(LIST_SORT).skip(skip).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1]) if has_more else None
+    if cursor_only:
+        for doc in docs:
+            doc.pop("createdAt", None)
+    return docs, next_cursor, has_more
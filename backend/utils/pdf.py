@@ -0,0 +1,295 @@
+from datetime import date, datetime
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, List, Optional
+from xml.sax.saxutils import escape
+import hashlib
+import os
+
+import orjson
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import CondPageBreak, Flowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from utils.qrbill import QR_CACHE_SIZE, qr_matrix, swiss_cross
+
+# Bump whenever the layout changes so cached PDFs are rendered again
+PDF_RENDERER_VERSION = 2
+
+# Streams are only zlib-compressed; the ASCII85 text wrapper is encoded in pure
+# Python and cost about half of the render time of a QR-bill invoice
+rl_config.useA85 = 0
+
+# Fields that change without changing what the PDF shows
+VOLATILE_FIELDS = {"pdfUrl", "updatedAt", "emailSent", "emailSentAt", "invoiceId", "invoicedAt", "searchKeys", "version"}
+
+def pdf_fingerprint(kind: str, payload: dict, settings_version: Optional[int]) -> str:
+    """Content hash identifying one rendering of a document"""
+    doc = {key: value for key, value in payload["doc"].items() if key not in VOLATILE_FIELDS}
+    key = {
+        "kind": kind,
+        "renderer": PDF_RENDERER_VERSION,
+        "settings": settings_version,
+        "doc": doc,
+        "extra": {name: value for name, value in payload.items() if name not in ("doc", "settings")},
+    }
+    raw = orjson.dumps(key, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(raw).hexdigest()
+
+def _money(amount: Any, currency: str = "CHF") -> str:
+    # Swiss notation: 1'234.50
+    return f"{currency} {float(amount or 0):,.2f}".replace(",", "'")
+
+def _date(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%d.%m.%Y")
+    return str(value or "")
+
+def _text(value: Any) -> str:
+    """Document text made safe for reportlab's paragraph markup"""
+    return escape(str(value or ""))
+
+def _styles():
+    styles = getSampleStyleSheet()
+    return styles["Normal"], styles["Heading1"], styles["Heading3"]
+
+def _company_block(settings: dict) -> List[str]:
+    address = next(iter(settings.get("addresses") or []), {})
+    lines = [f"<b>{_text(settings.get('companyName'))}</b>"]
+    if address:
+        lines += [
+            _text(address.get("street")),
+            f"{_text(address.get('zipCode'))} {_text(address.get('city'))}",
+            _text(address.get("phone")),
+            _text(address.get("email")),
+        ]
+    return [line for line in lines if line.strip()]
+
+def _header(settings: dict, normal) -> Table:
+    theme = settings.get("theme") or {}
+    company = Paragraph("<br/>".join(_company_block(settings)), normal)
+    header = Table([["", company]], colWidths=[95 * mm, 75 * mm])
+    header.setStyle(TableStyle([
+        ("LINEABOVE", (0, 0), (0, 0), 3, colors.HexColor(theme.get("secondaryColor") or "#000000")),
+        ("LINEABOVE", (1, 0), (1, 0), 3, colors.HexColor(theme.get("primaryColor") or "#EAB308")),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+    ]))
+    return header
+
+def _details(rows: List[tuple], normal) -> Table:
+    table = Table([[Paragraph(f"<b>{label}</b>", normal), Paragraph(_text(value), normal)] for label, value in rows], colWidths=[50 * mm, 120 * mm])
+    table.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP"), ("BOTTOMPADDING", (0, 0), (-1, -1), 1)]))
+    return table
+
+def _amounts(rows: List[tuple], grid_rows: int) -> Table:
+    """Line items followed by the totals; the last row is printed bold"""
+    table = Table(rows, colWidths=[100 * mm, 20 * mm, 25 * mm, 25 * mm])
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#F3F4F6")),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("GRID", (0, 0), (-1, grid_rows - 1), 0.5, colors.HexColor("#D1D5DB")),
+        ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("LINEABOVE", (2, -1), (-1, -1), 1, colors.black),
+    ]))
+    return table
+
+def _build(story: list) -> bytes:
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4, leftMargin=20 * mm, rightMargin=20 * mm, topMargin=15 * mm, bottomMargin=15 * mm).build(story)
+    return buffer.getvalue()
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _qr_operators(payload: str) -> str:
+    """PDF fill operators for a QR code in module units, y pointing down"""
+    matrix = qr_matrix(payload)
+    modules = len(matrix)
+    ops = ["0 g"]
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if row[x]:
+                start = x
+                while x < modules and row[x]:
+                    x += 1
+                ops.append(f"{start} {y} {x - start} 1 re")
+            x += 1
+    ops.append("f")
+    for x, y, width, height, white in swiss_cross(modules):
+        ops.append(f"{1 if white else 0} g {x:.3f} {y:.3f} {width:.3f} {height:.3f} re f")
+    return "\n".join(ops)
+
+class _QRCode(Flowable):
+    """Vector Swiss QR code; its drawing operators are built once per payload"""
+
+    def __init__(self, payload: str, size: float):
+        super().__init__()
+        self.payload = payload
+        self.modules = len(qr_matrix(payload))
+        self.width = self.height = size
+
+    def draw(self):
+        unit = self.width / self.modules
+        self.canv.saveState()
+        self.canv.translate(0, self.height)
+        self.canv.scale(unit, -unit)
+        self.canv.addLiteral(_qr_operators(self.payload))
+        self.canv.restoreState()
+
+def _payment_part(qr_bill: dict, normal, heading) -> list:
+    bill = qr_bill["bill"]
+    iban = bill["iban"].replace(" ", "")
+    lines = [
+        "<b>Konto / Zahlbar an</b>",
+        " ".join(iban[i:i + 4] for i in range(0, len(iban), 4)),
+        _text(bill.get("creditorName")),
+        _text(bill.get("creditorAddress")),
+        f"{_text(bill.get('creditorZipCode'))} {_text(bill.get('creditorCity'))}",
+    ]
+    if bill.get("reference"):
+        lines += ["<b>Referenz</b>", _text(bill["reference"])]
+    if bill.get("debtorName"):
+        lines += ["<b>Zahlbar durch</b>", _text(bill["debtorName"]), _text(bill.get("debtorAddress")), f"{_text(bill.get('debtorZipCode'))} {_text(bill.get('debtorCity'))}"]
+    lines += ["<b>Währung / Betrag</b>", f"{_text(bill.get('currency'))} {float(bill.get('amount') or 0):,.2f}".replace(",", " ")]
+
+    part = Table([[_QRCode(qr_bill["payload"], 46 * mm), Paragraph("<br/>".join(lines), normal)]], colWidths=[56 * mm, 114 * mm])
+    part.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP"), ("LINEABOVE", (0, 0), (-1, 0), 0.5, colors.black, None, (2, 2))]))
+    # The payment part (about 105 mm) is never split across pages
+    return [CondPageBreak(110 * mm), Spacer(1, 8 * mm), Paragraph("Zahlteil", heading), part]
+
+def render_invoice(invoice: dict, customer: Optional[dict], settings: dict, qr_bill: Optional[dict] = None) -> bytes:
+    normal, title, heading = _styles()
+    currency = invoice.get("currency", "CHF")
+    story = [_header(settings, normal), Spacer(1, 10 * mm)]
+
+    if customer:
+        address = customer.get("address") or {}
+        lines = [
+            f"{_text(customer.get('salutation'))} {_text(customer.get('firstName'))} {_text(customer.get('lastName'))}",
+            _text(address.get("street")),
+            f"{_text(address.get('zipCode'))} {_text(address.get('city'))}",
+        ]
+        story += [Paragraph("<br/>".join(line.strip() for line in lines), normal), Spacer(1, 8 * mm)]
+
+    story += [
+        Paragraph(f"Rechnung {_text(invoice.get('invoiceNumber'))}", title),
+        _details([
+            ("Rechnungsdatum", _date(invoice.get("invoiceDate"))),
+            ("Zahlbar bis", _date(invoice.get("dueDate"))),
+            ("Kundennummer", (customer or {}).get("customerNumber", "")),
+        ], normal),
+        Spacer(1, 6 * mm),
+    ]
+
+    rows = [("Beschreibung", "Menge", "Preis", "Total")]
+    for item in invoice.get("items") or []:
+        rows.append((
+            Paragraph(_text(item.get("description")), normal),
+            f"{float(item.get('quantity') or 0):g}",
+            _money(item.get("unitPrice"), currency),
+            _money(item.get("total"), currency),
+        ))
+    grid_rows = len(rows)
+    rows += [
+        ("", "", "Zwischentotal", _money(invoice.get("subtotal"), currency)),
+        ("", "", f"MwSt {float(invoice.get('taxRate') or 0):g}%", _money(invoice.get("taxAmount"), currency)),
+        ("", "", "Total", _money(invoice.get("total"), currency)),
+    ]
+    story.append(_amounts(rows, grid_rows))
+
+    if invoice.get("notes"):
+        story += [Spacer(1, 6 * mm), Paragraph(_text(invoice["notes"]), normal)]
+    if qr_bill:
+        story += _payment_part(qr_bill, normal, heading)
+    return _build(story)
+
+def _location(location: dict) -> str:
+    lines = [
+        _text(location.get("street")),
+        f"{_text(location.get('zipCode'))} {_text(location.get('city'))}",
+        f"Stockwerk: {location.get('floor', 0)}, Lift: {'Ja' if location.get('hasElevator') else 'Nein'}",
+    ]
+    return "<br/>".join(lines)
+
+def render_offer(offer: dict, service_names: dict, settings: dict) -> bytes:
+    normal, title, heading = _styles()
+    pricing = offer.get("pricing") or {}
+    currency = pricing.get("currency", "CHF")
+    customer = offer.get("customer") or {}
+    details = offer.get("serviceDetails") or {}
+    story = [_header(settings, normal), Spacer(1, 10 * mm)]
+
+    story += [
+        _details([
+            ("Offert Nr.", offer.get("offerNumber", "")),
+            ("Offertdatum", _date(offer.get("createdAt"))),
+            ("Ihr Ansprechpartner", offer.get("contactPerson") or ""),
+        ], normal),
+        Spacer(1, 6 * mm),
+    ]
+
+    locations = Table([
+        [Paragraph("<b>Aktueller Standort:</b>", normal), Paragraph("<b>Neuer Standort:</b>", normal)],
+        [Paragraph(_location(offer.get("currentLocation") or {}), normal), Paragraph(_location(offer.get("newLocation") or {}), normal)],
+    ], colWidths=[85 * mm, 85 * mm])
+    locations.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+    story += [locations, Spacer(1, 6 * mm)]
+
+    story += [
+        Paragraph("Offerte", title),
+        Paragraph(f"Sehr geehrte {_text(customer.get('salutation'))} {_text(customer.get('lastName'))}", normal),
+        Spacer(1, 3 * mm),
+        Paragraph("Vielen Dank für Ihre Anfrage. Ich freue mich, Ihnen die folgende Offerte unterbreiten zu können:", normal),
+        Spacer(1, 4 * mm),
+        _details([
+            ("Umzugstermin:", details.get("movingDate") or "offen"),
+            ("Arbeitsbeginn:", details.get("startTime") or "offen"),
+            ("Reinigungstermin:", details.get("cleaningDate") or "offen"),
+            ("Reinigung Arbeitsbeginn:", details.get("cleaningStartTime") or "offen"),
+            ("Objekt:", details.get("object") or "—"),
+            ("Mitarbeiter / Umzugswagen:", f"{details.get('workers', 0)} / {details.get('trucks', 0)}"),
+        ], normal),
+        Spacer(1, 6 * mm),
+        Paragraph("Leistungen", heading),
+    ]
+
+    rows = [("Leistung", "", "", "Preis"), ("Pauschalpreis", "", "", _money(pricing.get("basePrice"), currency))]
+    for service in offer.get("additionalServices") or []:
+        if service.get("selected"):
+            name = service_names.get(service.get("serviceId"), service.get("serviceId", ""))
+            rows.append((Paragraph(f"Pauschalpreis {_text(name)}", normal), "", "", _money(service.get("price"), currency)))
+    grid_rows = len(rows)
+    rows.append(("", "", "Zwischentotal", _money(pricing.get("subtotal"), currency)))
+    if pricing.get("discount"):
+        discount = f"{pricing['discount']:g}%" if pricing.get("discountType") == "percentage" else _money(pricing["discount"], currency)
+        rows.append(("", "", f"Rabatt {discount}", ""))
+    if pricing.get("includeTax"):
+        rows.append(("", "", f"MwSt {float(pricing.get('taxRate') or 0):g}%", _money(pricing.get("taxAmount"), currency)))
+    rows.append(("", "", "Total", _money(pricing.get("total"), currency)))
+    story.append(_amounts(rows, grid_rows))
+
+    if offer.get("notes"):
+        story += [Spacer(1, 6 * mm), Paragraph(_text(offer["notes"]), normal)]
+    story += [
+        Spacer(1, 10 * mm),
+        Paragraph("Freundliche Grüsse", normal),
+        Spacer(1, 12 * mm),
+        _details([("Ort, Datum", "_" * 30), ("Unterschrift", "_" * 30)], normal),
+    ]
+    return _build(story)
+
+def render_to_file(kind: str, payload: dict, path: str) -> int:
+    """Process pool entry point: render and atomically write the PDF, returning its size"""
+    if kind == "invoice":
+        content = render_invoice(payload["doc"], payload.get("customer"), payload["settings"], payload.get("qrBill"))
+    else:
+        content = render_offer(payload["doc"], payload.get("serviceNames") or {}, payload["settings"])
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as output:
+        output.write(content)
+    os.replace(partial, path)
+    return len(content)
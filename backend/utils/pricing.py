@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List, Optional
+import os
+
+# Hourly categories bill every worker hour at the category's hourlyRate; trucks are billed on top
+TRUCK_HOURLY_RATE = float(os.getenv("TRUCK_HOURLY_RATE", "0"))
+
+def tax_of(settings: Optional[dict]) -> tuple:
+    """(rate, enabled) of the company's VAT setting"""
+    tax = (settings or {}).get("tax", {})
+    return tax.get("rate", 7.7), tax.get("enabled", True)
+
+def services_total(additional_services: Iterable[dict]) -> float:
+    return sum(service.get("price", 0) for service in additional_services if service.get("selected", False))
+
+def compute_pricing(
+    base_price: float,
+    additional_total: float,
+    discount: float,
+    discount_type: str,
+    tax_rate: float,
+    tax_enabled: bool
+) -> dict:
+    """Offer pricing: discount on base plus services, then tax on the discounted subtotal"""
+    subtotal = base_price + additional_total
+
+    discount_amount = 0
+    if discount > 0:
+        if discount_type == "percentage":
+            discount_amount = subtotal * (discount / 100)
+        else:
+            discount_amount = discount
+
+    subtotal_after_discount = subtotal - discount_amount
+
+    tax_amount = 0
+    if tax_enabled:
+        tax_amount = subtotal_after_discount * (tax_rate / 100)
+
+    return {
+        "basePrice": base_price,
+        "additionalServicesTotal": additional_total,
+        "subtotal": subtotal,
+        "discount": discount,
+        "discountType": discount_type,
+        "taxRate": tax_rate,
+        "taxAmount": tax_amount,
+        "total": subtotal_after_discount + tax_amount,
+        "currency": "CHF",
+        "includeTax": tax_enabled,
+    }
+
+def category_base_price(category: Optional[dict], details: dict, hours: Optional[float], current: float) -> float:
+    """Base price from the category's pricing model; `custom` keeps the manually set price"""
+    model = (category or {}).get("pricingModel", "custom")
+    if model == "fixed":
+        return float(category.get("basePrice") or 0)
+    if model == "hourly":
+        hours = hours or 0
+        worker_rate = float(category.get("hourlyRate") or 0) * (details.get("workers") or 0)
+        truck_rate = TRUCK_HOURLY_RATE * (details.get("trucks") or 0)
+        return float(category.get("basePrice") or 0) + hours * (worker_rate + truck_rate)
+    return current
+
+def price_offers(
+    offers: List[dict],
+    requests: List[dict],
+    categories: Dict[str, dict],
+    settings: Optional[dict]
+) -> List[dict]:
+    """Price many offers against one settings and category snapshot.
+
+    `requests[i]` holds the what-if overrides for `offers[i]` (hours,
+    basePrice, discount, discountType); anything not given is taken from
+    the offer's current pricing.
+    """
+    tax_rate, tax_enabled = tax_of(settings)
+    results = []
+    for offer, request in zip(offers, requests):
+        current = offer.get("pricing") or {}
+        hours = request["hours"] if request.get("hours") is not None else current.get("hours")
+        base_price = request.get("basePrice")
+        if base_price is None:
+            base_price = category_base_price(
+                categories.get(offer.get("category")),
+                offer.get("serviceDetails") or {},
+                hours,
+                float(current.get("basePrice") or 0)
+            )
+        discount = request["discount"] if request.get("discount") is not None else float(current.get("discount") or 0)
+        discount_type = request.get("discountType") or current.get("discountType") or "percentage"
+
+        pricing = compute_pricing(
+            base_price,
+            services_total(offer.get("additionalServices") or []),
+            discount,
+            discount_type,
+            tax_rate,
+            tax_enabled
+        )
+        pricing["hours"] = hours
+        results.append(pricing)
+    return results
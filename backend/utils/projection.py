@@ -0,0 +1,36 @@
+from pydantic import BaseModel, ValidationError
+from typing import List, Type
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FIELD_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*(\.[A-Za-z][A-Za-z0-9_]*)*$")
+
+# Bookkeeping fields that are never part of an API response
+INTERNAL_FIELDS = {"searchKeys"}
+
+def parse_fields(fields: str) -> dict:
+    """Turn a `fields=a,b.c` query parameter into a Mongo inclusion projection"""
+    names = sorted({name.strip() for name in fields.split(",") if name.strip()})
+    if not names or not all(FIELD_NAME.match(name) for name in names):
+        raise ValueError("Invalid fields parameter")
+    internal = [name for name in names if name.split(".")[0] in INTERNAL_FIELDS]
+    if internal:
+        raise ValueError(f"Unknown fields: {', '.join(internal)}")
+    # Sorted, a parent comes right before its children; Mongo rejects such path collisions
+    overlapping = [f"{parent},{child}" for parent, child in zip(names, names[1:]) if child.startswith(parent + ".")]
+    if overlapping:
+        raise ValueError(f"Overlapping fields: {'; '.join(overlapping)}")
+    return {name: 1 for name in names}
+
+def summarize(model: Type[BaseModel], docs: List[dict]) -> List[dict]:
+    """Rows through a summary model; legacy rows that no longer validate are passed on as stored"""
+    rows = []
+    for doc in docs:
+        try:
+            rows.append(model(**doc).dict(by_alias=True))
+        except ValidationError as exc:
+            logger.warning("%s %s does not validate, listing it as stored: %s", model.__name__, doc.get("_id"), exc.errors())
+            rows.append(doc)
+    return rows
@@ -0,0 +1,213 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import hashlib
+import os
+import re
+import struct
+import zlib
+
+import segno
+
+# Rendered QR codes kept in memory, keyed by payload
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "4096"))
+# Scoring all eight mask patterns is ~85% of the encoding time; any mask is
+# valid for decoders, so a fixed one is used unless QR_MASK is set to "auto"
+QR_MASK = os.getenv("QR_MASK", "0")
+
+# Recursive mod 10 table of the Swiss QR reference (ex ESR reference)
+_MOD10_TABLE = (0, 9, 4, 6, 8, 2, 7, 1, 3, 5)
+
+class QRBillError(ValueError):
+    """The bill data cannot be turned into a valid Swiss QR code"""
+
+def mod10_check_digit(digits: str) -> str:
+    carry = 0
+    for digit in digits:
+        carry = _MOD10_TABLE[(carry + int(digit)) % 10]
+    return str((10 - carry) % 10)
+
+def qr_reference(base: str) -> str:
+    """27-digit QR reference (QRR) for the digits in `base`, e.g. an invoice number"""
+    digits = re.sub(r"\D", "", base)
+    if not digits or len(digits) > 26:
+        raise QRBillError("A QR reference needs 1 to 26 digits")
+    digits = digits.zfill(26)
+    return digits + mod10_check_digit(digits)
+
+def is_valid_qr_reference(reference: str) -> bool:
+    return bool(re.fullmatch(r"\d{27}", reference)) and mod10_check_digit(reference[:26]) == reference[26]
+
+def _iso7064_mod97(text: str) -> int:
+    # Letters count as 10..35, as for IBANs
+    return int("".join(str(int(char, 36)) for char in text)) % 97
+
+def creditor_reference(base: str) -> str:
+    """ISO 11649 creditor reference (SCOR) for IBANs that are not QR-IBANs"""
+    body = re.sub(r"[^0-9A-Za-z]", "", base).upper()
+    if not body or len(body) > 21:
+        raise QRBillError("A creditor reference needs 1 to 21 letters or digits")
+    check = 98 - _iso7064_mod97(body + "RF00")
+    return f"RF{check:02d}{body}"
+
+def normalize_iban(iban: str) -> str:
+    iban = re.sub(r"\s", "", iban or "").upper()
+    if not re.fullmatch(r"(CH|LI)\d{7}[0-9A-Z]{12}", iban) or _iso7064_mod97(iban[4:] + iban[:4]) != 1:
+        raise QRBillError("IBAN must be a valid Swiss or Liechtenstein IBAN")
+    return iban
+
+def is_qr_iban(iban: str) -> bool:
+    """QR-IBANs have an institution id between 30000 and 31999 and require a QR reference"""
+    return 30000 <= int(iban[4:9]) <= 31999
+
+def _address(name: Optional[str], street: Optional[str], zip_code: Optional[str], city: Optional[str], country: Optional[str]) -> list:
+    """Structured address block ("S"), or seven empty lines when there is no name"""
+    if not name:
+        return [""] * 7
+    return ["S", name[:70], (street or "")[:70], "", (zip_code or "")[:16], (city or "")[:35], (country or "CH")[:2]]
+
+def build_payload(bill: dict, message: str = "") -> str:
+    """SPC payload (Swiss Payment Standards, QR code version 0200) for `QRBillData`
+
+    The reference type follows the IBAN: QR-IBANs use a QR reference (one is
+    required), other IBANs use a creditor reference when one is given.
+    """
+    iban = normalize_iban(bill.get("iban", ""))
+    reference = re.sub(r"\s", "", bill.get("reference") or "").upper()
+    if is_qr_iban(iban):
+        if not is_valid_qr_reference(reference):
+            raise QRBillError("A QR-IBAN requires a valid 27-digit QR reference")
+        reference_type = "QRR"
+    elif reference:
+        if not reference.startswith("RF") or _iso7064_mod97(reference[4:] + reference[:4]) != 1:
+            raise QRBillError("Reference must be a valid creditor reference (RF...) for this IBAN")
+        reference_type = "SCOR"
+    else:
+        reference_type = "NON"
+
+    amount = bill.get("amount")
+    currency = bill.get("currency") or "CHF"
+    if currency not in ("CHF", "EUR"):
+        raise QRBillError("Currency must be CHF or EUR")
+    if amount is not None and not 0 <= float(amount) <= 999999999.99:
+        raise QRBillError("Amount is out of range")
+
+    lines = [
+        "SPC", "0200", "1", iban,
+        *_address(bill.get("creditorName"), bill.get("creditorAddress"), bill.get("creditorZipCode"), bill.get("creditorCity"), bill.get("creditorCountry")),
+        *[""] * 7,  # ultimate creditor, reserved for future use
+        f"{float(amount):.2f}" if amount is not None else "", currency,
+        *_address(bill.get("debtorName"), bill.get("debtorAddress"), bill.get("debtorZipCode"), bill.get("debtorCity"), "CH"),
+        reference_type, reference,
+        message[:140],
+        "EPD",
+    ]
+    return "\r\n".join(lines)
+
+def payload_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_matrix(payload: str) -> Tuple[bytes, ...]:
+    """Module matrix of the QR code (1 = dark), error correction level M as required"""
+    try:
+        mask = None if QR_MASK == "auto" else int(QR_MASK)
+        code = segno.make_qr(payload, error="m", boost_error=False, encoding="utf-8", mask=mask)
+    except segno.DataOverflowError as exc:
+        raise QRBillError("Payload does not fit into a QR code") from exc
+    return tuple(bytes(row) for row in code.matrix)
+
+def swiss_cross(size: int) -> List[Tuple[float, float, float, float, bool]]:
+    """Rectangles (x, y, width, height, white) drawing the Swiss cross over a code of `size` modules.
+
+    The white-framed black square covers 7 mm of the 46 mm code; the cross
+    arms follow the flag's 6:20 width to length ratio.
+    """
+    side = size * 7 / 46
+    frame = side / 14
+    black = side - 2 * frame
+    arm, length = black * 6 / 32, black * 20 / 32
+    offset, center = (size - side) / 2, size / 2
+    return [
+        (offset, offset, side, side, True),
+        (offset + frame, offset + frame, black, black, False),
+        (center - arm / 2, center - length / 2, arm, length, True),
+        (center - length / 2, center - arm / 2, length, arm, True),
+    ]
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def render_svg(payload: str) -> str:
+    """QR code with Swiss cross as standalone SVG (one path, scales to any size)"""
+    matrix = qr_matrix(payload)
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}h{x - start}v1h{start - x}z")
+            x += 1
+    cross = "".join(
+        f'<rect x="{x:.3f}" y="{y:.3f}" width="{width:.3f}" height="{height:.3f}" fill="{"#fff" if white else "#000"}"/>'
+        for x, y, width, height, white in swiss_cross(size)
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{"".join(runs)}" fill="#000"/>{cross}</svg>'
+    )
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def render_png(payload: str, scale: int = 10) -> bytes:
+    """QR code with Swiss cross as grayscale PNG, `scale` pixels per module"""
+    matrix = qr_matrix(payload)
+    size = len(matrix)
+    pixels = size * scale
+    dark, light = b"\x00" * scale, b"\xff" * scale
+    image = []
+    for row in matrix:
+        line = b"".join(dark if module else light for module in row)
+        image.extend(bytearray(line) for _ in range(scale))
+
+    for x, y, width, height, white in swiss_cross(size):
+        left, top = round(x * scale), round(y * scale)
+        right, bottom = round((x + width) * scale), round((y + height) * scale)
+        fill = (b"\xff" if white else b"\x00") * (right - left)
+        for py in range(top, bottom):
+            image[py][left:right] = fill
+
+    # Filter type 0 per scanline, 8-bit grayscale
+    raw = b"".join(b"\x00" + line for line in image)
+    header = struct.pack(">IIBBBBB", pixels, pixels, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(raw, 6)) + _png_chunk(b"IEND", b"")
+
+def invoice_bill(invoice: dict, settings: dict) -> Optional[dict]:
+    """QRBillData of an invoice with defaults filled in; None when no IBAN is configured.
+
+    The amount follows the invoice total, the creditor defaults to the
+    company's main address and QR-IBANs get a reference derived from the
+    invoice number.
+    """
+    bill = dict(invoice.get("qrBill") or {})
+    if not bill.get("iban"):
+        return None
+    address = next(iter(settings.get("addresses") or []), {})
+    defaults = {
+        "creditorName": settings.get("companyName"),
+        "creditorAddress": address.get("street"),
+        "creditorZipCode": address.get("zipCode"),
+        "creditorCity": address.get("city"),
+        "creditorCountry": address.get("country", "CH"),
+    }
+    for field, value in defaults.items():
+        if not bill.get(field):
+            bill[field] = value
+    bill["amount"] = invoice.get("total", bill.get("amount"))
+    bill["currency"] = invoice.get("currency") or bill.get("currency") or "CHF"
+    if not bill.get("reference") and is_qr_iban(normalize_iban(bill["iban"])):
+        bill["reference"] = qr_reference(invoice.get("invoiceNumber", ""))
+    return bill
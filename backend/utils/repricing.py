@@ -0,0 +1,215 @@
+from bson import ObjectId
+from datetime import datetime
+from pymongo import ReturnDocument
+from typing import Callable, List, Optional
+import logging
+import os
+
+from models.reprice_job import RepriceJob
+from utils.rollups import apply_rollup_amounts, rollup_day
+
+logger = logging.getLogger(__name__)
+
+# Documents per `_id` range; each range is two update_many calls around one aggregate
+REPRICE_CHUNK_SIZE = int(os.getenv("REPRICE_CHUNK_SIZE", "5000"))
+
+# Jobs that may still write; a new tax change supersedes them
+ACTIVE_STATUSES = ["queued", "running", "failed"]
+
+def _offer_net() -> dict:
+    """Discounted subtotal of an offer, as compute_pricing derives it"""
+    subtotal = {"$ifNull": ["$pricing.subtotal", 0]}
+    discount = {"$ifNull": ["$pricing.discount", 0]}
+    return {"$subtract": [subtotal, {"$cond": [
+        {"$gt": [discount, 0]},
+        {"$cond": [
+            {"$eq": [{"$ifNull": ["$pricing.discountType", "percentage"]}, "percentage"]},
+            {"$multiply": [subtotal, {"$divide": [discount, 100]}]},
+            discount,
+        ]},
+        0,
+    ]}]}
+
+def _offer_tax(tax_rate: float, tax_enabled: bool):
+    return {"$multiply": ["$$net", {"$literal": tax_rate / 100}]} if tax_enabled else {"$literal": 0}
+
+def _offer_total(tax_rate: float, tax_enabled: bool) -> dict:
+    return {"$let": {"vars": {"net": _offer_net()}, "in": {"$add": ["$$net", _offer_tax(tax_rate, tax_enabled)]}}}
+
+def _offer_match(tax_rate: float, tax_enabled: bool) -> dict:
+    return {
+        "status": {"$in": ["draft", "sent"]},
+        "pricing": {"$type": "object"},
+        "$or": [{"pricing.taxRate": {"$ne": tax_rate}}, {"pricing.includeTax": {"$ne": tax_enabled}}],
+    }
+
+def _offer_update(tax_rate: float, tax_enabled: bool) -> list:
+    return [
+        {"$set": {
+            "pricing.taxRate": {"$literal": tax_rate},
+            "pricing.includeTax": {"$literal": tax_enabled},
+            "pricing.taxAmount": {"$let": {"vars": {"net": _offer_net()}, "in": _offer_tax(tax_rate, tax_enabled)}},
+            "updatedAt": "$$NOW",
+        }},
+        {"$set": {"pricing.total": {"$add": [_offer_net(), "$pricing.taxAmount"]}}},
+    ]
+
+def _offer_rollup_key() -> dict:
+    return {"kind": {"$literal": "offer"}, "day": rollup_day(), "category": {"$ifNull": ["$category", None]}, "status": "$status"}
+
+def _offer_delta(tax_rate: float, tax_enabled: bool) -> dict:
+    return {"$subtract": [_offer_total(tax_rate, tax_enabled), {"$ifNull": ["$pricing.total", 0]}]}
+
+def _invoice_rate(tax_rate: float, tax_enabled: bool) -> float:
+    return tax_rate if tax_enabled else 0.0
+
+def _invoice_match(tax_rate: float, tax_enabled: bool) -> dict:
+    # Untaxed drafts are left alone: a 0% invoice may be for a tax-exempt customer
+    return {"status": "draft", "taxRate": {"$gt": 0, "$ne": _invoice_rate(tax_rate, tax_enabled)}}
+
+def _invoice_tax(tax_rate: float, tax_enabled: bool) -> dict:
+    return {"$multiply": [{"$ifNull": ["$subtotal", 0]}, {"$literal": _invoice_rate(tax_rate, tax_enabled) / 100}]}
+
+def _invoice_update(tax_rate: float, tax_enabled: bool) -> list:
+    return [
+        {"$set": {
+            "taxRate": {"$literal": _invoice_rate(tax_rate, tax_enabled)},
+            "taxAmount": _invoice_tax(tax_rate, tax_enabled),
+            "updatedAt": "$$NOW",
+            # Editors holding the old totals get a 409 instead of overwriting them
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        }},
+        {"$set": {"total": {"$add": [{"$ifNull": ["$subtotal", 0]}, "$taxAmount"]}}},
+    ]
+
+def _invoice_rollup_key() -> dict:
+    return {"kind": {"$literal": "invoice"}, "day": rollup_day(), "category": {"$literal": None}, "status": "$status"}
+
+def _invoice_delta(tax_rate: float, tax_enabled: bool) -> dict:
+    new_total = {"$add": [{"$ifNull": ["$subtotal", 0]}, _invoice_tax(tax_rate, tax_enabled)]}
+    return {"$subtract": [new_total, {"$ifNull": ["$total", 0]}]}
+
+class RepricePhase:
+    """How one collection is matched, rewritten and rolled up for a tax rate"""
+
+    def __init__(self, collection: str, match: Callable, update: Callable, rollup_key: Callable, delta: Callable):
+        self.collection = collection
+        self.match = match
+        self.update = update
+        self.rollup_key = rollup_key
+        self.delta = delta
+
+REPRICE_PHASES: List[RepricePhase] = [
+    RepricePhase("offers", _offer_match, _offer_update, _offer_rollup_key, _offer_delta),
+    RepricePhase("invoices", _invoice_match, _invoice_update, _invoice_rollup_key, _invoice_delta),
+]
+
+async def _range_end(collection, after: Optional[ObjectId], chunk_size: int) -> Optional[ObjectId]:
+    """Last `_id` of the next range, read from the `_id` index alone; None for the final range"""
+    query = {"_id": {"$gt": after}} if after else {}
+    ends = await collection.find(query, {"_id": 1}).sort("_id", 1).skip(chunk_size - 1).limit(1).to_list(1)
+    return ends[0]["_id"] if ends else None
+
+def _stamp_delta(phase: RepricePhase, job: dict) -> dict:
+    """Update stage recording each document's rollup delta, and the status it is booked under, before the rewrite"""
+    return {"$set": {"repriceDelta": {
+        "job": {"$literal": str(job["_id"])},
+        "status": "$status",
+        "category": {"$ifNull": ["$category", None]},
+        "amount": phase.delta(job["taxRate"], job["taxEnabled"]),
+    }}}
+
+async def _reprice_range(db, phase: RepricePhase, job: dict, after: Optional[ObjectId], end: Optional[ObjectId]) -> int:
+    """Rewrite one `_id` range server-side; returns the number of documents changed.
+
+    Each document's rollup delta is stamped by the same update that reprices
+    it, so an edit racing the job can't leave the rollups out of step. The
+    stamps are then summed by the server and cleared; no document is ever
+    loaded into Python.
+    """
+    collection = db[phase.collection]
+    query = phase.match(job["taxRate"], job["taxEnabled"])
+    id_range = {}
+    if after:
+        id_range["$gt"] = after
+    if end:
+        id_range["$lte"] = end
+    if id_range:
+        query["_id"] = id_range
+
+    result = await collection.update_many(query, [_stamp_delta(phase, job), *phase.update(job["taxRate"], job["taxEnabled"])])
+    # Stamps left by a run that died before clearing them are picked up here too
+    stamped = {"repriceDelta.job": str(job["_id"])}
+    if id_range:
+        stamped["_id"] = id_range
+    deltas = await collection.aggregate([
+        {"$match": {**stamped, "createdAt": {"$type": "date"}}},
+        # Booked under the stamped status even if an editor changed it since
+        {"$set": {"status": "$repriceDelta.status", "category": "$repriceDelta.category"}},
+        {"$group": {"_id": phase.rollup_key(), "amount": {"$sum": "$repriceDelta.amount"}}},
+    ]).to_list(None)
+    await apply_rollup_amounts(db, deltas)
+    await collection.update_many(stamped, {"$unset": {"repriceDelta": ""}})
+    return result.modified_count
+
+async def create_reprice_job(db, tax: dict, created_by: Optional[str] = None) -> ObjectId:
+    """Queue a job for the given tax settings; unfinished jobs for older settings stop at their next range"""
+    now = datetime.utcnow()
+    await db.reprice_jobs.update_many(
+        {"status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"status": "superseded", "updatedAt": now, "finishedAt": now}}
+    )
+    job = RepriceJob(taxRate=tax.get("rate", 7.7), taxEnabled=tax.get("enabled", True), createdBy=created_by).dict(exclude={"id"})
+    result = await db.reprice_jobs.insert_one(job)
+    return result.inserted_id
+
+async def run_reprice_job(db, job_id: ObjectId, chunk_size: int = REPRICE_CHUNK_SIZE) -> dict:
+    """Apply a job's tax rate to draft/sent offers and taxed draft invoices, range by range.
+
+    Progress is saved after every range, so a run that died is resumed by
+    calling this again. Documents already at the job's rate no longer
+    match, which makes re-running a range harmless.
+    """
+    job = await db.reprice_jobs.find_one_and_update(
+        {"_id": job_id, "status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"status": "running", "error": None, "updatedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        job = await db.reprice_jobs.find_one({"_id": job_id})
+        if job is None:
+            raise ValueError("Reprice job not found")
+        # Finished or superseded: nothing left to do
+        return job
+
+    try:
+        names = [phase.collection for phase in REPRICE_PHASES]
+        after = ObjectId(job["lastId"]) if job.get("lastId") else None
+        for phase in REPRICE_PHASES[names.index(job["phase"]):]:
+            while True:
+                end = await _range_end(db[phase.collection], after, chunk_size)
+                changed = await _reprice_range(db, phase, job, after, end)
+                progress = await db.reprice_jobs.update_one(
+                    {"_id": job_id, "status": "running"},
+                    {
+                        "$set": {"phase": phase.collection, "lastId": str(end) if end else None, "updatedAt": datetime.utcnow()},
+                        "$inc": {phase.collection: changed},
+                    }
+                )
+                if progress.matched_count == 0:
+                    # A newer tax change took over
+                    return await db.reprice_jobs.find_one({"_id": job_id})
+                if end is None:
+                    break
+                after = end
+            after = None
+    except Exception as exc:
+        logger.exception("Reprice job %s failed", job_id)
+        await db.reprice_jobs.update_one(
+            {"_id": job_id, "status": "running"},
+            {"$set": {"status": "failed", "error": str(exc), "updatedAt": datetime.utcnow()}}
+        )
+    else:
+        now = datetime.utcnow()
+        await db.reprice_jobs.update_one({"_id": job_id, "status": "running"}, {"$set": {"status": "done", "updatedAt": now, "finishedAt": now}})
+    return await db.reprice_jobs.find_one({"_id": job_id})
@@ -0,0 +1,31 @@
+from bson import ObjectId
+from decimal import Decimal
+from fastapi.responses import ORJSONResponse
+from typing import Any
+import orjson
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Serialize Mongo documents to JSON; datetime, date and ObjectId are handled natively"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(ORJSONResponse):
+    """Default response class: orjson instead of the stdlib encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def trusted_response(content: Any, status_code: int = 200) -> FastJSONResponse:
+    """Return documents read from Mongo as-is.
+
+    FastAPI skips `response_model` validation and `jsonable_encoder` for
+    Response objects, so only use this for data that already has the shape
+    of the declared response model (e.g. documents written through it).
+    """
+    return FastJSONResponse(content=content, status_code=status_code)
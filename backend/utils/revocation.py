@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Dict, Optional, Set
+import asyncio
+import time
+
+class RevocationList:
+    """In-memory view of revoked tokens, refreshed periodically from Mongo.
+
+    Two kinds of entries live in the collection:
+    - {"_id": "jti:<id>", "jti": ..., "expiresAt": ...} revokes a single token
+    - {"_id": "user:<name>", "username": ..., "notBefore": ...} revokes every
+      token of a user issued before `notBefore` (epoch seconds, fractional)
+    """
+
+    def __init__(self, collection, refresh_interval: float = 30.0):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.jtis: Set[str] = set()
+        self.not_before: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        jtis = set()
+        not_before = {}
+        now = datetime.utcnow()
+        cursor = self.collection.find({
+            "$or": [
+                {"expiresAt": {"$gt": now}},
+                {"notBefore": {"$exists": True}},
+            ]
+        })
+        async for entry in cursor:
+            if entry.get("jti"):
+                jtis.add(entry["jti"])
+            elif entry.get("username"):
+                not_before[entry["username"]] = entry["notBefore"]
+        self.jtis = jtis
+        self.not_before = not_before
+        self._loaded_at = time.monotonic()
+
+    async def refresh_if_stale(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            await self.refresh()
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get("jti") in self.jtis:
+            return True
+        not_before = self.not_before.get(payload.get("sub"))
+        return not_before is not None and payload.get("iat", 0) < not_before
+
+    async def revoke_token(self, jti: str, expires_at: datetime):
+        """Revoke one token until it would have expired anyway"""
+        await self.collection.update_one(
+            {"_id": f"jti:{jti}"},
+            {"$set": {"jti": jti, "expiresAt": expires_at}},
+            upsert=True
+        )
+        self.jtis.add(jti)
+
+    async def revoke_user(self, username: str):
+        """Revoke every token issued to a user up to now"""
+        not_before = time.time()
+        await self.collection.update_one(
+            {"_id": f"user:{username}"},
+            {"$set": {"username": username, "notBefore": not_before}},
+            upsert=True
+        )
+        self.not_before[username] = not_before
@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from typing import Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+import os
+
+# Rollup days follow the same calendar as the dashboard statistics
+ROLLUP_TIMEZONE = os.getenv("STATS_TIMEZONE", "Europe/Zurich")
+ROLLUP_COLLECTION = "revenue_rollups"
+
+# Fields a write must return so its rollup delta can be computed
+OFFER_ROLLUP_FIELDS = {"createdAt": 1, "category": 1, "status": 1, "pricing.total": 1}
+INVOICE_ROLLUP_FIELDS = {"createdAt": 1, "status": 1, "total": 1}
+
+def _day(created_at: datetime) -> str:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(ZoneInfo(ROLLUP_TIMEZONE)).strftime("%Y-%m-%d")
+
+def offer_contribution(offer: Optional[dict]) -> Optional[Tuple[dict, float]]:
+    """Rollup key and amount an offer document adds to the per-day totals"""
+    if not offer or not offer.get("createdAt"):
+        return None
+    key = {"kind": "offer", "day": _day(offer["createdAt"]), "category": offer.get("category"), "status": offer.get("status")}
+    return key, float((offer.get("pricing") or {}).get("total") or 0)
+
+def invoice_contribution(invoice: Optional[dict]) -> Optional[Tuple[dict, float]]:
+    """Rollup key and amount an invoice document adds to the per-day totals"""
+    if not invoice or not invoice.get("createdAt"):
+        return None
+    key = {"kind": "invoice", "day": _day(invoice["createdAt"]), "category": None, "status": invoice.get("status")}
+    return key, float(invoice.get("total") or 0)
+
+def merge_update(before: Optional[dict], update_data: dict, fields: dict) -> Optional[dict]:
+    """State of the rollup fields after `$set: update_data` was applied to `before`"""
+    if before is None:
+        return None
+    after = dict(before)
+    for field in fields:
+        top_level = field.split(".")[0]
+        if top_level in update_data:
+            after[top_level] = update_data[top_level]
+    return after
+
+def _add_delta(deltas: Dict[tuple, list], entry: Optional[Tuple[dict, float]], sign: int):
+    if entry is None:
+        return
+    key, amount = entry
+    delta = deltas.setdefault(tuple(key.items()), [0, 0.0])
+    delta[0] += sign
+    delta[1] += sign * amount
+
+async def _write_deltas(db, deltas: Dict[tuple, list]):
+    operations = [
+        UpdateOne(
+            {"_id": dict(key)},
+            {"$inc": {"count": count, "amount": amount}, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+        for key, (count, amount) in deltas.items()
+        if count or amount
+    ]
+    if operations:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+async def apply_rollup_change(db, contribution, before: Optional[dict], after: Optional[dict]):
+    """Move a document's contribution from its old rollup row to its new one.
+
+    Pass `before=None` for inserts and `after=None` for deletes.
+    """
+    deltas: Dict[tuple, list] = {}
+    _add_delta(deltas, contribution(before), -1)
+    _add_delta(deltas, contribution(after), 1)
+    await _write_deltas(db, deltas)
+
+async def apply_rollup_changes(db, contribution, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]):
+    """apply_rollup_change for many (before, after) pairs with one write per affected rollup row"""
+    deltas: Dict[tuple, list] = {}
+    for before, after in changes:
+        _add_delta(deltas, contribution(before), -1)
+        _add_delta(deltas, contribution(after), 1)
+    await _write_deltas(db, deltas)
+
+async def apply_rollup_amounts(db, rows: Iterable[dict]):
+    """Add amount deltas grouped server-side by rollup key (`{"_id": key, "amount": delta}`); counts stay"""
+    deltas: Dict[tuple, list] = {}
+    for row in rows:
+        key = {field: row["_id"].get(field) for field in ("kind", "day", "category", "status")}
+        deltas[tuple(key.items())] = [0, row["amount"]]
+    await _write_deltas(db, deltas)
+
+async def apply_rollup_inserts(db, contribution, docs: Iterable[dict]):
+    """Add many newly inserted documents with one write per affected rollup row"""
+    deltas: Dict[tuple, list] = {}
+    for doc in docs:
+        _add_delta(deltas, contribution(doc), 1)
+    await _write_deltas(db, deltas)
+
+def rollup_day() -> dict:
+    """Aggregation expression of a document's rollup day, the server-side `_day`"""
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt", "timezone": ROLLUP_TIMEZONE}}
+
+def rollup_pipeline() -> list:
+    """Aggregation recomputing every rollup row from offers and invoices"""
+    day = rollup_day()
+    return [
+        {"$match": {"createdAt": {"$type": "date"}}},
+        {"$project": {"_id": 0, "kind": {"$literal": "offer"}, "day": day, "category": {"$ifNull": ["$category", None]}, "status": {"$ifNull": ["$status", None]}, "amount": {"$ifNull": ["$pricing.total", 0]}}},
+        {"$unionWith": {"coll": "invoices", "pipeline": [
+            {"$match": {"createdAt": {"$type": "date"}}},
+            {"$project": {"_id": 0, "kind": {"$literal": "invoice"}, "day": day, "category": {"$literal": None}, "status": {"$ifNull": ["$status", None]}, "amount": {"$ifNull": ["$total", 0]}}},
+        ]}},
+        {"$group": {
+            "_id": {"kind": "$kind", "day": "$day", "category": "$category", "status": "$status"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"},
+        }},
+    ]
+
+def _rollup_key(row: dict) -> tuple:
+    key = row["_id"]
+    return (key.get("kind"), key.get("day"), key.get("category"), key.get("status"))
+
+async def verify_rollups(db) -> list:
+    """Compare the incremental rollups with a full recomputation; returns the differences"""
+    expected = {_rollup_key(row): row async for row in db.offers.aggregate(rollup_pipeline())}
+    actual = {_rollup_key(row): row async for row in db[ROLLUP_COLLECTION].find()}
+
+    differences = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, {"count": 0, "amount": 0})
+        have = actual.get(key, {"count": 0, "amount": 0})
+        if want["count"] != have["count"] or abs(want["amount"] - have["amount"]) > 0.005:
+            differences.append({
+                "key": dict(zip(("kind", "day", "category", "status"), key)),
+                "expected": {"count": want["count"], "amount": round(want["amount"], 2)},
+                "actual": {"count": have["count"], "amount": round(have["amount"], 2)},
+            })
+    return differences
+
+async def rebuild_rollups(db):
+    """Recompute all rollup rows from scratch, atomically replacing the collection"""
+    pipeline = rollup_pipeline() + [
+        {"$set": {"updatedAt": "$$NOW"}},
+        {"$out": ROLLUP_COLLECTION},
+    ]
+    async for _ in db.offers.aggregate(pipeline):
+        pass
@@ -0,0 +1,234 @@
+from functools import lru_cache
+from pymongo import UpdateOne
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import re
+import unicodedata
+
+# Documents fetched per collection before ranking; short prefixes match many more
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "200"))
+SEARCH_MIN_LENGTH = 2
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "1000"))
+
+# Keys are an index structure, not part of the API documents
+SEARCH_KEYS_EXCLUDED = {"searchKeys": 0}
+
+# Letters NFKD does not decompose into a base letter
+_FOLD = str.maketrans({"ß": "ss", "æ": "ae", "œ": "oe", "ø": "o", "đ": "d", "ł": "l"})
+# German spelling without umlauts ("Mueller" for "Müller")
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue"})
+_TOKEN = re.compile(r"[0-9a-z]+")
+_PHONE_QUERY = re.compile(r"[\d\s+()/.-]+")
+
+def fold(text: str) -> str:
+    """Lower case without diacritics: "Zürich" -> "zurich", "Genève" -> "geneve" """
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text.translate(_FOLD))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+# Names and places repeat a lot, and typeahead ranks the same candidates on every keystroke
+@lru_cache(maxsize=65536)
+def word_keys(text: Optional[str]) -> frozenset:
+    """Folded words of a value, plus the ae/oe/ue spelling of words with umlauts"""
+    if not text:
+        return frozenset()
+    text = text.lower()
+    keys = frozenset(tokens(text))
+    if any(umlaut in text for umlaut in "äöü"):
+        keys |= frozenset(tokens(text.translate(_UMLAUTS)))
+    return keys
+
+def phone_keys(phone: Optional[str]) -> set:
+    """Digits of a phone number in international (41...) and national (0...) form"""
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if not digits:
+        return set()
+    keys = {digits}
+    if digits.startswith("41") and len(digits) > 9:
+        keys.add("0" + digits[2:])
+    elif digits.startswith("0") and len(digits) > 8:
+        keys.add("41" + digits[1:])
+    return keys
+
+def query_terms(query: str) -> List[str]:
+    """Folded search terms; a query that looks like a phone number is one digit term"""
+    if _PHONE_QUERY.fullmatch(query):
+        digits = re.sub(r"\D", "", query)
+        if len(digits) >= 3:
+            return [digits[2:] if digits.startswith("00") else digits]
+    return tokens(query)
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class SearchTarget:
+    """Which fields of a collection are searchable and how a hit is shown"""
+
+    def __init__(
+        self,
+        kind: str,
+        collection: str,
+        title_fields: List[str],
+        word_fields: List[str],
+        phone_fields: List[str],
+        label: Callable[[dict], Tuple[str, str]]
+    ):
+        self.kind = kind
+        self.collection = collection
+        self.title_fields = title_fields
+        self.word_fields = word_fields
+        self.phone_fields = phone_fields
+        self.label = label
+
+    @property
+    def fields(self) -> List[str]:
+        return self.title_fields + self.word_fields + self.phone_fields
+
+    @property
+    def projection(self) -> dict:
+        return {**{field: 1 for field in self.fields}, "searchKeys": 1}
+
+    def title_keys(self, doc: dict) -> set:
+        keys = set()
+        for field in self.title_fields:
+            keys |= word_keys(_get(doc, field))
+        return keys
+
+    def keys(self, doc: dict) -> List[str]:
+        """Normalized words a document is found by, stored as its `searchKeys`"""
+        keys = set(self.title_keys(doc))
+        for field in self.word_fields:
+            keys |= word_keys(_get(doc, field))
+        for field in self.phone_fields:
+            keys |= phone_keys(_get(doc, field))
+        return sorted(keys)
+
+    def touches(self, update_data: dict) -> bool:
+        """Whether a `$set` of `update_data` can change the search keys"""
+        roots = {field.split(".")[0] for field in self.fields}
+        return any(key.split(".")[0] in roots for key in update_data)
+
+def _customer_label(doc: dict) -> Tuple[str, str]:
+    address = doc.get("address") or {}
+    return (
+        f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
+        f"{doc.get('customerNumber', '')} · {address.get('zipCode', '')} {address.get('city', '')}".strip()
+    )
+
+def _offer_label(doc: dict) -> Tuple[str, str]:
+    customer = doc.get("customer") or {}
+    origin = (doc.get("currentLocation") or {}).get("city", "")
+    destination = (doc.get("newLocation") or {}).get("city", "")
+    return (
+        f"{doc.get('offerNumber', '')} {customer.get('firstName', '')} {customer.get('lastName', '')}".strip(),
+        f"{origin} → {destination}"
+    )
+
+SEARCH_TARGETS = {
+    "customers": SearchTarget(
+        "customer",
+        "customers",
+        title_fields=["firstName", "lastName", "customerNumber"],
+        word_fields=["email", "address.street", "address.zipCode", "address.city"],
+        phone_fields=["phone"],
+        label=_customer_label
+    ),
+    "offers": SearchTarget(
+        "offer",
+        "offers",
+        title_fields=["offerNumber", "customer.firstName", "customer.lastName"],
+        word_fields=[
+            "customer.email",
+            "currentLocation.street", "currentLocation.zipCode", "currentLocation.city",
+            "newLocation.street", "newLocation.zipCode", "newLocation.city",
+        ],
+        phone_fields=["customer.phone"],
+        label=_offer_label
+    ),
+}
+
+def prefix_query(terms: List[str]) -> dict:
+    """Every term must start one of the document's keys; anchored regexes become index ranges"""
+    clauses = [{"searchKeys": {"$regex": f"^{re.escape(term)}"}} for term in terms]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def score(target: SearchTarget, doc: dict, terms: List[str]) -> float:
+    """Exact words beat prefixes, and name or number hits beat address hits"""
+    keys = doc.get("searchKeys") or []
+    title = target.title_keys(doc)
+    total = 0.0
+    for term in terms:
+        best = 0.0
+        for key in keys:
+            if not key.startswith(term):
+                continue
+            value = 2.0 if key == term else 1.0 + len(term) / len(key)
+            if key in title:
+                value *= 2
+            best = max(best, value)
+        total += best
+    return total
+
+async def search(db, target: SearchTarget, query: str, limit: int) -> List[dict]:
+    """Ranked hits of one collection.
+
+    Typeahead goes through the multikey `searchKeys` index. When that
+    finds fewer than `limit` documents, whole words are also looked up in
+    the text index, which covers free-text fields such as notes.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    collection = db[target.collection]
+    hits: Dict[object, Tuple[float, dict]] = {}
+    async for doc in collection.find(prefix_query(terms), target.projection).limit(SEARCH_CANDIDATES):
+        hits[doc["_id"]] = (score(target, doc, terms), doc)
+
+    if len(hits) < limit and any(len(term) >= 3 for term in terms):
+        projection = {**target.projection, "textScore": {"$meta": "textScore"}}
+        text_hits = collection.find({"$text": {"$search": query}}, projection).sort([("textScore", {"$meta": "textScore"})]).limit(limit)
+        async for doc in text_hits:
+            if doc["_id"] not in hits:
+                # Ranked below prefix hits, which match what the user is typing
+                hits[doc["_id"]] = (doc["textScore"] / 100, doc)
+
+    ranked = sorted(hits.values(), key=lambda hit: hit[0], reverse=True)[:limit]
+    results = []
+    for hit_score, doc in ranked:
+        title, subtitle = target.label(doc)
+        results.append({"kind": target.kind, "id": str(doc["_id"]), "title": title, "subtitle": subtitle, "score": round(hit_score, 3)})
+    return results
+
+async def refresh_search_keys(db, target: SearchTarget, doc: dict):
+    """Store the keys of a document read with `target.projection` if they changed"""
+    keys = target.keys(doc)
+    if keys != doc.get("searchKeys"):
+        await db[target.collection].update_one({"_id": doc["_id"]}, {"$set": {"searchKeys": keys}})
+
+async def reindex(db, target: SearchTarget) -> int:
+    """Recompute `searchKeys` of a whole collection; returns the number of documents changed"""
+    collection = db[target.collection]
+    changed = 0
+    operations = []
+    async for doc in collection.find({}, target.projection).batch_size(REINDEX_BATCH_SIZE):
+        keys = target.keys(doc)
+        if keys != doc.get("searchKeys"):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"searchKeys": keys}}))
+        if len(operations) >= REINDEX_BATCH_SIZE:
+            changed += (await collection.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        changed += (await collection.bulk_write(operations, ordered=False)).modified_count
+    return changed
@@ -0,0 +1,139 @@
+from pymongo.errors import OperationFailure
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Writers add this to their update so every worker notices the change
+BUMP_VERSION = {"$inc": {"version": 1}}
+
+# Upper bound of the pause between attempts to reopen a failed change stream
+WATCH_RETRY_MAX_SECONDS = float(os.getenv("WATCH_RETRY_MAX_SECONDS", "300"))
+
+def _opaque_tag(entity_tag: str) -> str:
+    entity_tag = entity_tag.strip()
+    return entity_tag[2:] if entity_tag.startswith("W/") else entity_tag
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match header matches `etag` (RFC 9110 weak comparison).
+
+    Handles `*`, comma-separated lists and `W/` prefixes on either side.
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == wanted for candidate in if_none_match.split(","))
+
+class VersionedDocumentCache:
+    """In-process cache of a single Mongo document with cross-worker invalidation.
+
+    Writers bump the document's `version` field (see BUMP_VERSION). Other
+    workers learn about the change through a change stream when the server
+    supports it (replica sets), and otherwise by polling only the `version`
+    field at most every `poll_interval` seconds. A change stream that fails
+    is reopened with exponential backoff; the cache polls meanwhile.
+    """
+
+    def __init__(self, collection, doc_id: Any, poll_interval: float = 5.0):
+        self.collection = collection
+        self.doc_id = doc_id
+        self.poll_interval = poll_interval
+        self.doc: Optional[dict] = None
+        self.version: Optional[int] = None
+        self.watching = False
+        self._checked_at = 0.0
+        self._memo: Dict[str, Any] = {}
+        # Bumped by every invalidation, so a load that raced with one can tell
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def etag(self) -> Optional[str]:
+        if self.version is None:
+            return None
+        return f'"{self.doc_id}-v{self.version}"'
+
+    def invalidate(self):
+        self._generation += 1
+        self.doc = None
+        self.version = None
+        self._memo = {}
+
+    async def _load(self):
+        while True:
+            generation = self._generation
+            doc = await self.collection.find_one({"_id": self.doc_id})
+            # Invalidated while reading: the document may predate that change
+            if generation == self._generation:
+                break
+        self.doc = doc
+        self.version = doc.get("version", 0) if doc is not None else None
+        self._memo = {}
+        self._checked_at = time.monotonic()
+
+    async def _changed_elsewhere(self) -> bool:
+        current = await self.collection.find_one({"_id": self.doc_id}, {"version": 1})
+        self._checked_at = time.monotonic()
+        return current is None or current.get("version", 0) != self.version
+
+    async def get(self) -> Optional[dict]:
+        """Cached document (treat as read-only); None if it does not exist"""
+        if self.doc is not None and (self.watching or time.monotonic() - self._checked_at < self.poll_interval):
+            return self.doc
+
+        async with self._lock:
+            if self.doc is None or await self._changed_elsewhere():
+                await self._load()
+        return self.doc
+
+    def memo(self, key: str, factory: Callable[[dict], Any]) -> Any:
+        """Value derived from the current document, computed once per version"""
+        if key not in self._memo:
+            self._memo[key] = factory(self.doc)
+        return self._memo[key]
+
+    async def _watch_once(self):
+        pipeline = [{"$match": {"documentKey._id": self.doc_id}}]
+        async with self.collection.watch(pipeline) as stream:
+            self.watching = True
+            # Anything written before the stream opened is not replayed
+            self.invalidate()
+            async for _ in stream:
+                self.invalidate()
+
+    async def _watch(self):
+        delay = self.poll_interval
+        while True:
+            opened_at = time.monotonic()
+            try:
+                await self._watch_once()
+            except OperationFailure as exc:
+                logger.info("Change streams unavailable for %s, polling version for %.0fs: %s", self.doc_id, delay, exc)
+            except Exception as exc:
+                logger.warning("Change stream for %s stopped, polling version for %.0fs: %s", self.doc_id, delay, exc)
+            finally:
+                self.watching = False
+            # A stream that ran for a while starts over with a short pause
+            if time.monotonic() - opened_at > WATCH_RETRY_MAX_SECONDS:
+                delay = self.poll_interval
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WATCH_RETRY_MAX_SECONDS)
+
+    def start_watching(self):
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
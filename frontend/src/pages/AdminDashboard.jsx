@@ -5,6 +5,7 @@ import { Button } from '../components/ui/button';
 import { FileText, Users, TrendingUp, Calendar, Eye, Plus } from 'lucide-react';
 import { useAuth } from '../context/AuthContext';
 import { offerService } from '../services/offerService';
+import { statsService } from '../services/statsService';
 
 const AdminDashboard = () => {
   const navigate = useNavigate();
@@ -32,31 +33,18 @@ const AdminDashboard = () => {
   const loadData = async () => {
     try {
       setIsLoading(true);
-      const offers = await offerService.getAll();
-      
-      // Calculate stats
-      const total = offers.length;
-      const currentMonth = new Date().getMonth();
-      const monthlyCount = offers.filter(offer => {
-        const offerDate = new Date(offer.createdAt);
-        return offerDate.getMonth() === currentMonth;
-      }).length;
-      
-      const revenue = offers.reduce((sum, offer) => {
-        return sum + (offer.pricing?.total || 0);
-      }, 0);
+      const [overview, recent] = await Promise.all([
+        statsService.getOverview(),
+        offerService.getAll({ limit: 5, view: 'summary' })
+      ]);
 
       setStats({
-        totalOffers: total,
-        monthlyOffers: monthlyCount,
-        totalRevenue: revenue,
-        pendingOffers: offers.filter(o => o.status === 'draft' || o.status === 'sent').length
+        totalOffers: overview.offers.total,
+        monthlyOffers: overview.offers.thisMonth,
+        totalRevenue: overview.offers.revenue.total,
+        pendingOffers: overview.offers.pending
       });
 
-      // Get recent 5 offers
-      const recent = offers
-        .sort((a, b) => new Date(b.createdAt) - new Date(a.createdAt))
-        .slice(0, 5);
       setRecentOffers(recent);
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
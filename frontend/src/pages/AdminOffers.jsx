@@ -53,7 +53,7 @@ const AdminOffers = () => {
 
   const loadOffers = async () => {
     try {
-      const data = await offerService.getAll();
+      const data = await offerService.getAll({ view: 'summary' });
       setOffers(data);
       setFilteredOffers(data);
     } catch (error) {
@@ -0,0 +1,13 @@
+import api from './api';
+
+export const statsService = {
+  getOverview: async () => {
+    try {
+      const response = await api.get('/stats/overview');
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching statistics:', error);
+      throw error;
+    }
+  }
+};
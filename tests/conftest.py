@@ -0,0 +1,112 @@
+"""
+Shared fixtures for the backend tests
+
+The API runs in-process against an in-memory Mongo (mongomock-motor), so
+the tests need neither a server nor a database.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT_DIR), str(ROOT_DIR / "backend")]
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "offerte_test")
+# Hashing at full cost only slows the suite down
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+ADMIN_USERNAME = os.getenv("DEFAULT_ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.getenv("DEFAULT_ADMIN_PASSWORD", "admin123")
+
+def _copy_projection_before_use():
+    """mongomock pops and re-adds `_id` on the projection it is given.
+
+    The routes share module-level projections such as SEARCH_KEYS_EXCLUDED,
+    which would turn into mixed inclusion/exclusion projections; pymongo
+    never modifies them.
+    """
+    from mongomock.collection import Collection
+
+    copy_only_fields = Collection._copy_only_fields
+
+    def copy_with_own_projection(self, doc, fields, container):
+        return copy_only_fields(self, doc, dict(fields) if isinstance(fields, dict) else fields, container)
+
+    Collection._copy_only_fields = copy_with_own_projection
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The application module, bound to an in-memory database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    os.environ["PDF_DIR"] = str(tmp_path_factory.mktemp("pdfs"))
+    import motor.motor_asyncio
+
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    _copy_projection_before_use()
+    import backend.server
+    return backend.server
+
+@pytest.fixture(scope="session")
+def client(server):
+    """Test client with the startup hooks (indexes, default admin) run"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def db(server):
+    return server.db
+
+@pytest.fixture(scope="session")
+def call(client):
+    """Run a coroutine function on the client's event loop, where the database lives"""
+    def run(async_fn, *args):
+        return client.portal.call(async_fn, *args)
+    return run
+
+@pytest.fixture(scope="session")
+def login(client):
+    """Log a user in and return their Authorization header"""
+    def log_in(username: str = ADMIN_USERNAME, password: str = ADMIN_PASSWORD) -> dict:
+        response = client.post("/api/auth/login", data={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return log_in
+
+@pytest.fixture(scope="session")
+def admin(login):
+    """Authorization header of the default admin"""
+    return login()
+
+@pytest.fixture(scope="session")
+def company_settings(client, admin):
+    """Make sure the settings document exists before anything is priced"""
+    response = client.get("/api/settings/company", headers=admin)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.fixture(scope="session")
+def offer_payload():
+    """Build an OfferCreate body; keyword arguments replace top-level fields"""
+    def build(**overrides) -> dict:
+        payload = {
+            "category": "umzug",
+            "customer": {
+                "salutation": "Frau",
+                "firstName": "Anna",
+                "lastName": "Muster",
+                "email": "anna.muster@example.com",
+                "phone": "079 123 45 67",
+            },
+            "currentLocation": {"street": "Bahnhofstrasse 1", "zipCode": "8001", "city": "Zürich"},
+            "newLocation": {"street": "Bundesplatz 3", "zipCode": "3011", "city": "Bern", "distance": 120},
+            "serviceDetails": {"movingDate": "2030-03-15", "startTime": "08:00", "workers": 3, "trucks": 1},
+            "pricing": {"basePrice": 1000, "subtotal": 1000, "taxRate": 7.7, "taxAmount": 77, "total": 1077},
+        }
+        payload.update(overrides)
+        return payload
+    return build
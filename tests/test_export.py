@@ -0,0 +1,91 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from models.customer import Customer
+from utils.export import export_response, model_columns
+
+EXPORT_ROWS = 1_000_000
+# Allowed growth of the resident set while streaming; the export itself is several hundred MB
+MEMORY_LIMIT_BYTES = 64 * 1024 * 1024
+
+def _resident_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+class _Cursor:
+    """Async cursor that makes up its documents on the fly, like a server-side cursor"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.closed = False
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def __aiter__(self):
+        return self._documents()
+
+    async def _documents(self):
+        created_at = datetime(2030, 1, 1)
+        for number in range(self.count):
+            yield {
+                "_id": ObjectId(),
+                "customerNumber": str(10001 + number),
+                "salutation": "Frau",
+                "firstName": "Anna",
+                "lastName": f"Muster {number}",
+                "email": f"anna{number}@example.com",
+                "phone": "079 123 45 67",
+                "address": {"street": "Bahnhofstrasse 1", "zipCode": "8001", "city": "Zürich"},
+                "createdAt": created_at,
+            }
+
+    async def close(self):
+        self.closed = True
+
+class _Collection:
+    def __init__(self, count: int):
+        self.cursor = _Cursor(count)
+
+    def find(self, query, projection=None):
+        return self.cursor
+
+def _stream(export_format: str, count: int):
+    collection = _Collection(count)
+    response = export_response(collection, {}, export_format, Customer, "customers")
+
+    async def consume():
+        lines = size = growth = 0
+        baseline = _resident_bytes()
+        async for chunk in response.body_iterator:
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+            growth = max(growth, _resident_bytes() - baseline)
+        return lines, size, growth
+
+    lines, size, growth = asyncio.run(consume())
+    return collection.cursor, lines, size, growth
+
+needs_proc = pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="resident set size is read from /proc")
+
+@needs_proc
+@pytest.mark.parametrize("export_format, header_lines", [("ndjson", 0), ("csv", 1)])
+def test_export_streams_in_bounded_memory(export_format, header_lines):
+    cursor, lines, size, growth = _stream(export_format, EXPORT_ROWS)
+
+    assert lines == EXPORT_ROWS + header_lines
+    assert size > 2 * MEMORY_LIMIT_BYTES
+    assert growth < MEMORY_LIMIT_BYTES, f"resident set grew by {growth / 1e6:.1f} MB"
+    assert cursor.closed
+
+def test_csv_header_follows_the_model():
+    columns = model_columns(Customer)
+    assert "address.zipCode" in columns
+    assert "_id" in columns
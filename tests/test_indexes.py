@@ -0,0 +1,33 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from utils.indexes import QUERY_SHAPES, ensure_indexes, find_collection_scans
+
+# Query plans need a real server; mongomock has no planner
+MONGO_TEST_URL = os.getenv("MONGO_TEST_URL", "mongodb://localhost:27017")
+
+def test_every_route_query_is_served_by_an_index():
+    async def scenario():
+        client = AsyncIOMotorClient(MONGO_TEST_URL, serverSelectionTimeoutMS=1000)
+        try:
+            try:
+                await client.admin.command("ping")
+            except PyMongoError:
+                pytest.skip(f"no mongod reachable at {MONGO_TEST_URL}")
+
+            db = client[f"index_check_{uuid.uuid4().hex[:8]}"]
+            try:
+                report = await ensure_indexes(db)
+                assert not any(entry["failed"] for entry in report.values()), report
+                assert await find_collection_scans(db, QUERY_SHAPES) == []
+            finally:
+                await client.drop_database(db.name)
+        finally:
+            client.close()
+
+    asyncio.run(scenario())
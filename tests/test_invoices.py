@@ -0,0 +1,52 @@
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+
+def _invoice(client, admin):
+    response = client.post("/api/invoices", headers=admin, json={
+        "offerId": f"versioning-{uuid.uuid4().hex[:8]}",
+        "customerId": "versioning-test",
+        "invoiceDate": "2030-01-31",
+        "dueDate": "2030-02-28",
+        "items": [{"description": "Umzug", "quantity": 1, "unitPrice": 1000, "total": 1000}],
+        "taxRate": 8.1,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_stale_version_is_rejected(client, admin, db, call):
+    invoice = _invoice(client, admin)
+    assert invoice["version"] == 0
+
+    response = client.put(f"/api/invoices/{invoice['_id']}", headers=admin, json={
+        "version": 0,
+        "dueDate": "2030-03-31",
+        "items": [{"description": "Umzug", "quantity": 2, "unitPrice": 1000, "total": 2000}],
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["version"] == 1
+    assert response.json()["total"] == 2000 * 1.081
+
+    # A second editor still holding version 0 must not overwrite the first edit
+    response = client.put(f"/api/invoices/{invoice['_id']}", headers=admin, json={"version": 0, "notes": "stale"})
+    assert response.status_code == 409
+    assert "version 1" in response.json()["detail"]
+
+    stored = client.get(f"/api/invoices/{invoice['_id']}", headers=admin).json()
+    assert stored["version"] == 1
+    assert stored["notes"] is None
+    assert stored["dueDate"].startswith("2030-03-31")
+    # Stored like create_invoice stores it; BSON has no plain date type
+    raw = call(db.invoices.find_one, {"_id": ObjectId(invoice["_id"])})
+    assert raw["dueDate"] == datetime(2030, 3, 31)
+
+def test_update_without_version_overwrites(client, admin):
+    invoice = _invoice(client, admin)
+    response = client.put(f"/api/invoices/{invoice['_id']}", headers=admin, json={"status": "sent"})
+    assert response.status_code == 200, response.text
+    assert response.json()["version"] == 1
+
+def test_update_of_unknown_invoice_is_404(client, admin):
+    response = client.put(f"/api/invoices/{uuid.uuid4().hex[:24]}", headers=admin, json={"version": 0, "notes": "x"})
+    assert response.status_code == 404
@@ -0,0 +1,118 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+def _wait_for_batch(client, headers, batch_id):
+    for _ in range(200):
+        batch = client.get(f"/api/invoices/batches/{batch_id}", headers=headers).json()
+        if batch["status"] in ("done", "failed"):
+            return batch
+        time.sleep(0.05)
+    raise AssertionError(f"batch {batch_id} did not finish")
+
+def _accepted_offer(client, headers, offer_payload, email, **overrides):
+    customer = {**offer_payload()["customer"], "email": email}
+    created = client.post("/api/offers", json=offer_payload(customer=customer, **overrides), headers=headers)
+    assert created.status_code == 200, created.text
+    offer_id = created.json()["_id"]
+    assert client.put(f"/api/offers/{offer_id}", json={"status": "accepted"}, headers=headers).status_code == 200
+    return offer_id
+
+def test_batch_invoices_offers_created_through_the_api(client, admin, db, call, offer_payload):
+    tag = uuid.uuid4().hex[:8]
+    existing = client.post("/api/customers", headers=admin, json={
+        "salutation": "Herr", "firstName": "Beat", "lastName": "Bestand", "email": f"beat.{tag}@example.com",
+        "phone": "061 123 45 67", "address": {"street": "Rheinweg 2", "zipCode": "4058", "city": "Basel"},
+    })
+    assert existing.status_code == 200, existing.text
+
+    new_first = _accepted_offer(client, admin, offer_payload, f"neu.{tag}@example.com")
+    new_again = _accepted_offer(client, admin, offer_payload, f"NEU.{tag}@Example.com")
+    known = _accepted_offer(client, admin, offer_payload, f"beat.{tag}@example.com")
+    offer_ids = [new_first, new_again, known]
+
+    started = client.post("/api/invoices/batches", headers=admin)
+    assert started.status_code == 200, started.text
+    batch = _wait_for_batch(client, admin, started.json()["_id"])
+    assert batch["status"] == "done", batch
+    assert batch["errors"] == []
+    assert batch["created"] >= 3
+
+    offers = {str(offer["_id"]): offer for offer in call(db.offers.find({"_id": {"$in": [ObjectId(i) for i in offer_ids]}}).to_list, None)}
+    invoices = {invoice["offerId"]: invoice for invoice in call(db.invoices.find({"offerId": {"$in": offer_ids}}).to_list, None)}
+    assert set(invoices) == set(offer_ids)
+
+    # Both spellings of the new email share one newly created customer
+    assert offers[new_first]["customerId"] == offers[new_again]["customerId"]
+    assert invoices[new_first]["customerId"] == offers[new_first]["customerId"]
+    created = call(db.customers.find_one, {"_id": ObjectId(offers[new_first]["customerId"])})
+    assert created["email"] == f"neu.{tag}@example.com"
+    assert created["address"]["city"] == "Zürich"
+    assert created["customerNumber"]
+
+    assert offers[known]["customerId"] == existing.json()["_id"]
+    assert invoices[known]["customerId"] == existing.json()["_id"]
+    for offer_id in offer_ids:
+        assert offers[offer_id]["invoiceId"] == str(invoices[offer_id]["_id"])
+
+def test_explicit_customer_id_is_kept(client, admin, db, call, offer_payload):
+    customer_id = str(ObjectId())
+    offer_id = _accepted_offer(client, admin, offer_payload, f"explicit.{uuid.uuid4().hex[:8]}@example.com", customerId=customer_id)
+
+    batch = _wait_for_batch(client, admin, client.post("/api/invoices/batches", headers=admin).json()["_id"])
+    assert batch["status"] == "done"
+
+    invoice = call(db.invoices.find_one, {"offerId": offer_id})
+    assert invoice["customerId"] == customer_id
+
+def test_running_batch_is_not_resumed_twice(client, admin, db, call):
+    from utils.invoicing import claim_invoice_batch, create_invoice_batch
+
+    batch_id = call(create_invoice_batch, db)
+    claimed = call(claim_invoice_batch, db, batch_id)
+    assert claimed["status"] == "running"
+    assert call(claim_invoice_batch, db, batch_id) is None
+
+    response = client.post(f"/api/invoices/batches/{batch_id}/resume", headers=admin)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Batch is already running"
+
+    # A runner that stopped saving progress has died; its batch can be taken over
+    call(db.invoice_batches.update_one, {"_id": batch_id}, {"$set": {"updatedAt": datetime.utcnow() - timedelta(hours=1)}})
+    response = client.post(f"/api/invoices/batches/{batch_id}/resume", headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json()["runId"] != claimed["runId"]
+    assert _wait_for_batch(client, admin, str(batch_id))["status"] == "done"
+
+    assert client.post(f"/api/invoices/batches/{batch_id}/resume", headers=admin).json()["detail"] == "Batch already finished"
+
+def test_runner_that_lost_its_batch_stops(db, call):
+    from utils.invoicing import claim_invoice_batch, create_invoice_batch, run_invoice_batch
+
+    batch_id = call(create_invoice_batch, db)
+    stale = call(claim_invoice_batch, db, batch_id)
+    call(db.invoice_batches.update_one, {"_id": batch_id}, {"$set": {"runId": "other-runner"}})
+
+    call(run_invoice_batch, db, stale)
+    batch = call(db.invoice_batches.find_one, {"_id": batch_id})
+    assert batch["status"] == "running"
+    assert batch["runId"] == "other-runner"
+
+def test_customers_are_matched_whatever_the_case_of_their_email(client, admin, db, call, offer_payload):
+    tag = uuid.uuid4().hex[:8]
+    existing = client.post("/api/customers", headers=admin, json={
+        "salutation": "Herr", "firstName": "Max", "lastName": "Gross", "email": f"Max.{tag}@Example.CH",
+        "phone": "044 123 45 67", "address": {"street": "Seestrasse 9", "zipCode": "8002", "city": "Zürich"},
+    })
+    assert existing.status_code == 200, existing.text
+    customer_id = existing.json()["_id"]
+    assert "emailLower" not in client.get(f"/api/customers/{customer_id}", headers=admin).json()
+
+    offer_id = _accepted_offer(client, admin, offer_payload, f"max.{tag}@example.ch")
+    batch = _wait_for_batch(client, admin, client.post("/api/invoices/batches", headers=admin).json()["_id"])
+    assert batch["status"] == "done"
+
+    assert call(db.offers.find_one, {"_id": ObjectId(offer_id)})["customerId"] == customer_id
+    assert call(db.customers.count_documents, {"emailLower": f"max.{tag}@example.ch"}) == 1
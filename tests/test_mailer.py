@@ -0,0 +1,160 @@
+import asyncio
+import socket
+import time
+import uuid
+from datetime import datetime
+from email import message_from_string, policy
+
+import aiosmtplib
+import pytest
+
+from utils.mailer import TokenBucket, is_permanent, retry_delay, EMAIL_RETRY_BASE_SECONDS
+
+controller = pytest.importorskip("aiosmtpd.controller")
+from aiosmtpd.smtp import AuthResult
+
+class _Handler:
+    def __init__(self):
+        self.messages = []
+        self.logins = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content.decode())
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins += 1
+        return AuthResult(success=auth_data.login == b"mailer" and auth_data.password == b"secret")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def smtp_server():
+    handler = _Handler()
+    server = controller.Controller(handler, hostname="127.0.0.1", port=_free_port(), authenticator=handler.authenticate, auth_require_tls=False)
+    server.start()
+    yield server, handler
+    server.stop()
+
+@pytest.fixture(scope="module")
+def email_settings(client, admin, company_settings, smtp_server):
+    server, _ = smtp_server
+    response = client.put("/api/settings/email", headers=admin, json={
+        "smtpHost": "127.0.0.1", "smtpPort": server.port, "smtpUser": "mailer", "smtpPassword": "secret",
+        "fromEmail": "info@example.ch", "fromName": "Umzug AG",
+    })
+    assert response.status_code == 200, response.text
+
+def _wait_for_job(client, headers, job_id):
+    for _ in range(200):
+        job = client.get(f"/api/email-jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("sent", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"email job {job_id} is still {job['status']}")
+
+def _enqueue(call, to):
+    from backend.routes.emails import mail_queue
+
+    job = {
+        "kind": "test", "documentId": "test", "to": [to], "subject": "Test", "body": "Test",
+        "attachments": [], "status": "queued", "attempts": 0, "nextAttemptAt": datetime.utcnow(),
+    }
+    return call(mail_queue.enqueue, job)
+
+@pytest.fixture
+def pdf_dir(server, tmp_path, monkeypatch):
+    """An empty PDF directory, so nothing is rendered yet"""
+    from backend.routes import pdf
+
+    monkeypatch.setattr(pdf, "PDF_DIR", tmp_path)
+    return tmp_path
+
+def test_offer_email_is_delivered_and_marks_the_offer_sent(client, admin, offer_payload, email_settings, smtp_server, pdf_dir):
+    _, handler = smtp_server
+    sent_before = len(handler.messages)
+    offer = client.post("/api/offers", json=offer_payload(), headers=admin).json()
+    assert not any(pdf_dir.iterdir())
+
+    queued = client.post(f"/api/offers/{offer['_id']}/send-email", headers=admin)
+    assert queued.status_code == 200, queued.text
+    job = _wait_for_job(client, admin, queued.json()["jobId"])
+
+    assert job["status"] == "sent"
+    assert job["attempts"] == 1
+    assert len(handler.messages) == sent_before + 1
+    message = handler.messages[-1]
+    assert f"Ihre Offerte {offer['offerNumber']}" in message
+    assert f"Message-ID: <{job['_id']}@example.ch>" in message
+    # The first send waits for the rendering instead of going out without the PDF
+    pdf, = pdf_dir.iterdir()
+    attachment, = message_from_string(message, policy=policy.default).iter_attachments()
+    assert attachment.get_filename() == pdf.name
+    assert attachment.get_content() == pdf.read_bytes()
+    assert job["attachments"] == [str(pdf)]
+    assert client.get(f"/api/offers/{offer['_id']}", headers=admin).json()["status"] == "sent"
+
+def test_offer_email_is_not_queued_without_its_pdf(client, admin, offer_payload, email_settings, pdf_dir, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from backend.routes import pdf
+
+    def fail(*args):
+        raise RuntimeError("renderer crashed")
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(pdf, "_get_pool", lambda: executor)
+    monkeypatch.setattr(pdf, "render_to_file", fail)
+    offer = client.post("/api/offers", json=offer_payload(), headers=admin).json()
+
+    response = client.post(f"/api/offers/{offer['_id']}/send-email", headers=admin)
+    assert response.status_code == 503
+    assert "renderer crashed" in response.json()["detail"]
+    executor.shutdown()
+
+def test_sessions_are_reused_across_messages(client, admin, call, email_settings, smtp_server):
+    _, handler = smtp_server
+    _wait_for_job(client, admin, _enqueue(call, "warmup@example.ch"))
+    logins = handler.logins
+
+    jobs = [_enqueue(call, f"kunde{index}@example.ch") for index in range(5)]
+    assert all(_wait_for_job(client, admin, job_id)["status"] == "sent" for job_id in jobs)
+    # Pooled sessions stay logged in; at most one new session per worker
+    from backend.routes.emails import mail_queue
+    assert handler.logins - logins <= mail_queue.workers
+
+def test_rejected_recipient_fails_without_retry(client, admin, call, email_settings):
+    job = _wait_for_job(client, admin, _enqueue(call, f"bounce-{uuid.uuid4().hex[:6]}@example.ch"))
+    assert job["status"] == "failed"
+    assert job["attempts"] == 1
+    assert "No such user" in job["lastError"]
+
+def test_failure_classification():
+    assert is_permanent(aiosmtplib.SMTPResponseException(550, "No such user"))
+    assert not is_permanent(aiosmtplib.SMTPResponseException(421, "Try again later"))
+    assert not is_permanent(aiosmtplib.SMTPAuthenticationError(535, "Bad credentials"))
+    assert not is_permanent(aiosmtplib.SMTPServerDisconnected("gone"))
+    assert is_permanent(FileNotFoundError("attachment.pdf"))
+
+def test_retry_delay_grows_with_jitter():
+    assert 0.8 * EMAIL_RETRY_BASE_SECONDS <= retry_delay(1) <= 1.2 * EMAIL_RETRY_BASE_SECONDS
+    assert 0.8 * 4 * EMAIL_RETRY_BASE_SECONDS <= retry_delay(3) <= 1.2 * 4 * EMAIL_RETRY_BASE_SECONDS
+
+def test_token_bucket_limits_the_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=50)
+        started = time.monotonic()
+        for _ in range(75):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first 50 are a burst, the other 25 take half a second at 50/s
+    assert 0.4 < asyncio.run(scenario()) < 1.5
@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+CONCURRENCY = 500
+
+def _assert_contiguous(numbers):
+    values = sorted(int(number) for number in numbers)
+    assert len(set(values)) == len(values), "duplicate numbers"
+    assert values == list(range(values[0], values[0] + len(values))), "gaps in the numbering"
+
+def test_concurrent_allocations_are_unique_and_gapless(db, call):
+    from utils.counters import NumberAllocator
+
+    allocators = [NumberAllocator(db.counters, "concurrencyTest", start=1, width=6) for _ in range(4)]
+
+    async def allocate():
+        # Several allocators stand in for several workers sharing one counter
+        return await asyncio.gather(*(allocators[index % 4].next() for index in range(CONCURRENCY)))
+
+    numbers = call(allocate)
+    assert len(numbers) == CONCURRENCY
+    _assert_contiguous(numbers)
+
+def test_concurrent_invoices_get_unique_gapless_numbers(server, admin, call):
+    body = {
+        "customerId": "concurrency-test",
+        "invoiceDate": "2030-01-31",
+        "dueDate": "2030-03-02",
+        "items": [{"description": "Umzug", "quantity": 1, "unitPrice": 100, "total": 100}],
+    }
+
+    async def create_invoices():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Distinct offerIds: mongomock enforces the partial unique index on offerId for every document
+            return await asyncio.gather(*(
+                client.post("/api/invoices", json={**body, "offerId": f"concurrency-{index}"}, headers=admin)
+                for index in range(CONCURRENCY)
+            ))
+
+    responses = call(create_invoices)
+    assert [response.status_code for response in responses] == [200] * CONCURRENCY
+    _assert_contiguous(response.json()["invoiceNumber"] for response in responses)
+
+def test_offer_number_preview_reserves_nothing(client, admin, offer_payload):
+    previews = {client.get("/api/offers/next-number", headers=admin).json()["nextOfferNumber"] for _ in range(3)}
+    assert len(previews) == 1
+
+    response = client.post("/api/offers", json=offer_payload(offerNumber="client-chosen"), headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json()["offerNumber"] == previews.pop()
+
+    following = client.post("/api/offers", json=offer_payload(), headers=admin)
+    assert int(following.json()["offerNumber"]) == int(response.json()["offerNumber"]) + 1
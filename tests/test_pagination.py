@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.pagination import decode_cursor, encode_cursor, fetch_page
+
+def test_cursor_round_trip():
+    doc = {"_id": "65a1b2c3d4e5f6a7b8c9d0e1", "createdAt": datetime(2030, 5, 17, 9, 30, 12, 345000)}
+    created_at, last_id = decode_cursor(encode_cursor(doc))
+    assert created_at == doc["createdAt"]
+    assert str(last_id) == doc["_id"]
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", "AAAA", "x" * 40])
+def test_malformed_cursors_are_rejected(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+def test_keyset_pages_cover_every_document_once(db, call):
+    collection = db[f"pagination_{uuid.uuid4().hex[:8]}"]
+    start = datetime(2030, 1, 1)
+    # Groups of three share a timestamp, so _id has to break the ties
+    docs = [{"n": n, "createdAt": start + timedelta(seconds=n // 3)} for n in range(25)]
+    call(collection.insert_many, docs)
+    expected = [doc["n"] for doc in sorted(docs, key=lambda doc: (doc["createdAt"], doc["_id"]), reverse=True)]
+
+    seen, cursor, pages = [], "", 0
+    while cursor is not None:
+        page, cursor, has_more = call(fetch_page, collection, {}, 7, 0, cursor)
+        assert has_more == (cursor is not None)
+        seen.extend(doc["n"] for doc in page)
+        pages += 1
+
+    assert seen == expected
+    assert pages == 4
+
+def test_keyset_pages_respect_the_filter(db, call):
+    collection = db[f"pagination_{uuid.uuid4().hex[:8]}"]
+    start = datetime(2030, 1, 1)
+    call(collection.insert_many, [{"n": n, "even": n % 2 == 0, "createdAt": start + timedelta(minutes=n)} for n in range(20)])
+
+    first, cursor, _ = call(fetch_page, collection, {"even": True}, 4, 0, "")
+    second, cursor, has_more = call(fetch_page, collection, {"even": True}, 4, 0, cursor)
+    assert [doc["n"] for doc in first + second] == [18, 16, 14, 12, 10, 8, 6, 4]
+    assert has_more
+
+def test_list_endpoint_pages_with_cursor(client, admin):
+    response = client.get("/api/customers", params={"cursor": "", "limit": 1}, headers=admin)
+    assert response.status_code == 200
+    assert set(response.json()) == {"items", "next_cursor", "hasMore"}
+
+    response = client.get("/api/customers", params={"cursor": "garbage"}, headers=admin)
+    assert response.status_code == 400
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils import auth as auth_utils
+
+def test_hash_pool_rejects_work_beyond_the_pending_limit(monkeypatch):
+    release = threading.Event()
+
+    def slow_verify(plain_password, hashed_password):
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(auth_utils, "PASSWORD_HASH_MAX_PENDING", 2)
+    monkeypatch.setattr(auth_utils, "verify_password", slow_verify)
+
+    async def scenario():
+        pending = [asyncio.ensure_future(auth_utils.verify_password_async("pw", "hash")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(auth_utils.PasswordHasherBusy):
+            await auth_utils.verify_password_async("pw", "hash")
+
+        release.set()
+        assert await asyncio.gather(*pending) == [True, True]
+        assert auth_utils._hash_pending == 0
+        # Capacity is back once the queue drains
+        assert await auth_utils.verify_password_async("pw", "hash") is True
+
+    asyncio.run(scenario())
+
+def test_login_answers_503_when_the_hash_pool_is_full(client, monkeypatch):
+    monkeypatch.setattr(auth_utils, "_hash_pending", auth_utils.PASSWORD_HASH_MAX_PENDING)
+
+    response = client.post("/api/auth/login", data={"username": "admin", "password": "admin123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_hashing_does_not_block_the_event_loop(monkeypatch):
+    release = threading.Event()
+
+    def slow_verify(plain_password, hashed_password):
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(auth_utils, "verify_password", slow_verify)
+
+    async def scenario():
+        login = asyncio.ensure_future(auth_utils.verify_password_async("pw", "hash"))
+        # The loop keeps serving other work while the hash runs
+        await asyncio.sleep(0.01)
+        assert not login.done()
+        release.set()
+        assert await login is True
+
+    asyncio.run(scenario())
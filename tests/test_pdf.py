@@ -0,0 +1,10 @@
+def test_rendered_pdfs_are_served_from_pdf_dir(client, server):
+    from backend.routes import pdf
+
+    assert "backend" not in pdf.PDF_DIR.parts
+    (pdf.PDF_DIR / "served.pdf").write_bytes(b"%PDF-1.4 test")
+
+    response = client.get(f"{pdf.PDF_URL_PREFIX}/served.pdf")
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.4 test"
+    assert pdf.pdf_file(f"{pdf.PDF_URL_PREFIX}/served.pdf") == pdf.PDF_DIR / "served.pdf"
@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+
+from utils.pricing import TRUCK_HOURLY_RATE, compute_pricing, tax_of
+
+SERVICES = [
+    {"serviceId": "packing", "selected": True, "price": 240},
+    {"serviceId": "piano", "selected": False, "price": 500},
+    {"serviceId": "disposal", "selected": True, "price": 85.5},
+]
+
+@pytest.fixture(scope="module")
+def categories(client, admin):
+    """category id by pricing model, each with its own rates"""
+    created = {}
+    for model, base_price, hourly_rate in (("hourly", 150, 65), ("fixed", 890, 0), ("custom", 0, 0)):
+        category_id = f"{model}-{uuid.uuid4().hex[:6]}"
+        response = client.post("/api/categories", headers=admin, json={
+            "categoryId": category_id, "name": {"de": model}, "description": {"de": model},
+            "pricingModel": model, "basePrice": base_price, "hourlyRate": hourly_rate,
+        })
+        assert response.status_code == 200, response.text
+        created[model] = category_id
+    return created
+
+def _offer(client, admin, offer_payload, category, **pricing):
+    payload = offer_payload(category=category, additionalServices=SERVICES, pricing={"basePrice": 1000, **pricing})
+    response = client.post("/api/offers", json=payload, headers=admin)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_batch_pricing_matches_compute_pricing(client, admin, offer_payload, company_settings, categories):
+    hourly = _offer(client, admin, offer_payload, categories["hourly"])
+    fixed = _offer(client, admin, offer_payload, categories["fixed"], discount=50, discountType="fixed")
+    custom = _offer(client, admin, offer_payload, categories["custom"], basePrice=1234.5, discount=10)
+    items = [
+        {"offerId": hourly["_id"], "hours": 6.5, "discount": 5},
+        {"offerId": fixed["_id"]},
+        {"offerId": custom["_id"], "discountType": "fixed"},
+    ]
+
+    response = client.post("/api/offers/calculate-batch", headers=admin, json={"items": items, "persist": False})
+    assert response.status_code == 200, response.text
+    results = {result["offerId"]: result["pricing"] for result in response.json()["results"]}
+
+    tax_rate, tax_enabled = tax_of(company_settings)
+    services = 240 + 85.5
+    workers, trucks = 3, 1
+    hourly_base = 150 + 6.5 * (65 * workers + TRUCK_HOURLY_RATE * trucks)
+    expected = {
+        hourly["_id"]: {**compute_pricing(hourly_base, services, 5, "percentage", tax_rate, tax_enabled), "hours": 6.5},
+        fixed["_id"]: {**compute_pricing(890, services, 50, "fixed", tax_rate, tax_enabled), "hours": None},
+        custom["_id"]: {**compute_pricing(1234.5, services, 10, "fixed", tax_rate, tax_enabled), "hours": None},
+    }
+    assert results == expected
+    # A preview leaves the stored pricing alone
+    assert client.get(f"/api/offers/{hourly['_id']}", headers=admin).json()["pricing"]["basePrice"] == 1000
+
+def test_batch_pricing_persists_what_it_returns(client, admin, offer_payload, categories):
+    offer = _offer(client, admin, offer_payload, categories["hourly"])
+    missing = uuid.uuid4().hex[:24]
+
+    response = client.post("/api/offers/calculate-batch", headers=admin, json={
+        "items": [{"offerId": offer["_id"], "hours": 4}, {"offerId": missing}],
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["missing"] == [missing]
+    assert body["persisted"] == 1
+
+    stored = client.get(f"/api/offers/{offer['_id']}", headers=admin).json()["pricing"]
+    assert stored == body["results"][0]["pricing"]
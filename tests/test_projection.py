@@ -0,0 +1,61 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from utils.projection import parse_fields
+
+def test_parse_fields_builds_an_inclusion_projection():
+    assert parse_fields("offerNumber, customer.email,offerNumber") == {"customer.email": 1, "offerNumber": 1}
+
+@pytest.mark.parametrize("fields", ["", " , ", "customer.", "$where", "pricing..total"])
+def test_parse_fields_rejects_invalid_names(fields):
+    with pytest.raises(ValueError):
+        parse_fields(fields)
+
+@pytest.mark.parametrize("fields", ["searchKeys", "offerNumber,searchKeys.tokens"])
+def test_parse_fields_hides_internal_fields(fields):
+    with pytest.raises(ValueError, match="Unknown fields"):
+        parse_fields(fields)
+
+@pytest.mark.parametrize("fields", ["customer,customer.email", "customer.email,pricing,customer"])
+def test_parse_fields_rejects_overlapping_paths(fields):
+    with pytest.raises(ValueError, match="Overlapping fields"):
+        parse_fields(fields)
+
+def test_parse_fields_allows_sibling_prefixes():
+    assert parse_fields("customer,customerId") == {"customer": 1, "customerId": 1}
+
+def test_overlapping_fields_are_a_bad_request(client, admin):
+    response = client.get("/api/offers", params={"fields": "customer,customer.email"}, headers=admin)
+    assert response.status_code == 400
+
+def test_created_at_is_only_returned_when_requested(client, admin, offer_payload):
+    for _ in range(2):
+        assert client.post("/api/offers", json=offer_payload(), headers=admin).status_code == 200
+
+    page = client.get("/api/offers", params={"fields": "offerNumber", "cursor": "", "limit": 1}, headers=admin).json()
+    assert set(page["items"][0]) == {"_id", "offerNumber"}
+    assert page["next_cursor"]
+
+    page = client.get("/api/offers", params={"fields": "offerNumber,createdAt", "cursor": "", "limit": 1}, headers=admin).json()
+    assert set(page["items"][0]) == {"_id", "offerNumber", "createdAt"}
+
+def test_summary_view_lists_legacy_offers_as_stored(client, admin, db, call):
+    legacy = {
+        "offerNumber": f"legacy-{uuid.uuid4().hex[:8]}",
+        "status": "draft",
+        "category": "umzug",
+        # Written before the customer and location fields were required
+        "customer": {"lastName": "Alt"},
+        "createdAt": datetime(2099, 1, 1),
+    }
+    call(db.offers.insert_one, legacy)
+    try:
+        response = client.get("/api/offers", params={"view": "summary", "limit": 100}, headers=admin)
+    finally:
+        call(db.offers.delete_one, {"_id": legacy["_id"]})
+
+    assert response.status_code == 200
+    rows = {row["offerNumber"]: row for row in response.json()}
+    assert rows[legacy["offerNumber"]]["customer"] == {"lastName": "Alt"}
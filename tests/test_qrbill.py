@@ -0,0 +1,106 @@
+import pytest
+
+from utils.qrbill import (
+    QRBillError, build_payload, creditor_reference, invoice_bill, is_qr_iban, is_valid_qr_reference,
+    mod10_check_digit, normalize_iban, qr_matrix, qr_reference, render_png, render_svg,
+)
+
+# Sample values from the Swiss Payment Standards implementation guidelines
+QR_IBAN = "CH44 3199 9123 0008 8901 2"
+IBAN = "CH93 0076 2011 6238 5295 7"
+QR_REFERENCE = "210000000003139471430009017"
+
+BILL = {
+    "iban": QR_IBAN,
+    "reference": QR_REFERENCE,
+    "creditorName": "Robert Schneider AG",
+    "creditorAddress": "Rue du Lac 1268",
+    "creditorZipCode": "2501",
+    "creditorCity": "Biel",
+    "amount": 1949.75,
+    "debtorName": "Pia-Maria Rutschmann-Schnyder",
+    "debtorAddress": "Grosse Marktgasse 28",
+    "debtorZipCode": "9400",
+    "debtorCity": "Rorschach",
+}
+
+def test_references():
+    assert mod10_check_digit(QR_REFERENCE[:26]) == QR_REFERENCE[26]
+    assert is_valid_qr_reference(QR_REFERENCE)
+    assert not is_valid_qr_reference(QR_REFERENCE[:26] + "0")
+    assert qr_reference("100042") == "00000000000000000000100042" + mod10_check_digit("00000000000000000000100042")
+    assert creditor_reference("539007547034") == "RF18539007547034"
+
+def test_ibans():
+    assert normalize_iban(QR_IBAN) == "CH4431999123000889012"
+    assert is_qr_iban(normalize_iban(QR_IBAN))
+    assert not is_qr_iban(normalize_iban(IBAN))
+    with pytest.raises(QRBillError):
+        normalize_iban("CH44 3199 9123 0008 8901 3")
+    with pytest.raises(QRBillError):
+        normalize_iban("DE89 3704 0044 0532 0130 00")
+
+def test_payload_layout():
+    lines = build_payload(BILL, "Auftrag vom 15.06.2020").split("\r\n")
+
+    assert len(lines) == 31
+    assert lines[:4] == ["SPC", "0200", "1", "CH4431999123000889012"]
+    assert lines[4:11] == ["S", "Robert Schneider AG", "Rue du Lac 1268", "", "2501", "Biel", "CH"]
+    assert lines[18:20] == ["1949.75", "CHF"]
+    assert lines[20:27] == ["S", "Pia-Maria Rutschmann-Schnyder", "Grosse Marktgasse 28", "", "9400", "Rorschach", "CH"]
+    assert lines[27:] == ["QRR", QR_REFERENCE, "Auftrag vom 15.06.2020", "EPD"]
+
+def test_reference_type_follows_the_iban():
+    assert build_payload({**BILL, "iban": IBAN, "reference": None}).split("\r\n")[27] == "NON"
+    assert build_payload({**BILL, "iban": IBAN, "reference": "RF18 5390 0754 7034"}).split("\r\n")[27:29] == ["SCOR", "RF18539007547034"]
+    with pytest.raises(QRBillError):
+        build_payload({**BILL, "reference": None})
+    with pytest.raises(QRBillError):
+        build_payload({**BILL, "iban": IBAN, "reference": QR_REFERENCE})
+    with pytest.raises(QRBillError):
+        build_payload({**BILL, "currency": "USD"})
+
+def test_rendering():
+    payload = build_payload(BILL)
+    size = len(qr_matrix(payload))
+    assert size >= 25
+
+    assert render_png(payload).startswith(b"\x89PNG\r\n\x1a\n")
+    svg = render_svg(payload)
+    assert svg.startswith("<svg")
+    assert f'viewBox="0 0 {size} {size}"' in svg
+
+def test_invoice_bill_fills_in_defaults():
+    settings = {"companyName": "Umzug AG", "addresses": [{"street": "Hauptstrasse 1", "zipCode": "4132", "city": "Muttenz"}]}
+    invoice = {"invoiceNumber": "100042", "total": 1077.0, "currency": "CHF", "qrBill": {"iban": QR_IBAN}}
+
+    bill = invoice_bill(invoice, settings)
+    assert bill["creditorName"] == "Umzug AG"
+    assert bill["creditorCity"] == "Muttenz"
+    assert bill["amount"] == 1077.0
+    assert bill["reference"] == qr_reference("100042")
+    assert invoice_bill({**invoice, "qrBill": None}, settings) is None
+
+def test_qr_code_endpoint_serves_svg_png_and_304(client, admin, company_settings):
+    response = client.post("/api/invoices", headers=admin, json={
+        "offerId": "qr-code-test",
+        "customerId": "qr-code-test",
+        "invoiceDate": "2030-01-31",
+        "dueDate": "2030-03-02",
+        "items": [{"description": "Umzug", "quantity": 1, "unitPrice": 1000, "total": 1000}],
+        "qrBill": {"iban": QR_IBAN, "creditorName": "Umzug AG", "creditorAddress": "Hauptstrasse 1",
+                   "creditorCity": "Muttenz", "creditorZipCode": "4132", "amount": 0},
+    })
+    assert response.status_code == 200, response.text
+    invoice_id = response.json()["_id"]
+
+    svg = client.get(f"/api/invoices/{invoice_id}/qr-code", headers=admin)
+    assert svg.status_code == 200
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+
+    png = client.get(f"/api/invoices/{invoice_id}/qr-code", params={"format": "png"}, headers=admin)
+    assert png.content.startswith(b"\x89PNG")
+    assert png.headers["ETag"] != svg.headers["ETag"]
+
+    cached = client.get(f"/api/invoices/{invoice_id}/qr-code", headers={**admin, "If-None-Match": svg.headers["ETag"]})
+    assert cached.status_code == 304
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.repricing import REPRICE_PHASES, RepricePhase, _reprice_range
+from utils.rollups import ROLLUP_COLLECTION, apply_rollup_change, merge_update, offer_contribution
+
+class _EditBeforeRollup:
+    """Collection where an editor changes a document just before the rollup deltas are summed"""
+
+    def __init__(self, collection, edit):
+        self._collection = collection
+        self._edit = edit
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def aggregate(self, pipeline):
+        cursor = self._collection.aggregate(pipeline)
+        edit, self._edit = self._edit, None
+
+        class EditFirst:
+            async def to_list(self, length):
+                if edit:
+                    await edit()
+                return await cursor.to_list(length)
+
+        return EditFirst()
+
+def _offer_phase() -> RepricePhase:
+    """The offers phase with a UTC rollup day; mongomock can't convert to the rollup timezone"""
+    offers = REPRICE_PHASES[0]
+
+    def rollup_key() -> dict:
+        return {**offers.rollup_key(), "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}}}
+
+    return RepricePhase(offers.collection, offers.match, offers.update, rollup_key, offers.delta)
+
+class _Database:
+    def __init__(self, db, offers):
+        self._db = db
+        self._offers = offers
+
+    def __getitem__(self, name):
+        return self._offers if name == "offers" else self._db[name]
+
+def test_rollups_follow_an_offer_edited_while_it_is_repriced(db, call):
+    day = datetime(1999, 6, 7, 10, 0)
+    after = ObjectId()
+    offer = {
+        "_id": ObjectId(), "category": "umzug", "status": "draft", "createdAt": day,
+        "pricing": {"subtotal": 1000, "discount": 0, "taxRate": 7.7, "includeTax": True, "taxAmount": 77, "total": 1077},
+    }
+    call(db.offers.insert_one, offer)
+    call(apply_rollup_change, db, offer_contribution, None, offer)
+
+    async def accept():
+        update_data = {"status": "accepted"}
+        before = await db.offers.find_one_and_update({"_id": offer["_id"]}, {"$set": update_data})
+        await apply_rollup_change(db, offer_contribution, before, merge_update(before, update_data, {"status": 1}))
+
+    job = {"_id": ObjectId(), "taxRate": 8.1, "taxEnabled": True}
+    racing = _Database(db, _EditBeforeRollup(db.offers, accept))
+    assert call(_reprice_range, racing, _offer_phase(), job, after, offer["_id"]) == 1
+
+    stored = call(db.offers.find_one, {"_id": offer["_id"]})
+    assert stored["status"] == "accepted"
+    assert stored["pricing"]["total"] == 1081
+    assert "repriceDelta" not in stored
+
+    rows = {row["_id"]["status"]: row for row in call(db[ROLLUP_COLLECTION].find({"_id.day": "1999-06-07"}).to_list, None)}
+    assert rows["accepted"]["count"] == 1
+    assert abs(rows["accepted"]["amount"] - 1081) < 0.005
+    assert rows["draft"]["count"] == 0
+    assert abs(rows["draft"]["amount"]) < 0.005
@@ -0,0 +1,46 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import orjson
+import pytest
+from bson import ObjectId
+
+from models.offer import Offer
+from utils.responses import dumps, trusted_response
+
+def test_dumps_handles_mongo_types():
+    object_id = ObjectId()
+    doc = {
+        "_id": object_id,
+        "createdAt": datetime(2030, 5, 17, 9, 30),
+        "invoiceDate": date(2030, 5, 17),
+        "total": Decimal("107.70"),
+        "counts": {1: "one"},
+    }
+    assert orjson.loads(dumps(doc)) == {
+        "_id": str(object_id),
+        "createdAt": "2030-05-17T09:30:00",
+        "invoiceDate": "2030-05-17",
+        "total": 107.7,
+        "counts": {"1": "one"},
+    }
+
+def test_dumps_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+def test_trusted_response_keeps_the_status_code():
+    response = trusted_response([{"_id": ObjectId()}], status_code=201)
+    assert response.status_code == 201
+    assert response.media_type == "application/json"
+
+def test_trusted_rows_match_the_response_model(client, admin, offer_payload):
+    created = client.post("/api/offers", json=offer_payload(), headers=admin)
+    assert created.status_code == 200
+
+    rows = client.get("/api/offers", params={"limit": 100}, headers=admin).json()
+    row = next(row for row in rows if row["_id"] == created.json()["_id"])
+    # The raw document must still satisfy the declared model, minus internal fields
+    assert "searchKeys" not in row
+    assert Offer(**row).dict(by_alias=True)["offerNumber"] == created.json()["offerNumber"]
+    assert row["customer"] == created.json()["customer"]
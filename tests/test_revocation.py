@@ -0,0 +1,59 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from utils.revocation import RevocationList
+
+class _Collection:
+    async def update_one(self, query, update, upsert=False):
+        pass
+
+def test_tokens_issued_right_after_a_revocation_stay_valid():
+    revocations = RevocationList(_Collection())
+    issued_before = time.time()
+    asyncio.run(revocations.revoke_user("anna"))
+    issued_after = time.time()
+
+    assert revocations.is_revoked({"sub": "anna", "iat": issued_before})
+    assert not revocations.is_revoked({"sub": "anna", "iat": issued_after})
+    assert not revocations.is_revoked({"sub": "ben", "iat": issued_before})
+
+def test_demoted_user_can_log_in_again_at_once(client, admin, login):
+    username = f"lead-{uuid.uuid4().hex[:8]}"
+    created = client.post("/api/users", headers=admin, json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "secret123",
+        "name": "Team Lead",
+        "role": "admin",
+    })
+    assert created.status_code == 200, created.text
+    old_headers = login(username, "secret123")
+
+    response = client.put(f"/api/users/{created.json()['id']}", headers=admin, json={"role": "staff"})
+    assert response.status_code == 200
+
+    assert client.get("/api/auth/me", headers=old_headers).status_code == 401
+    new_headers = login(username, "secret123")
+    me = client.get("/api/auth/me", headers=new_headers)
+    assert me.status_code == 200
+    assert me.json()["role"] == "staff"
+
+@pytest.mark.parametrize("stateless", [False, True], ids=["stateful", "stateless"])
+def test_revocations_of_other_workers_apply_in_both_modes(client, db, call, login, monkeypatch, stateless):
+    from datetime import datetime, timedelta
+    from backend.routes import auth
+    from utils.auth import decode_access_token
+
+    monkeypatch.setattr(auth, "STATELESS_AUTH", stateless)
+    headers = login()
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    # Logged out through another worker (or before a restart): only Mongo knows
+    jti = decode_access_token(headers["Authorization"].split()[1])["jti"]
+    call(db.token_revocations.insert_one, {"_id": f"jti:{jti}", "jti": jti, "expiresAt": datetime.utcnow() + timedelta(hours=1)})
+    monkeypatch.setattr(auth.revocations, "_loaded_at", None)
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
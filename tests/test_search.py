@@ -0,0 +1,28 @@
+import uuid
+
+from utils.search import SEARCH_TARGETS, phone_keys, query_terms
+
+def test_phone_keys_cover_both_forms():
+    assert phone_keys("079 123 45 67") == {"0791234567", "41791234567"}
+    assert phone_keys("+41 79 123 45 67") == {"41791234567", "0791234567"}
+    assert phone_keys("0041 79 123 45 67") == {"41791234567", "0791234567"}
+    assert phone_keys(None) == set()
+
+def test_phone_queries_match_either_stored_form():
+    national = set(SEARCH_TARGETS["customers"].keys({"phone": "079 123 45 67"}))
+    international = set(SEARCH_TARGETS["customers"].keys({"phone": "+41 79 123 45 67"}))
+
+    for query in ("+41 79 123", "0041 79 123", "079 123"):
+        term, = query_terms(query)
+        assert any(key.startswith(term) for key in national), query
+        assert any(key.startswith(term) for key in international), query
+
+def test_search_finds_national_numbers_by_international_prefix(client, admin, offer_payload):
+    phone = f"078 {uuid.uuid4().int % 1000:03d} 12 34"
+    customer = {**offer_payload()["customer"], "phone": phone}
+    offer = client.post("/api/offers", json=offer_payload(customer=customer), headers=admin).json()
+
+    for query in ("+41 " + phone[1:], "0041 " + phone[1:], phone):
+        response = client.get("/api/search", params={"q": query, "kind": "offers", "limit": 1}, headers=admin)
+        assert response.status_code == 200, response.text
+        assert [hit["id"] for hit in response.json()["results"]] == [offer["_id"]], query
@@ -0,0 +1,104 @@
+import uuid
+
+import pytest
+from bson import ObjectId
+
+@pytest.fixture
+def staff(client, admin):
+    """A fresh staff account: (id, username, password)"""
+    username = f"staff-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/users", headers=admin, json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "secret123",
+        "name": "Staff Member",
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"], username, "secret123"
+
+@pytest.fixture(params=[False, True], ids=["stateful", "stateless"])
+def auth_mode(request, monkeypatch, server):
+    from backend.routes import auth
+
+    monkeypatch.setattr(auth, "STATELESS_AUTH", request.param)
+    return request.param
+
+def test_deactivation_applies_to_the_next_request(client, admin, login, staff, auth_mode):
+    user_id, username, password = staff
+    headers = login(username, password)
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    response = client.put(f"/api/users/{user_id}", headers=admin, json={"active": False})
+    assert response.status_code == 200
+    assert response.json()["active"] is False
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    response = client.post("/api/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 403
+
+def test_deleted_user_loses_access(client, admin, login, staff, auth_mode):
+    user_id, username, password = staff
+    headers = login(username, password)
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    assert client.delete(f"/api/users/{user_id}", headers=admin).status_code == 200
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_renaming_keeps_sessions(client, admin, login, staff):
+    user_id, username, password = staff
+    headers = login(username, password)
+
+    response = client.put(f"/api/users/{user_id}", headers=admin, json={"name": "Renamed"})
+    assert response.status_code == 200
+
+    me = client.get("/api/auth/me", headers=headers)
+    assert me.status_code == 200
+    assert me.json()["name"] == "Renamed"
+
+def test_user_management_requires_admin(client, login, staff):
+    user_id, username, password = staff
+    headers = login(username, password)
+
+    assert client.get("/api/users", headers=headers).status_code == 403
+    assert client.put(f"/api/users/{user_id}", headers=headers, json={"role": "admin"}).status_code == 403
+
+@pytest.fixture
+def lead(client, admin, login):
+    """A second admin: (id, Authorization header)"""
+    username = f"lead-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/users", headers=admin, json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "secret123",
+        "name": "Team Lead",
+        "role": "admin",
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"], login(username, "secret123")
+
+@pytest.mark.parametrize("change", [{"role": "staff"}, {"active": False}], ids=["demote", "disable"])
+def test_admins_cannot_lock_themselves_out(client, lead, change):
+    lead_id, headers = lead
+
+    response = client.put(f"/api/users/{lead_id}", headers=headers, json=change)
+    assert response.status_code == 400
+    assert client.delete(f"/api/users/{lead_id}", headers=headers).status_code == 400
+    # Other edits of the own account are fine
+    assert client.put(f"/api/users/{lead_id}", headers=headers, json={"name": "Renamed"}).status_code == 200
+
+def test_last_active_admin_is_kept(client, db, call, lead):
+    lead_id, headers = lead
+    others = {"role": "admin", "active": {"$ne": False}, "_id": {"$ne": ObjectId(lead_id)}}
+    other_ids = [user["_id"] for user in call(db.users.find(others, {"_id": 1}).to_list, None)]
+    call(db.users.update_many, {"_id": {"$in": other_ids}}, {"$set": {"active": False}})
+    try:
+        assert client.put(f"/api/users/{lead_id}", headers=headers, json={"role": "staff"}).status_code == 409
+        assert client.delete(f"/api/users/{lead_id}", headers=headers).status_code == 409
+    finally:
+        call(db.users.update_many, {"_id": {"$in": other_ids}}, {"$set": {"active": True}})
+
+def test_another_admin_can_be_demoted(client, admin, lead):
+    lead_id, _ = lead
+    response = client.put(f"/api/users/{lead_id}", headers=admin, json={"role": "staff"})
+    assert response.status_code == 200
+    assert response.json()["role"] == "staff"
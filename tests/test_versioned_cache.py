@@ -0,0 +1,113 @@
+import asyncio
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from utils.versioned_cache import VersionedDocumentCache, etag_matches
+
+ETAG = '"company_settings-v3"'
+
+def test_etag_matches_exact_and_weak_tags():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches(f"W/{ETAG}", ETAG)
+    assert etag_matches(ETAG, f"W/{ETAG}")
+    assert not etag_matches('"company_settings-v2"', ETAG)
+
+def test_etag_matches_lists_and_wildcard():
+    assert etag_matches(f'"a", W/{ETAG} ,"b"', ETAG)
+    assert not etag_matches('"a", "b"', ETAG)
+    assert etag_matches("*", ETAG)
+    assert not etag_matches(None, ETAG)
+    assert not etag_matches(ETAG, None)
+
+class _Stream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.changes.get()
+
+class _Collection:
+    """Collection whose change stream fails a few times before it opens"""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.attempts = 0
+        self.changes = asyncio.Queue()
+
+    def watch(self, pipeline):
+        self.attempts += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return _Stream(self.changes)
+
+    async def find_one(self, query, projection=None):
+        return {"_id": "doc", "version": 1}
+
+def test_watch_reopens_after_errors():
+    async def scenario():
+        collection = _Collection([PyMongoError("connection reset"), OperationFailure("not primary")])
+        cache = VersionedDocumentCache(collection, "doc", poll_interval=0.01)
+        cache.start_watching()
+        try:
+            for _ in range(100):
+                if cache.watching:
+                    break
+                await asyncio.sleep(0.01)
+            assert cache.watching
+            assert collection.attempts == 3
+
+            await cache.get()
+            assert cache.doc is not None
+            collection.changes.put_nowait({"operationType": "update"})
+            await asyncio.sleep(0.01)
+            assert cache.doc is None
+        finally:
+            await cache.stop_watching()
+        assert not cache.watching
+
+    asyncio.run(scenario())
+
+class _RacingCollection:
+    """The first read returns the old document and sees a change event arrive meanwhile"""
+
+    def __init__(self):
+        self.cache = None
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        if self.reads == 1:
+            self.cache.invalidate()
+            return {"_id": "doc", "version": 1}
+        return {"_id": "doc", "version": 2}
+
+def test_load_racing_an_invalidation_is_not_cached():
+    async def scenario():
+        collection = _RacingCollection()
+        cache = collection.cache = VersionedDocumentCache(collection, "doc")
+        cache.watching = True
+
+        assert (await cache.get())["version"] == 2
+        assert cache.version == 2
+        assert collection.reads == 2
+
+    asyncio.run(scenario())
+
+def test_settings_honour_weak_and_listed_etags(client, admin, company_settings):
+    response = client.get("/api/settings/company", headers=admin)
+    etag = response.headers["ETag"]
+
+    for header in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        response = client.get("/api/settings/company", headers={**admin, "If-None-Match": header})
+        assert response.status_code == 304, header
+    response = client.get("/api/settings/company", headers={**admin, "If-None-Match": '"stale"'})
+    assert response.status_code == 200